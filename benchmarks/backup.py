@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Задержка записи планировщика во время резервного копирования.
+
+    python benchmarks/backup.py /tmp/load.db --seconds 10 --rate 200
+
+Писатель вызывает update_server_status с темпом --rate в секунду:
+сначала без копирования, затем пока BackupManager снимает копии подряд.
+База - из benchmarks/synthetic_data.py (копии пишутся во временный каталог).
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from core.backup import BackupManager  # noqa: E402
+from core.database import DatabaseManager  # noqa: E402
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def write_phase(db_manager, server_ids, seconds, rate, background=None):
+    """Записи с постоянным темпом; background() выполняется параллельно до конца фазы"""
+    stop = threading.Event()
+    runs = []
+    if background:
+        def loop():
+            while not stop.is_set():
+                runs.append(background())
+        thread = threading.Thread(target=loop)
+        thread.start()
+    rng = random.Random(1)
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    next_write = time.perf_counter()
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        db_manager.update_server_status(rng.choice(server_ids), 'online',
+                                        {'cpu': rng.uniform(0, 100), 'memory': 50.0, 'disk': 40.0})
+        latencies.append(time.perf_counter() - started)
+        next_write += 1 / rate
+        time.sleep(max(0.0, next_write - time.perf_counter()))
+    stop.set()
+    if background:
+        thread.join()
+    return sorted(latencies), runs
+
+
+def report(name, latencies):
+    ms = [value * 1000 for value in latencies]
+    print(f'{name:16} {len(ms):7d} {statistics.median(ms):9.2f} {percentile(ms, 0.99):9.2f} {ms[-1]:9.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='база из synthetic_data.py')
+    parser.add_argument('--seconds', type=float, default=10.0, help='длительность каждой фазы')
+    parser.add_argument('--rate', type=float, default=100.0, help='записей в секунду')
+    parser.add_argument('--pages', type=int, default=256, help='страниц за шаг копирования')
+    parser.add_argument('--pause', type=float, default=0.02, help='пауза между шагами, с')
+    parser.add_argument('--integrity', choices=('quick', 'full', 'none'), default='quick')
+    args = parser.parse_args()
+
+    # Без deadband и с heartbeat 0: каждый вызов - реальная запись в базу
+    db_manager = DatabaseManager(db_path=args.path, status_heartbeat=0)
+    server_ids = [server.id for server in db_manager.get_public_servers()]
+    if not server_ids:
+        parser.error('В базе нет серверов')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backups = BackupManager(args.path, directory=tmp, keep=1, interval=0,
+                                pages=args.pages, pause=args.pause, integrity=args.integrity)
+        print(f'{"phase":16} {"writes":>7} {"p50 ms":>9} {"p99 ms":>9} {"max ms":>9}')
+        baseline, _ = write_phase(db_manager, server_ids, args.seconds, args.rate)
+        report('baseline', baseline)
+        during, runs = write_phase(db_manager, server_ids, args.seconds, args.rate, backups.run)
+        report('during backup', during)
+
+    done = [run for run in runs if run.get('success')]
+    if done:
+        print(f'копий: {len(done)}, {done[-1]["size"] / 1024 ** 2:.1f} МБ, {done[-1]["steps"]} шагов, '
+              f'{statistics.median(run["duration"] for run in done):.2f} с на копию, проверка: {done[-1]["integrity"]}')
+    for run in runs:
+        if not run.get('success'):
+            print(f'❌ {run["error"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк сборщика: SSHMonitor и MonitorScheduler против локального
+парка поддельных SSH-серверов (benchmarks/fake_ssh.py, отдельный процесс,
+чтобы его CPU не попадал в замер).
+
+    python benchmarks/collector.py --hosts 50 --sweeps 3 --handshake-latency 0.05
+
+Отчет: время прохода, рукопожатий в секунду, CPU сборщика на хост,
+записей в базу в секунду, задержки get_metrics по перцентилям.
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'src'))
+
+from core.database import DatabaseManager  # noqa: E402
+from core.instrumentation import telemetry  # noqa: E402
+from core.monitor_scheduler import MonitorScheduler  # noqa: E402
+from core.rate_limiter import ConnectionLimiter  # noqa: E402
+from core.ssh_monitor import SSHMonitor  # noqa: E402
+from fake_ssh import USERNAME, PASSWORD, build_parser as fleet_parser  # noqa: E402
+
+DB_WRITES = ('db.insert', 'db.update', 'db.replace')
+
+
+def start_fleet(args):
+    command = [sys.executable, os.path.join(BENCH_DIR, 'fake_ssh.py'),
+               '--hosts', str(args.hosts),
+               '--handshake-latency', str(args.handshake_latency),
+               '--command-latency', str(args.command_latency),
+               '--failure-rate', str(args.failure_rate)]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    ports = json.loads(process.stdout.readline())['ports']
+    return process, ports
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def db_writes():
+    timings = telemetry.snapshot()['timings']
+    return sum(timings.get(name, {}).get('count', 0) for name in DB_WRITES)
+
+
+def bench_monitor(ssh_monitor, ports, calls):
+    """Последовательные get_metrics: задержка одной проверки без конкуренции"""
+    latencies = []
+    errors = 0
+    for i in range(calls):
+        started = time.perf_counter()
+        result = ssh_monitor.get_metrics('127.0.0.1', ports[i % len(ports)], USERNAME, PASSWORD)
+        latencies.append(time.perf_counter() - started)
+        errors += 'error' in result
+    return latencies, errors
+
+
+def bench_sweeps(scheduler, sweeps):
+    results = []
+    for _ in range(sweeps):
+        handshakes = scheduler.ssh_monitor.limiter.get_stats()['handshakes']
+        writes = db_writes()
+        cpu = time.process_time()
+        started = time.perf_counter()
+        scheduler._check_all_servers()
+        wall = time.perf_counter() - started
+        results.append({
+            'wall': wall,
+            'cpu': time.process_time() - cpu,
+            'handshakes': scheduler.ssh_monitor.limiter.get_stats()['handshakes'] - handshakes,
+            'writes': db_writes() - writes
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, parents=[fleet_parser()], add_help=False,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sweeps', type=int, default=3)
+    parser.add_argument('--monitor-calls', type=int, default=20, help='последовательных get_metrics')
+    parser.add_argument('--workers', type=int, default=16, help='потоков планировщика')
+    parser.add_argument('--connect-rate', type=float, default=200.0, help='рукопожатий в секунду (ConnectionLimiter)')
+    parser.add_argument('--max-sessions', type=int, default=64)
+    parser.add_argument('--storage', choices=('rows', 'blocks'), default='rows')
+    parser.add_argument('--json', action='store_true', help='отчет одной строкой JSON')
+    args = parser.parse_args()
+    # Ожидаемые отказы (--failure-rate) не засоряют отчет трассировками
+    logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+    logging.getLogger('scheduler').setLevel(logging.ERROR)
+
+    fleet, ports = start_fleet(args)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_manager = DatabaseManager(series_format=args.storage, db_path=os.path.join(tmp, 'bench.db'))
+            db_manager.add_servers([{
+                'name': f'bench-{i}', 'ip': '127.0.0.1', 'port': port, 'username': USERNAME,
+                'password': PASSWORD, 'ssh_key_path': '', 'ssh_key_content': '', 'description': '',
+                'jump_host': None
+            } for i, port in enumerate(ports)])
+            limiter = ConnectionLimiter(connect_rate=args.connect_rate, max_sessions=args.max_sessions)
+            ssh_monitor = SSHMonitor(limiter=limiter)
+            scheduler = MonitorScheduler(db_manager, ssh_monitor, max_workers=args.workers)
+
+            latencies, errors = bench_monitor(ssh_monitor, ports, args.monitor_calls)
+            sweeps = bench_sweeps(scheduler, args.sweeps)
+    finally:
+        fleet.stdin.close()
+        fleet.wait(timeout=10)
+
+    walls = [s['wall'] for s in sweeps]
+    report = {
+        'hosts': args.hosts,
+        'workers': args.workers,
+        'get_metrics_p50_ms': round(percentile(latencies, 0.5) * 1000, 1),
+        'get_metrics_p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        'get_metrics_errors': errors,
+        'sweep_wall_median_s': round(statistics.median(walls), 3),
+        'sweep_wall_max_s': round(max(walls), 3),
+        'handshakes_per_s': round(sum(s['handshakes'] for s in sweeps) / sum(walls), 1),
+        'cpu_ms_per_host': round(sum(s['cpu'] for s in sweeps) / (args.hosts * len(sweeps)) * 1000, 2),
+        'db_writes_per_s': round(sum(s['writes'] for s in sweeps) / sum(walls), 1),
+        'outcomes': {name: value for name, value in telemetry.snapshot()['counters'].items()
+                     if name.startswith('scheduler.result.')}
+    }
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+    else:
+        for key, value in report.items():
+            print(f'{key:22} {value}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Локальный парк поддельных SSH-серверов для бенчмарков сборщика.
+
+Каждый сервер - paramiko ServerInterface на 127.0.0.1 со своим портом,
+настраиваемыми задержками рукопожатия и команд, долей отказов и
+заготовленным выводом команд, которые выполняет SSHMonitor.
+
+    python benchmarks/fake_ssh.py --hosts 50 --handshake-latency 0.05
+
+Печатает одну строку JSON {"ports": [...]} и работает до Ctrl+C / закрытия stdin.
+"""
+import argparse
+import json
+import logging
+import random
+import socket
+import sys
+import threading
+import time
+
+import paramiko
+
+USERNAME = 'bench'
+PASSWORD = 'bench'
+
+
+def canned_output(command, rng):
+    """Вывод конвейеров SSHMonitor (как после awk/cut на настоящем хосте)"""
+    if 'Cpu(s)' in command:
+        return f'{rng.uniform(1, 99):.1f}\n'
+    if '/proc/stat' in command:
+        return f'{rng.uniform(1, 99):.4f}\n'
+    if 'free' in command:
+        return f'{rng.uniform(10, 95):.1f}\n'
+    if '/proc/net/dev' in command:
+        return (
+            'Filesystem     Type 1024-blocks     Used Available Capacity Mounted on\n'
+            f'/dev/vda1      ext4    41152736 {rng.randint(2, 38) * 1000000} 20000000      {rng.randint(5, 95)}% /\n'
+            f'/dev/vdb1      xfs    104806400 {rng.randint(2, 98) * 1000000} 50000000      {rng.randint(5, 95)}% /var/lib/data\n'
+            'tmpfs          tmpfs     403028     1124    401904       1% /run\n'
+            '@@\n'
+            'Inter-|   Receive                                                |  Transmit\n'
+            ' face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed\n'
+            '    lo: 1000 10 0 0 0 0 0 0 1000 10 0 0 0 0 0 0\n'
+            f'  eth0: {int(time.time() * 125000)} 900 0 0 0 0 0 0 {int(time.time() * 25000)} 800 0 0 0 0 0 0\n'
+        )
+    if 'df ' in command:
+        return f'{rng.randint(5, 95)}\n'
+    if command.startswith('uname'):
+        return 'Linux bench 6.1.0-fake #1 SMP x86_64 GNU/Linux\n'
+    if command.startswith('uptime'):
+        return ' 12:00:00 up 42 days,  3:14,  1 user,  load average: 0.42, 0.37, 0.30\n'
+    if command.startswith('echo'):
+        return command.split(' ', 1)[1].strip('"') + '\n'
+    return ''
+
+
+class FakeServer(paramiko.ServerInterface):
+    def __init__(self, options, rng):
+        self.options = options
+        self.rng = rng
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        if username == USERNAME and password == PASSWORD:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        command = command.decode('utf-8', 'replace')
+        threading.Thread(target=self._exec, args=(channel, command), daemon=True).start()
+        return True
+
+    def _exec(self, channel, command):
+        try:
+            if self.options.command_latency:
+                time.sleep(self.options.command_latency)
+            channel.sendall(canned_output(command, self.rng).encode())
+            channel.send_exit_status(0)
+        finally:
+            channel.close()
+
+
+class FakeHost:
+    """Один поддельный хост: слушающий сокет и поток приема подключений"""
+
+    def __init__(self, host_key, options, seed):
+        self.host_key = host_key
+        self.options = options
+        self.rng = random.Random(seed)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(128)
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                client, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(client,), daemon=True).start()
+
+    def _handle(self, client):
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # как у sshd
+        if self.rng.random() < self.options.failure_rate:
+            client.close()  # обрыв до баннера: SSHException на стороне сборщика
+            return
+        if self.options.handshake_latency:
+            time.sleep(self.options.handshake_latency)
+        transport = paramiko.Transport(client)
+        transport.add_server_key(self.host_key)
+        try:
+            transport.start_server(server=FakeServer(self.options, self.rng))
+        except (paramiko.SSHException, EOFError, OSError):
+            transport.close()
+
+
+def start_fleet(options):
+    host_key = paramiko.RSAKey.generate(2048)
+    return [FakeHost(host_key, options, seed=i) for i in range(options.hosts)]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hosts', type=int, default=20)
+    parser.add_argument('--handshake-latency', type=float, default=0.0, help='задержка перед рукопожатием, с')
+    parser.add_argument('--command-latency', type=float, default=0.0, help='задержка выполнения команды, с')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='доля подключений, обрываемых сразу')
+    return parser
+
+
+def main():
+    options = build_parser().parse_args()
+    logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+    fleet = start_fleet(options)
+    print(json.dumps({'ports': [host.port for host in fleet]}), flush=True)
+    # Живем, пока родительский процесс не закроет stdin
+    sys.stdin.read()
+
+
+if __name__ == '__main__':
+    main()
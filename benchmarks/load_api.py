@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный прогон API в процессе (Flask test client, без сети) по базе
+из benchmarks/synthetic_data.py.
+
+    python benchmarks/load_api.py /tmp/load.db --requests 2000 --concurrency 8
+
+Для каждого эндпоинта: запросов в секунду и задержки p50/p90/p99/max.
+Серверы выбираются случайно по всему парку, чтобы не мерить только кэш.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+ENDPOINTS = {
+    'servers_list': lambda sid: '/api/servers',
+    'server_status': lambda sid: f'/api/servers/{sid}/status',
+    'server_metrics': lambda sid: f'/api/servers/{sid}/metrics?limit=100',
+    'server_detail': lambda sid: f'/servers/{sid}',
+    'servers_page': lambda sid: '/servers',
+}
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_endpoint(app, path_for, server_ids, requests, concurrency, seed):
+    """requests запросов в concurrency потоках; у каждого потока свой клиент"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    per_thread = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+
+    def worker(count, rng):
+        client = app.test_client()
+        local = []
+        failed = 0
+        for _ in range(count):
+            path = path_for(rng.choice(server_ids))
+            started = time.perf_counter()
+            response = client.get(path)
+            response.get_data()
+            local.append(time.perf_counter() - started)
+            failed += response.status_code >= 400
+        with lock:
+            latencies.extend(local)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=worker, args=(count, random.Random(seed + i)))
+               for i, count in enumerate(per_thread)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, sorted(latencies), sum(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='база из synthetic_data.py')
+    parser.add_argument('--requests', type=int, default=1000, help='запросов на эндпоинт')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--warmup', type=int, default=20, help='прогревочных запросов на эндпоинт')
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help='список через запятую')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    from app import create_app
+
+    with sqlite3.connect(args.path) as conn:
+        server_ids = [row[0] for row in conn.execute('SELECT id FROM servers')]
+    if not server_ids:
+        parser.error('В базе нет серверов')
+    app = create_app({'DATABASE_PATH': args.path, 'METRICS_STORAGE': _storage(args.path),
+                      'ADMIN_USER': {'username': 'load', 'password': 'load'}})
+
+    print(f'{len(server_ids)} серверов, {args.requests} запросов на эндпоинт, {args.concurrency} потоков')
+    print(f'{"endpoint":16} {"rps":>9} {"p50 ms":>9} {"p90 ms":>9} {"p99 ms":>9} {"max ms":>9} {"errors":>7}')
+    for name in args.endpoints.split(','):
+        path_for = ENDPOINTS[name]
+        run_endpoint(app, path_for, server_ids, args.warmup, 1, args.seed)
+        elapsed, latencies, errors = run_endpoint(app, path_for, server_ids, args.requests,
+                                                  args.concurrency, args.seed)
+        ms = [value * 1000 for value in latencies]
+        print(f'{name:16} {len(ms) / elapsed:9.1f} {statistics.median(ms):9.2f} {percentile(ms, 0.9):9.2f} '
+              f'{percentile(ms, 0.99):9.2f} {ms[-1]:9.2f} {errors:7d}')
+
+
+def _storage(path):
+    """Формат хранения по содержимому базы"""
+    with sqlite3.connect(path) as conn:
+        has_blocks = conn.execute('SELECT 1 FROM metric_blocks LIMIT 1').fetchone()
+    return 'blocks' if has_blocks else 'rows'
+
+
+if __name__ == '__main__':
+    main()
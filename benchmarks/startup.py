@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Замер холодного старта приложения: импорт src/app.py, create_app()
+и первый запрос, каждый прогон в отдельном интерпретаторе.
+
+    python benchmarks/startup.py --runs 10 --max-import-ms 400
+
+Код возврата 1, если медиана импорта превышает бюджет или импорт
+имеет побочные эффекты (тяжелые модули, поток планировщика).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+PROBE = '''
+import json, sys, threading, time
+sys.path.insert(0, {src!r})
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+heavy = [name for name in ('paramiko', 'psutil') if name in sys.modules]
+threads = threading.active_count()
+application = app.create_app({{'DATABASE_PATH': {db!r}, 'ADMIN_USER': {{'username': 'a', 'password': 'a'}}}})
+created = time.perf_counter()
+application.test_client().get('/servers')
+served = time.perf_counter()
+print(json.dumps({{
+    'import': imported - started,
+    'create_app': created - imported,
+    'first_request': served - created,
+    'heavy_modules': heavy,
+    'threads_after_import': threads,
+}}))
+'''
+
+
+def run_once(db_path):
+    code = PROBE.format(src=SRC, db=db_path)
+    output = subprocess.run([sys.executable, '-c', code], check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--max-import-ms', type=float, default=None, help='бюджет медианы импорта, мс')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'startup.db')
+        run_once(db_path)  # первый прогон создает схему и прогревает кэш ФС
+        results = [run_once(db_path) for _ in range(args.runs)]
+
+    failed = False
+    for key in ('import', 'create_app', 'first_request'):
+        values = [r[key] * 1000 for r in results]
+        print(f'{key:14} median {statistics.median(values):8.1f} ms   max {max(values):8.1f} ms')
+
+    heavy = sorted({name for r in results for name in r['heavy_modules']})
+    if heavy:
+        print(f'❌ При импорте загружены тяжелые модули: {", ".join(heavy)}')
+        failed = True
+    if any(r['threads_after_import'] > 1 for r in results):
+        print('❌ Импорт запускает потоки (планировщик должен стартовать явно)')
+        failed = True
+    median_import = statistics.median(r['import'] for r in results) * 1000
+    if args.max_import_ms is not None and median_import > args.max_import_ms:
+        print(f'❌ Медиана импорта {median_import:.1f} ms больше бюджета {args.max_import_ms:.1f} ms')
+        failed = True
+    if not failed:
+        print('✅ Старт без побочных эффектов')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
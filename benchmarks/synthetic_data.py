@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Генератор синтетической базы: парк серверов и длинная история метрик
+в отдельном файле monitoring.db для нагрузочных тестов.
+
+    python benchmarks/synthetic_data.py /tmp/load.db --servers 10000 --samples 10000
+
+История строится суточной синусоидой с шумом и редкими всплесками,
+с интервалом --step секунд, заканчивается текущим моментом.
+10000 x 10000 = 100M строк; загрузка идет пачками по --batch строк.
+"""
+import argparse
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from core.database import DatabaseManager  # noqa: E402
+from core.metrics_buffer import format_timestamp  # noqa: E402
+
+ROLES = ('web', 'db', 'cache', 'queue', 'batch', 'edge')
+STATUS_WEIGHTS = (('online', 90), ('warning', 6), ('offline', 4))
+
+
+def make_servers(count, rng):
+    statuses = [status for status, weight in STATUS_WEIGHTS for _ in range(weight)]
+    for i in range(count):
+        role = ROLES[i % len(ROLES)]
+        yield {
+            'name': f'{role}-{i:05d}',
+            'ip': f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}',
+            'port': 22,
+            'username': 'monitor',
+            'password': None,
+            'ssh_key_path': '/etc/monitoring/id_ed25519',
+            'ssh_key_content': '',
+            'description': f'Синтетический {role}-сервер',
+            'jump_host': None,
+            'status': rng.choice(statuses)
+        }
+
+
+def server_series(rng, samples, step, end):
+    """Ряд (ts, cpu, memory, disk): суточный цикл CPU, медленный дрейф памяти и диска"""
+    base_cpu = rng.uniform(5, 50)
+    memory = rng.uniform(20, 80)
+    disk = rng.uniform(10, 85)
+    phase = rng.uniform(0, 2 * math.pi)
+    start = end - (samples - 1) * step
+    for k in range(samples):
+        ts = start + k * step
+        cpu = base_cpu * (1 + 0.5 * math.sin(2 * math.pi * ts / 86400 + phase)) + rng.gauss(0, 3)
+        if rng.random() < 0.002:
+            cpu += rng.uniform(30, 60)
+        memory = min(99.0, max(5.0, memory + rng.gauss(0, 0.3)))
+        disk = min(99.0, disk + rng.uniform(0, 0.002))
+        yield ts, round(min(100.0, max(0.0, cpu)), 1), round(memory, 1), round(disk, 1)
+
+
+def load(path, servers, samples, step, storage, batch, seed):
+    rng = random.Random(seed)
+    db_manager = DatabaseManager(series_format=storage, db_path=path)
+    added = db_manager.add_servers(list(make_servers(servers, rng)))
+    end = int(time.time()) // step * step
+
+    conn = sqlite3.connect(path)
+    # Одноразовая загрузка: без fsync (база уже в режиме WAL); индекс строится после данных
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('DROP INDEX IF EXISTS idx_metrics_server_time')
+    server_ids = [row[0] for row in conn.execute('SELECT id FROM servers ORDER BY id DESC LIMIT ?', (added,))]
+    started = time.perf_counter()
+    written = 0
+    pending = []
+    for n, server_id in enumerate(sorted(server_ids), start=1):
+        series = server_series(rng, samples, step, end)
+        if storage == 'blocks':
+            db_manager.series.write_blocks(conn, server_id, list(series))
+            written += samples
+        else:
+            for ts, cpu, memory, disk in series:
+                pending.append((server_id, cpu, memory, disk, format_timestamp(ts)))
+                if len(pending) >= batch:
+                    conn.executemany('INSERT INTO metrics (server_id, cpu_percent, memory_percent, disk_percent, timestamp) '
+                                     'VALUES (?, ?, ?, ?, ?)', pending)
+                    written += len(pending)
+                    pending = []
+        conn.execute('UPDATE servers SET last_check = ? WHERE id = ?', (format_timestamp(end), server_id))
+        if n % 100 == 0 or n == len(server_ids):
+            conn.commit()
+            rate = (written + len(pending)) / max(time.perf_counter() - started, 1e-9)
+            print(f'\r{n}/{len(server_ids)} серверов, {written + len(pending):,} замеров, {rate:,.0f}/с',
+                  end='', flush=True)
+    if pending:
+        conn.executemany('INSERT INTO metrics (server_id, cpu_percent, memory_percent, disk_percent, timestamp) '
+                         'VALUES (?, ?, ?, ?, ?)', pending)
+        written += len(pending)
+    print('\nПостроение индекса...', flush=True)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_metrics_server_time ON metrics (server_id, timestamp)')
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+    return added, written, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='файл базы (будет создан)')
+    parser.add_argument('--servers', type=int, default=1000)
+    parser.add_argument('--samples', type=int, default=1000, help='замеров на сервер')
+    parser.add_argument('--step', type=int, default=60, help='интервал замеров, с')
+    parser.add_argument('--storage', choices=('rows', 'blocks'), default='rows')
+    parser.add_argument('--batch', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--force', action='store_true', help='перезаписать существующий файл')
+    args = parser.parse_args()
+
+    if os.path.exists(args.path):
+        if not args.force:
+            parser.error(f'{args.path} уже существует (--force для перезаписи)')
+        os.remove(args.path)
+    servers, samples, elapsed = load(args.path, args.servers, args.samples, args.step,
+                                     args.storage, args.batch, args.seed)
+    size = os.path.getsize(args.path) / 1024 ** 2
+    print(f'✅ {servers} серверов, {samples:,} замеров за {elapsed:.1f} с, {size:,.1f} МБ: {args.path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -135,11 +135,11 @@ def run_application(python_exe=None):
 import sys
 import os
 sys.path.insert(0, '{src_path}')
-from app import app, scheduler
+from app import create_app, start_monitoring
 
+app = create_app()
 # Запускаем планировщик с интервалом 60 секунд
-scheduler.start(interval=60)
-print("🔄 Автоматический мониторинг запущен (интервал: 60 секунд)")
+start_monitoring(app)
 
 app.run(host='127.0.0.1', port={port}, debug=True)
 """
@@ -153,11 +153,11 @@ app.run(host='127.0.0.1', port={port}, debug=True)
                     os.remove('temp_run_app.py')
         else:
             # Запускаем в текущем окружении
-            from app import app, scheduler
+            from app import create_app, start_monitoring
             
+            app = create_app()
             # Запускаем планировщик с интервалом 60 секунд
-            scheduler.start(interval=60)
-            print("🔄 Автоматический мониторинг запущен (интервал: 60 секунд)")
+            start_monitoring(app)
             
             app.run(host='127.0.0.1', port=port, debug=True)
             
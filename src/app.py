@@ -1,49 +1,96 @@
 """
 Основное приложение системы мониторинга.
 """
-from flask import Flask, render_template, jsonify, request, redirect, url_for, session, flash
+from flask import Flask, Response, current_app, g, render_template, send_file, jsonify, request, redirect, url_for, session, flash
 import os
 import sys
+import time
 import logging
+from markupsafe import Markup
 from datetime import datetime
 
+from werkzeug.local import LocalProxy
+
 # Добавляем src в путь для импортов
 sys.path.append(os.path.dirname(__file__))
 
 from core.system_monitor import SystemMonitor
-from core.database import DatabaseManager
+from core.database import DatabaseManager, metrics_cursor
+from core.deadband import MAX_FILL_POINTS, DeadbandFilter
 from core.ssh_monitor import SSHMonitor
 from core.monitor_scheduler import MonitorScheduler
+from core.server_import import ImportFormatError, parse_servers, validate_server_rows, verify_servers
+from core.export import EXPORT_FORMATS, export_chunks, gzip_chunks
+from core.prometheus import CONTENT_TYPE as PROMETHEUS_CONTENT_TYPE, ExpositionCache
+from core.instrumentation import telemetry
+from core.alerts import validate_rule
+from core.adaptive import AdaptiveSampler
+from core.rollups import ROLLUP_METRICS
+from core.labelled_series import LABELLED_METRICS
+from core.backup import BackupManager
+from core.query_cache import QueryCache
+from core.fragments import FragmentCache
+from core.profiling import PROFILE_MODES, PROFILE_TARGETS, profiler
+
+# Маршруты собираются при импорте и регистрируются в create_app()
+_routes = []
+
+def route(rule, **options):
+    """Аналог app.route для функций модуля: регистрация откладывается до create_app()"""
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
+
+
+class MonitoringComponents:
+    """Компоненты одного экземпляра приложения"""
+    
+    def __init__(self, config):
+        self.system_monitor = SystemMonitor(
+            partitions_ttl=config['SYSTEM_PARTITIONS_TTL'],
+            disk_timeout=config['SYSTEM_DISK_TIMEOUT'],
+            exclude_fstypes=config['SYSTEM_DISK_EXCLUDE']
+        )
+        self.db_manager = DatabaseManager(
+            series_format=config['METRICS_STORAGE'],
+            # METRICS_DEADBAND=0 отключает фильтр и пишет каждый замер
+            deadband=DeadbandFilter() if config['METRICS_DEADBAND'] else None,
+            db_path=config['DATABASE_PATH'],
+            query_cache=QueryCache(config['QUERY_CACHE_ENTRIES'], config['QUERY_CACHE_ROWS'])
+        )
+        self.ssh_monitor = SSHMonitor()
+        self.backups = BackupManager(
+            self.db_manager.db_path,
+            directory=config['BACKUP_DIR'],
+            keep=config['BACKUP_KEEP'],
+            interval=config['BACKUP_INTERVAL']
+        )
+        self.scheduler = MonitorScheduler(
+            self.db_manager, self.ssh_monitor, backups=self.backups,
+            interval=config['MONITORING_INTERVAL'],
+            adaptive=AdaptiveSampler(
+                enabled=config['ADAPTIVE_SAMPLING'],
+                min_factor=config['ADAPTIVE_MIN_FACTOR'],
+                max_factor=config['ADAPTIVE_MAX_FACTOR'],
+                budget=config['ADAPTIVE_BUDGET']
+            )
+        )
+        self.exposition_cache = ExpositionCache()
+        self.fragments = FragmentCache(config['FRAGMENT_CACHE_ENTRIES'])
 
-# Создание Flask приложения
-app = Flask(__name__, 
-            template_folder='../templates',
-            static_folder='../static')
-
-app.config['SECRET_KEY'] = 'monitoring-secret-key-2024'
-app.config['JSON_AS_ASCII'] = False
-
-# Инициализация компонентов
-system_monitor = SystemMonitor()
-db_manager = DatabaseManager()
-ssh_monitor = SSHMonitor()
-scheduler = MonitorScheduler(db_manager, ssh_monitor)
-
-# Автозапуск планировщика при инициализации (только при первом запуске)
-_monitoring_initialized = False
 
-def init_monitoring():
-    """Инициализация автоматического мониторинга"""
-    global _monitoring_initialized
-    
-    # Запускаем только при первой инициализации, не при hot reload
-    if not _monitoring_initialized and not scheduler.running:
-        scheduler.start(interval=60)
-        print("🔄 Автоматический мониторинг инициализирован (интервал: 60 секунд)")
-        _monitoring_initialized = True
+def _component(name):
+    return LocalProxy(lambda: getattr(current_app.extensions['monitoring'], name))
 
-# Запускаем инициализацию
-init_monitoring()
+# Компоненты текущего приложения (внутри запроса)
+system_monitor = _component('system_monitor')
+db_manager = _component('db_manager')
+ssh_monitor = _component('ssh_monitor')
+scheduler = _component('scheduler')
+exposition_cache = _component('exposition_cache')
+backups = _component('backups')
+fragments = _component('fragments')
 
 # Функция для загрузки админских данных
 def load_admin_credentials():
@@ -73,15 +120,22 @@ def load_admin_credentials():
         logging.error(f"Ошибка чтения файла учетных данных: {e}")
         return {'username': 'admin', 'password': 'admin123'}
 
-# Загружаем админские данные
-ADMIN_USER = load_admin_credentials()
+def _profile_request_start():
+    """Профилирование следующих N запросов, если оно включено из админки"""
+    if profiler.is_armed('requests') and not request.path.startswith('/admin/profiling'):
+        g.profile_token = profiler.begin('requests')
+
+def _profile_request_end(exc):
+    token = g.pop('profile_token', None)
+    if token is not None:
+        profiler.end(token)
 
-@app.route('/')
+@route('/')
 def index():
     """Главная страница"""
     return render_template('index.html')
 
-@app.route('/system')
+@route('/system')
 def system_status():
     """Системный мониторинг"""
     try:
@@ -90,36 +144,56 @@ def system_status():
     except Exception as e:
         return render_template('error.html', error=str(e))
 
-@app.route('/servers')
+def _server_cards(template, servers, details=None):
+    """
+    Карточки серверов из кэша фрагментов. Карточка перерисовывается, только
+    если изменилась версия строки сервера, время последней проверки (heartbeat
+    версию не меняет) или details (данные карточки помимо строки сервера, хешируемые).
+    """
+    details = details or {}
+    card_template = current_app.jinja_env.get_template(template)
+    cards = []
+    for server in servers:
+        extra = details.get(server.id)
+        cards.append(fragments.render(template, server.id, (server.version, server.last_check, extra),
+                                      lambda: Markup(card_template.render(server=server, details=extra))))
+    return cards
+
+@route('/servers')
 def servers():
     """Публичная страница серверов (только просмотр)"""
     try:
-        servers = db_manager.get_all_servers()
-        return render_template('servers_public.html', servers=servers)
+        servers = db_manager.get_public_servers()
+        anomalies = db_manager.get_anomalies()
+        details = {server_id: tuple((row['metric'], row['value'], row['baseline']) for row in rows)
+                   for server_id, rows in anomalies.items()}
+        return render_template('servers_public.html', servers=servers, anomalies=anomalies,
+                               cards=_server_cards('server_card_public.html', servers, details))
     except Exception as e:
         return render_template('error.html', error=str(e))
 
-@app.route('/admin/servers')
+@route('/admin/servers')
 def admin_servers():
     """Административная страница серверов (полное управление)"""
     if 'admin' not in session:
         return redirect(url_for('admin'))
     
     try:
-        servers = db_manager.get_all_servers()
-        return render_template('admin_servers.html', servers=servers)
+        servers = db_manager.get_public_servers()
+        return render_template('admin_servers.html', servers=servers,
+                               cards=_server_cards('server_card_admin.html', servers))
     except Exception as e:
         return render_template('error.html', error=str(e))
 
-@app.route('/admin')
+@route('/admin')
 def admin():
     """Главная страница админки (дашборд)"""
     if 'admin' in session:
-        servers = db_manager.get_all_servers()
-        return render_template('admin.html', servers=servers)
+        servers = db_manager.get_public_servers()
+        return render_template('admin.html', servers=servers, anomalies=db_manager.get_anomalies())
     return render_template('login.html')
 
-@app.route('/admin/login', methods=['GET', 'POST'])
+@route('/admin/login', methods=['GET', 'POST'])
 def admin_login():
     """Вход в админку"""
     if request.method == 'GET':
@@ -130,20 +204,20 @@ def admin_login():
     username = request.form.get('username')
     password = request.form.get('password')
     
-    if username == ADMIN_USER['username'] and password == ADMIN_USER['password']:
+    if username == current_app.config['ADMIN_USER']['username'] and password == current_app.config['ADMIN_USER']['password']:
         session['admin'] = True
         return redirect(url_for('admin'))
     
     flash('Неверные данные', 'error')
     return redirect(url_for('admin_login'))
 
-@app.route('/admin/logout')
+@route('/admin/logout')
 def admin_logout():
     """Выход из админки"""
     session.pop('admin', None)
     return redirect(url_for('index'))
 
-@app.route('/admin/servers/add', methods=['GET', 'POST'])
+@route('/admin/servers/add', methods=['GET', 'POST'])
 def admin_add_server():
     """Добавление сервера"""
     if 'admin' not in session:
@@ -155,6 +229,7 @@ def admin_add_server():
             'ip': request.form.get('ip'),
             'port': int(request.form.get('port', 22)),
             'username': request.form.get('username', 'root'),
+            'jump_host': request.form.get('jump_host') or None,
             'description': request.form.get('description', '')
         }
         
@@ -178,7 +253,76 @@ def admin_add_server():
     
     return render_template('add_server.html')
 
-@app.route('/admin/servers/<int:server_id>/edit', methods=['GET', 'POST'])
+def _import_servers(text, fmt, verify=False):
+    """Разбор, проверка и запись импортируемых серверов одной транзакцией"""
+    servers, errors = validate_server_rows(parse_servers(text, fmt), db_manager.get_public_servers())
+    result = {'imported': 0, 'errors': errors, 'verification': []}
+    if errors or not servers:
+        return result
+    
+    if verify:
+        checks = verify_servers(ssh_monitor, servers)
+        for server, check in zip(servers, checks):
+            server['status'] = 'online' if check['success'] else 'offline'
+            result['verification'].append({
+                'name': server['name'],
+                'ip': server['ip'],
+                'success': check['success'],
+                'error': check.get('error')
+            })
+    
+    result['imported'] = db_manager.add_servers(servers)
+    return result
+
+@route('/admin/servers/import', methods=['GET', 'POST'])
+def admin_import_servers():
+    """Массовый импорт серверов из CSV/JSON"""
+    if 'admin' not in session:
+        return redirect(url_for('admin'))
+    
+    result = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        try:
+            if upload and upload.filename:
+                fmt = 'json' if upload.filename.lower().endswith('.json') else 'csv'
+                try:
+                    text = upload.read().decode('utf-8-sig')
+                except UnicodeDecodeError:
+                    raise ImportFormatError('Файл должен быть в кодировке UTF-8')
+            else:
+                text = request.form.get('data', '')
+                fmt = 'json' if text.lstrip().startswith(('[', '{')) else 'csv'
+            fmt = request.form.get('format') or fmt
+            
+            result = _import_servers(text, fmt, verify=bool(request.form.get('verify')))
+            if result['imported']:
+                flash(f"Импортировано серверов: {result['imported']}", 'success')
+            else:
+                flash('Серверы не импортированы: исправьте ошибки в данных', 'error')
+        except ImportFormatError as e:
+            flash(f'Ошибка: {e}', 'error')
+    
+    return render_template('import_servers.html', result=result)
+
+@route('/api/servers/import', methods=['POST'])
+def api_import_servers():
+    """API массового импорта: JSON-список или CSV (Content-Type: text/csv)"""
+    if 'admin' not in session:
+        return jsonify({'error': 'Не авторизован'}), 401
+    
+    fmt = 'csv' if request.mimetype == 'text/csv' or request.args.get('format') == 'csv' else 'json'
+    verify = request.args.get('verify', '').lower() in ('1', 'true', 'yes')
+    try:
+        result = _import_servers(request.get_data(as_text=True), fmt, verify)
+    except ImportFormatError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify(result), 400 if result['errors'] else 200
+
+@route('/admin/servers/<int:server_id>/edit', methods=['GET', 'POST'])
 def admin_edit_server(server_id):
     """Редактирование сервера"""
     if 'admin' not in session:
@@ -195,6 +339,7 @@ def admin_edit_server(server_id):
             'ip': request.form.get('ip'),
             'port': int(request.form.get('port', 22)),
             'username': request.form.get('username', 'root'),
+            'jump_host': request.form.get('jump_host') or None,
             'description': request.form.get('description', '')
         }
         
@@ -207,7 +352,7 @@ def admin_edit_server(server_id):
     
     return render_template('edit_server.html', server=server)
 
-@app.route('/admin/servers/<int:server_id>/delete', methods=['POST'])
+@route('/admin/servers/<int:server_id>/delete', methods=['POST'])
 def admin_delete_server(server_id):
     """Удаление сервера"""
     if 'admin' not in session:
@@ -215,13 +360,14 @@ def admin_delete_server(server_id):
     
     try:
         db_manager.delete_server(server_id)
+        fragments.discard(server_id)
         flash('Сервер удален', 'success')
     except Exception as e:
         flash(f'Ошибка: {e}', 'error')
     
     return redirect(url_for('admin_servers'))
 
-@app.route('/admin/servers/<int:server_id>/test')
+@route('/admin/servers/<int:server_id>/test')
 def admin_test_server(server_id):
     """Тестирование SSH подключения"""
     if 'admin' not in session:
@@ -234,12 +380,13 @@ def admin_test_server(server_id):
     result = ssh_monitor.test_connection(
         host=server['ip'],
         port=server['port'],
-        username=server['username']
+        username=server['username'],
+        jump_host=server.get('jump_host')
     )
     
     return jsonify(result)
 
-@app.route('/admin/servers/<int:server_id>/metrics')
+@route('/admin/servers/<int:server_id>/metrics')
 def admin_server_current_metrics(server_id):
     """API текущих метрик сервера"""
     if 'admin' not in session:
@@ -251,15 +398,15 @@ def admin_server_current_metrics(server_id):
         if not server:
             return jsonify({'error': 'Сервер не найден'}), 404
         
-        # Получаем метрики через SSH
-        ssh_monitor = SSHMonitor()
+        # Получаем метрики через SSH (общий ограничитель подключений)
         metrics = ssh_monitor.get_metrics(
             server['ip'], 
             server['port'], 
             server['username'], 
             server.get('password'),
             server.get('ssh_key_path'),
-            server.get('ssh_key_content')
+            server.get('ssh_key_content'),
+            server.get('jump_host')
         )
         
         if metrics and 'error' not in metrics:
@@ -280,7 +427,7 @@ def admin_server_current_metrics(server_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/metrics')
+@route('/api/metrics')
 def api_metrics():
     """API метрик"""
     try:
@@ -289,25 +436,108 @@ def api_metrics():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/servers')
+@route('/api/servers')
 def api_servers():
     """API списка серверов"""
     try:
-        servers = db_manager.get_all_servers()
-        return jsonify({'servers': servers, 'count': len(servers)})
+        servers = db_manager.get_public_servers()
+        return jsonify({'servers': [server.to_dict() for server in servers], 'count': len(servers)})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/servers/<int:server_id>/metrics')
+@route('/api/servers/<int:server_id>/metrics')
 def api_server_metrics(server_id):
     """API истории метрик сервера"""
     try:
-        metrics = db_manager.get_server_metrics(server_id)
+        start = request.args.get('start', type=int)
+        if start is not None:
+            # Диапазон по Unix-времени: ?start=...&end=...
+            end = request.args.get('end', int(time.time()), type=int)
+            step = request.args.get('step', type=int)
+            if step is not None:
+                if step < 1:
+                    return jsonify({'error': 'Шаг step должен быть не меньше 1 секунды'}), 400
+                if (end - start) // step + 1 > MAX_FILL_POINTS:
+                    return jsonify({'error': f'Слишком много точек: не больше {MAX_FILL_POINTS}, увеличьте step'}), 400
+            metrics = db_manager.get_metrics_range(server_id, start, end, step=step)
+        else:
+            # Постраничное чтение от новых к старым: ?limit=100&before=<next_cursor>
+            limit = min(max(request.args.get('limit', 100, type=int), 1), 10000)
+            try:
+                metrics = db_manager.get_server_metrics(server_id, limit=limit,
+                                                        before=request.args.get('before') or None)
+            except ValueError:
+                return jsonify({'error': 'Некорректный курсор before'}), 400
+            next_cursor = metrics_cursor(metrics[-1]) if len(metrics) == limit else None
+            return jsonify({'metrics': metrics, 'next_cursor': next_cursor})
         return jsonify({'metrics': metrics})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/servers/<int:server_id>/status')
+@route('/api/servers/<int:server_id>/series')
+def api_server_series(server_id):
+    """
+    API рядов разделов и интерфейсов: без start - последний замер,
+    с ?start=<unix>&end=<unix> - история; &metric= - одна метрика
+    """
+    metric = request.args.get('metric')
+    if metric is not None and metric not in LABELLED_METRICS:
+        return jsonify({'error': f'Метрика должна быть одной из: {", ".join(LABELLED_METRICS)}'}), 400
+    try:
+        start = request.args.get('start', type=int)
+        if start is None:
+            latest, ts = db_manager.get_latest_labelled(server_id)
+            if metric:
+                latest = {metric: latest.get(metric, {})}
+            return jsonify({'timestamp': ts, 'latest': latest})
+        end = request.args.get('end', int(time.time()), type=int)
+        return jsonify({'series': db_manager.get_labelled_series(server_id, start, end, metric)})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@route('/api/metrics/export')
+def api_export_metrics():
+    """Потоковая выгрузка истории метрик: ?format=ndjson|csv&server_id=1,2&start=&end=&gzip=1"""
+    if 'admin' not in session:
+        return jsonify({'error': 'Не авторизован'}), 401
+    
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Формат должен быть одним из: {", ".join(EXPORT_FORMATS)}'}), 400
+    try:
+        server_ids = [int(value) for arg in request.args.getlist('server_id')
+                      for value in arg.split(',') if value.strip()]
+    except ValueError:
+        return jsonify({'error': 'Некорректный server_id'}), 400
+    start = request.args.get('start', type=int)
+    end = request.args.get('end', type=int)
+    
+    chunks = export_chunks(db_manager.iter_metrics(server_ids, start, end), fmt)
+    filename = f'metrics.{fmt}'
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    if request.args.get('gzip', '').lower() in ('1', 'true', 'yes'):
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    
+    return Response(chunks, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@route('/metrics')
+def prometheus_metrics():
+    """Метрики всех серверов в формате Prometheus (из памяти, пересборка только после новых данных)"""
+    try:
+        key = (db_manager.inventory.version, db_manager.ingest_version)
+        body = exposition_cache.render(key, lambda: (
+            db_manager.get_public_servers(),
+            db_manager.get_latest_snapshot(),
+            db_manager.get_last_checks()
+        ))
+        return Response(body, mimetype=None, content_type=PROMETHEUS_CONTENT_TYPE)
+    except Exception as e:
+        return Response(f'# error: {e}\n', status=500, content_type=PROMETHEUS_CONTENT_TYPE)
+
+@route('/api/servers/<int:server_id>/status')
 def api_server_status(server_id):
     """API публичного статуса сервера (без авторизации)"""
     try:
@@ -341,7 +571,7 @@ def api_server_status(server_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/admin/monitoring/start')
+@route('/admin/monitoring/start')
 def admin_start_monitoring():
     """Запуск автоматического мониторинга"""
     if 'admin' not in session:
@@ -353,7 +583,7 @@ def admin_start_monitoring():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/admin/monitoring/stop')
+@route('/admin/monitoring/stop')
 def admin_stop_monitoring():
     """Остановка автоматического мониторинга"""
     if 'admin' not in session:
@@ -365,7 +595,7 @@ def admin_stop_monitoring():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/admin/monitoring/status')
+@route('/admin/monitoring/status')
 def admin_monitoring_status():
     """Статус мониторинга"""
     if 'admin' not in session:
@@ -374,11 +604,165 @@ def admin_monitoring_status():
     return jsonify({
         'running': scheduler.running,
         'interval': scheduler.interval,
-        'servers_count': len(db_manager.get_all_servers()),
-        'thread_alive': scheduler.thread.is_alive() if scheduler.thread else False
+        'servers_count': db_manager.count_servers(),
+        'thread_alive': scheduler.thread.is_alive() if scheduler.thread else False,
+        'ssh_admission': ssh_monitor.limiter.get_stats(),
+        'schedule': scheduler.get_schedule_stats()
     })
 
-@app.route('/admin/monitoring/set-interval', methods=['POST'])
+@route('/api/alerts')
+def api_alerts():
+    """Сработавшие правила и журнал переходов: ?limit=100&server_id="""
+    if 'admin' not in session:
+        return jsonify({'error': 'Не авторизован'}), 401
+    
+    server_id = request.args.get('server_id', type=int)
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    return jsonify({
+        'active': scheduler.alerts.active(server_id),
+        'events': db_manager.get_alert_events(limit, server_id),
+        'engine': scheduler.alerts.get_stats()
+    })
+
+@route('/api/alerts/rules', methods=['GET', 'POST'])
+def api_alert_rules():
+    """Список правил оповещений и добавление правила"""
+    if 'admin' not in session:
+        return jsonify({'error': 'Не авторизован'}), 401
+    
+    if request.method == 'POST':
+        try:
+            rule = validate_rule(request.get_json(silent=True) or {})
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        rule_id = db_manager.add_alert_rule(rule)
+        scheduler.reload_alert_rules()
+        return jsonify({'success': True, 'id': rule_id}), 201
+    
+    return jsonify({'rules': db_manager.get_alert_rules()})
+
+@route('/api/alerts/rules/<int:rule_id>', methods=['PUT', 'DELETE'])
+def api_alert_rule(rule_id):
+    """Изменение или удаление правила оповещений"""
+    if 'admin' not in session:
+        return jsonify({'error': 'Не авторизован'}), 401
+    
+    if request.method == 'DELETE':
+        found = db_manager.delete_alert_rule(rule_id)
+    else:
+        try:
+            rule = validate_rule(request.get_json(silent=True) or {})
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        found = db_manager.update_alert_rule(rule_id, rule)
+    if not found:
+        return jsonify({'error': 'Правило не найдено'}), 404
+    scheduler.reload_alert_rules()
+    return jsonify({'success': True})
+
+@route('/api/fleet/heatmap')
+def api_fleet_heatmap():
+    """Тепловая карта парка: ?metric=cpu&hours=24&matrix=0 (только перцентили парка)"""
+    metric = request.args.get('metric', 'cpu')
+    if metric not in ROLLUP_METRICS:
+        return jsonify({'error': f'Метрика должна быть одной из: {", ".join(ROLLUP_METRICS)}'}), 400
+    hours = min(max(request.args.get('hours', 24, type=int), 1), 168)
+    return jsonify(db_manager.get_fleet_heatmap(metric, hours, include_matrix=request.args.get('matrix') != '0'))
+
+@route('/api/anomalies')
+def api_anomalies():
+    """Аномалии последнего прохода: ?all=1 - оценки всех серверов, не только помеченных"""
+    anomalies = db_manager.get_anomalies(flagged_only=request.args.get('all') != '1')
+    return jsonify({
+        'anomalies': [row for rows in anomalies.values() for row in rows],
+        'last_run': scheduler.anomaly_stats
+    })
+
+@route('/admin/anomalies/run', methods=['POST'])
+def admin_run_anomalies():
+    """Внеочередной проход поиска аномалий"""
+    if 'admin' not in session:
+        return jsonify({'error': 'Не авторизован'}), 401
+    
+    stats = scheduler.run_anomaly_detection()
+    if 'error' in stats:
+        return jsonify(stats), 500
+    return jsonify({'success': True, **stats})
+
+@route('/admin/backups', methods=['GET', 'POST'])
+def admin_backups():
+    """Резервные копии базы: список и статус, POST - внеочередная копия в фоне"""
+    if 'admin' not in session:
+        return jsonify({'error': 'Не авторизован'}), 401
+    
+    if request.method == 'POST':
+        if not backups.run_async():
+            return jsonify({'error': 'Копирование уже выполняется'}), 409
+        return jsonify({'success': True, 'message': 'Резервное копирование запущено'}), 202
+    return jsonify(backups.get_status())
+
+@route('/admin/instrumentation')
+def admin_instrumentation():
+    """Внутренние замеры: длительности SSH, запросов к базе, проходов планировщика"""
+    if 'admin' not in session:
+        return jsonify({'error': 'Не авторизован'}), 401
+    
+    data = telemetry.snapshot()
+    data['ssh_admission'] = ssh_monitor.limiter.get_stats()
+    data['inventory_cache'] = db_manager.inventory.get_stats()
+    data['recent_buffer'] = db_manager.recent.get_stats()
+    data['query_cache'] = db_manager.query_cache.get_stats()
+    data['fragment_cache'] = fragments.get_stats()
+    data['labelled_series'] = db_manager.labelled.get_stats()
+    data['alerts'] = scheduler.alerts.get_stats()
+    if db_manager.deadband:
+        data['deadband'] = db_manager.deadband.get_stats()
+    if request.args.get('reset') == '1':
+        telemetry.reset()
+    return jsonify(data)
+
+@route('/admin/profiling', methods=['GET', 'POST'])
+def admin_profiling():
+    """Включение профилирования и список сохраненных профилей"""
+    if 'admin' not in session:
+        return jsonify({'error': 'Не авторизован'}), 401
+    
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        target = data.get('target', 'requests')
+        mode = data.get('mode', 'cprofile')
+        if target not in PROFILE_TARGETS or mode not in PROFILE_MODES:
+            return jsonify({'error': f'target: {"/".join(PROFILE_TARGETS)}, mode: {"/".join(PROFILE_MODES)}'}), 400
+        if data.get('cancel'):
+            profiler.cancel()
+        else:
+            try:
+                profiler.arm(target, count=int(data.get('count', 1)), mode=mode,
+                             interval=float(data.get('interval', 0.005)))
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Некорректные параметры профилирования'}), 400
+            except RuntimeError as e:
+                return jsonify({'error': str(e)}), 409
+    
+    return jsonify({'status': profiler.get_status(), 'profiles': profiler.list_profiles()})
+
+@route('/admin/profiling/<name>')
+def admin_profiling_download(name):
+    """Скачивание профиля (.prof для pstats/snakeviz, .folded для flamegraph); ?summary=1 - текст"""
+    if 'admin' not in session:
+        return jsonify({'error': 'Не авторизован'}), 401
+    
+    path = profiler.profile_path(name)
+    if path is None:
+        return jsonify({'error': 'Профиль не найден'}), 404
+    if request.args.get('summary') == '1':
+        text = profiler.summary(name)
+        if text is None:
+            return jsonify({'error': 'Сводка доступна только для .prof'}), 400
+        return Response(text, mimetype='text/plain; charset=utf-8')
+    return send_file(path, as_attachment=True, download_name=name)
+
+@route('/admin/monitoring/set-interval', methods=['POST'])
 def admin_set_monitoring_interval():
     """Изменение интервала мониторинга"""
     if 'admin' not in session:
@@ -400,7 +784,9 @@ def admin_set_monitoring_interval():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/admin/servers/<int:server_id>/history')
+HISTORY_PAGE_SIZE = 50
+
+@route('/admin/servers/<int:server_id>/history')
 def admin_server_history(server_id):
     """История метрик сервера"""
     if 'admin' not in session:
@@ -411,10 +797,16 @@ def admin_server_history(server_id):
         flash('Сервер не найден', 'error')
         return redirect(url_for('admin_servers'))
     
-    metrics = db_manager.get_server_metrics(server_id, limit=50)
-    return render_template('server_history.html', server=server, metrics=metrics)
-
-@app.route('/servers/<int:server_id>')
+    before = request.args.get('before') or None
+    try:
+        metrics = db_manager.get_server_metrics(server_id, limit=HISTORY_PAGE_SIZE, before=before)
+    except ValueError:
+        return redirect(url_for('admin_server_history', server_id=server_id))
+    next_cursor = metrics_cursor(metrics[-1]) if len(metrics) == HISTORY_PAGE_SIZE else None
+    return render_template('server_history.html', server=server, metrics=metrics,
+                           next_cursor=next_cursor, is_first_page=before is None)
+
+@route('/servers/<int:server_id>')
 def server_detail(server_id):
     """Детальная информация о сервере"""
     try:
@@ -436,7 +828,7 @@ def server_detail(server_id):
     except Exception as e:
         return render_template('error.html', error=str(e))
 
-@app.route('/api/servers/<int:server_id>/test-connection')
+@route('/api/servers/<int:server_id>/test-connection')
 def api_test_server_connection(server_id):
     """API для тестирования SSH подключения к серверу"""
     try:
@@ -444,8 +836,6 @@ def api_test_server_connection(server_id):
         if not server:
             return jsonify({'error': 'Сервер не найден'}), 404
         
-        ssh_monitor = SSHMonitor()
-        
         # Сначала тестируем подключение
         test_result = ssh_monitor.test_connection(
             server['ip'], 
@@ -453,7 +843,8 @@ def api_test_server_connection(server_id):
             server['username'], 
             server.get('password'),
             server.get('ssh_key_path'),
-            server.get('ssh_key_content')
+            server.get('ssh_key_content'),
+            server.get('jump_host')
         )
         
         if test_result['success']:
@@ -464,7 +855,8 @@ def api_test_server_connection(server_id):
                 server['username'], 
                 server.get('password'),
                 server.get('ssh_key_path'),
-                server.get('ssh_key_content')
+                server.get('ssh_key_content'),
+                server.get('jump_host')
             )
         
         if metrics and 'error' not in metrics:
@@ -491,10 +883,79 @@ def api_test_server_connection(server_id):
             'message': f'Ошибка тестирования: {str(e)}'
         }), 500
 
+def create_app(config=None):
+    """
+    Создание приложения. Планировщик не запускается: см. start_monitoring().
+    config дополняет/переопределяет значения по умолчанию и переменные окружения.
+    """
+    app = Flask(__name__, 
+                template_folder='../templates',
+                static_folder='../static')
+    
+    app.config['SECRET_KEY'] = 'monitoring-secret-key-2024'
+    app.config['JSON_AS_ASCII'] = False
+    app.config['METRICS_STORAGE'] = os.environ.get('METRICS_STORAGE', 'rows')
+    app.config['METRICS_DEADBAND'] = os.environ.get('METRICS_DEADBAND', '1') != '0'
+    app.config['DATABASE_PATH'] = os.environ.get('DATABASE_PATH')
+    app.config['MONITORING_INTERVAL'] = int(os.environ.get('MONITORING_INTERVAL', 60))
+    # Адаптивный опрос: интервал хоста от MIN_FACTOR до MAX_FACTOR общего, темп проверок не выше BUDGET от обычного
+    app.config['ADAPTIVE_SAMPLING'] = os.environ.get('ADAPTIVE_SAMPLING', '1') != '0'
+    app.config['ADAPTIVE_MIN_FACTOR'] = float(os.environ.get('ADAPTIVE_MIN_FACTOR', 0.25))
+    app.config['ADAPTIVE_MAX_FACTOR'] = float(os.environ.get('ADAPTIVE_MAX_FACTOR', 4.0))
+    app.config['ADAPTIVE_BUDGET'] = float(os.environ.get('ADAPTIVE_BUDGET', 1.0))
+    # Кэш отрисованных карточек серверов (0 - без кэша)
+    app.config['FRAGMENT_CACHE_ENTRIES'] = int(os.environ.get('FRAGMENT_CACHE_ENTRIES', 10000))
+    # Кэш запросов истории: записей и строк всего (0 - без кэша)
+    app.config['QUERY_CACHE_ENTRIES'] = int(os.environ.get('QUERY_CACHE_ENTRIES', 1024))
+    app.config['QUERY_CACHE_ROWS'] = int(os.environ.get('QUERY_CACHE_ROWS', 200000))
+    # Резервные копии: каталог (None - backups рядом с базой), сколько хранить, интервал в секундах (0 - только вручную)
+    app.config['BACKUP_DIR'] = os.environ.get('BACKUP_DIR')
+    app.config['BACKUP_KEEP'] = int(os.environ.get('BACKUP_KEEP', 7))
+    app.config['BACKUP_INTERVAL'] = int(os.environ.get('BACKUP_INTERVAL', 86400))
+    # Локальные диски: кэш списка разделов (с), ожидание statvfs (с), исключенные типы ФС через запятую
+    app.config['SYSTEM_PARTITIONS_TTL'] = int(os.environ.get('SYSTEM_PARTITIONS_TTL', 300))
+    app.config['SYSTEM_DISK_TIMEOUT'] = float(os.environ.get('SYSTEM_DISK_TIMEOUT', 1.0))
+    app.config['SYSTEM_DISK_EXCLUDE'] = (os.environ['SYSTEM_DISK_EXCLUDE'].split(',')
+                                         if os.environ.get('SYSTEM_DISK_EXCLUDE') is not None else None)
+    app.config.update(config or {})
+    if 'ADMIN_USER' not in app.config:
+        app.config['ADMIN_USER'] = load_admin_credentials()
+    
+    app.extensions['monitoring'] = MonitoringComponents(app.config)
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    app.before_request(_profile_request_start)
+    app.teardown_request(_profile_request_end)
+    return app
+
+def start_monitoring(app):
+    """Явный запуск планировщика приложения"""
+    components = app.extensions['monitoring']
+    if not components.scheduler.running:
+        # Интервал из базы (если меняли через админку), иначе MONITORING_INTERVAL
+        components.scheduler.start()
+        print(f"🔄 Автоматический мониторинг запущен (интервал: {components.scheduler.interval} секунд)")
+    return components.scheduler
+
+_default_app = None
+
+def __getattr__(name):
+    """
+    app для WSGI-серверов (gunicorn app:app) создается при первом обращении,
+    а не при импорте модуля; планировщик стартует, если MONITORING_AUTOSTART != 0.
+    """
+    global _default_app
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if _default_app is None:
+        _default_app = create_app()
+        if os.environ.get('MONITORING_AUTOSTART', '1') != '0':
+            start_monitoring(_default_app)
+    return _default_app
+
 if __name__ == '__main__':
-    # Запускаем планировщик при старте с интервалом 60 секунд
-    scheduler.start(interval=60)
-    print(f"🔄 Автоматический мониторинг запущен (интервал: 60 секунд)")
+    app = create_app()
+    start_monitoring(app)
     
     # Получаем порт из переменной окружения или используем по умолчанию
     port = int(os.environ.get('PORT', 5000))
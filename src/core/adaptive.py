@@ -0,0 +1,91 @@
+"""
+Адаптивный интервал опроса: чаще для неспокойных хостов и хостов у порогов,
+реже для ровных; общий темп проверок ограничен бюджетом.
+"""
+
+# Изменение метрики между замерами, которое считается заметным (п.п.)
+VOLATILITY_SCALES = {'cpu': 5.0, 'memory': 2.0, 'disk': 1.0}
+
+
+class AdaptiveSampler:
+    """
+    Интервал хоста лежит в [base * min_factor, base * max_factor].
+    Срочность u от 0 до 1 - большее из двух: сглаженная изменчивость метрик
+    и близость к порогу правил оповещений. Интервал - геометрическая
+    интерполяция между границами: u = 0 - максимальный, u = 1 - минимальный.
+    Бюджет: проверок в секунду не больше, чем при общем интервале base * budget.
+    """
+
+    def __init__(self, enabled=True, min_factor=0.25, max_factor=4.0, budget=1.0, floor=10,
+                 near_margin=10.0, smoothing=0.3, max_growth=1.5):
+        self.enabled = enabled
+        self.min_factor = min_factor
+        self.max_factor = max_factor
+        self.budget = budget
+        self.floor = floor                # нижняя граница интервала, с
+        self.near_margin = near_margin    # ближе этого (п.п.) к порогу - максимальная срочность
+        self.smoothing = smoothing        # вес нового изменения в сглаженной изменчивости
+        self.max_growth = max_growth      # во сколько раз интервал может вырасти за одну проверку
+        self.scale = 1.0                  # последний множитель бюджета
+
+    def bounds(self, base):
+        if not self.enabled:
+            return base, base
+        low = min(base, max(self.floor, base * self.min_factor))
+        return low, max(base, base * self.max_factor)
+
+    def volatility(self, previous, values, current):
+        """Новая сглаженная изменчивость по паре соседних замеров"""
+        if previous is None:
+            return current
+        change = max(abs(values.get(metric, 0) - previous.get(metric, 0)) / scale
+                     for metric, scale in VOLATILITY_SCALES.items())
+        return current + self.smoothing * (change - current)
+
+    def desired(self, base, volatility, headroom, current):
+        """
+        Желаемый интервал хоста. headroom - запас до ближайшего порога (п.п.,
+        отрицательный - порог пройден, None - правил нет); current - прежний интервал.
+        """
+        low, high = self.bounds(base)
+        if low == high:
+            return base
+        urgency = min(volatility, 1.0)
+        if headroom is not None:
+            urgency = max(urgency, 1.0 - min(max(headroom / self.near_margin, 0.0), 1.0))
+        target = high * (low / high) ** urgency
+        # Ускоряемся сразу, замедляемся постепенно
+        if current and target > current:
+            target = min(target, current * self.max_growth)
+        return target
+
+    def apply_budget(self, base, desired_intervals):
+        """
+        Множитель интервалов, при котором суммарный темп проверок не превышает
+        бюджета (len * budget / base в секунду). Меньше 1 не бывает.
+        Хосты, упершиеся в верхнюю границу, дальше не растягиваются -
+        множитель пересчитывается по остальным.
+        """
+        self.scale = 1.0
+        if not self.enabled or not desired_intervals:
+            return self.scale
+        high = self.bounds(base)[1]
+        allowed = len(desired_intervals) * self.budget / base
+        free = sorted(desired_intervals, reverse=True)
+        capped = 0
+        while free:
+            rate = sum(1.0 / interval for interval in free)
+            scale = rate / (allowed - capped / high) if allowed > capped / high else float('inf')
+            if free[0] * scale <= high:
+                self.scale = max(1.0, scale)
+                break
+            # Самый медленный из оставшихся упирается в границу
+            free.pop(0)
+            capped += 1
+        else:
+            self.scale = high / min(desired_intervals)
+        return self.scale
+
+    def effective(self, base, desired):
+        """Интервал с учетом бюджета и верхней границы"""
+        return min(desired * self.scale, self.bounds(base)[1])
@@ -0,0 +1,277 @@
+"""
+Потоковые правила оповещений: скользящие агрегаты по окну и гистерезис.
+"""
+import threading
+from collections import deque
+
+ALERT_METRICS = ('cpu', 'memory', 'disk')
+ALERT_AGGREGATES = ('avg', 'min', 'max', 'last', 'rate')
+ALERT_OPERATORS = ('>', '<')
+ALERT_SEVERITIES = ('warning', 'critical')
+# Агрегат окна считается, когда замеры покрывают хотя бы половину окна
+MIN_COVERAGE = 0.5
+
+
+class WindowAggregate:
+    """
+    Скользящее окно замеров одной метрики одного сервера.
+    Сумма ведется нарастающим итогом, минимум и максимум - монотонными
+    очередями, поэтому добавление замера стоит O(1) в среднем.
+    """
+
+    __slots__ = ('window', 'samples', 'total', 'mins', 'maxs', 'head', 'next')
+
+    def __init__(self, window):
+        self.window = window
+        self.samples = deque()  # (ts, value)
+        self.total = 0.0
+        self.mins = deque()     # (номер замера, значение) по возрастанию значений
+        self.maxs = deque()     # (номер замера, значение) по убыванию значений
+        self.head = 0           # номер самого старого замера в окне
+        self.next = 0
+
+    def add(self, ts, value):
+        seq = self.next
+        self.next += 1
+        self.samples.append((ts, value))
+        self.total += value
+        while self.mins and self.mins[-1][1] > value:
+            self.mins.pop()
+        self.mins.append((seq, value))
+        while self.maxs and self.maxs[-1][1] < value:
+            self.maxs.pop()
+        self.maxs.append((seq, value))
+        self._evict(ts - self.window)
+
+    def _evict(self, cutoff):
+        samples = self.samples
+        while len(samples) > 1 and samples[0][0] <= cutoff:
+            _, value = samples.popleft()
+            self.total -= value
+            if self.mins[0][0] == self.head:
+                self.mins.popleft()
+            if self.maxs[0][0] == self.head:
+                self.maxs.popleft()
+            self.head += 1
+
+    def covered(self):
+        return self.samples[-1][0] - self.samples[0][0] >= self.window * MIN_COVERAGE
+
+    def value(self, aggregate):
+        """Значение агрегата или None, если замеров в окне недостаточно"""
+        if aggregate == 'last':
+            return self.samples[-1][1]
+        if not self.covered():
+            return None
+        if aggregate == 'avg':
+            return self.total / len(self.samples)
+        if aggregate == 'min':
+            return self.mins[0][1]
+        if aggregate == 'max':
+            return self.maxs[0][1]
+        # rate: прирост в единицах метрики за час
+        (first_ts, first), (last_ts, last) = self.samples[0], self.samples[-1]
+        if last_ts == first_ts:
+            return None
+        return (last - first) * 3600.0 / (last_ts - first_ts)
+
+
+def validate_rule(data):
+    """Проверка и нормализация правила; ValueError с описанием ошибки"""
+    try:
+        rule = {
+            'name': str(data.get('name') or '').strip(),
+            'metric': data.get('metric'),
+            'aggregate': data.get('aggregate', 'avg'),
+            'window': int(data.get('window', 300)),
+            'operator': data.get('operator', '>'),
+            'threshold': float(data['threshold']),
+            'for_windows': int(data.get('for_windows', 1)),
+            'severity': data.get('severity', 'warning'),
+            'server_id': int(data['server_id']) if data.get('server_id') not in (None, '') else None,
+            'enabled': bool(data.get('enabled', True)),
+        }
+        clear = data.get('clear_threshold')
+        rule['clear_threshold'] = float(clear) if clear not in (None, '') else rule['threshold']
+    except KeyError:
+        raise ValueError('Не указан порог threshold')
+    except (TypeError, ValueError):
+        raise ValueError('Некорректные числовые параметры правила')
+    if not rule['name']:
+        raise ValueError('Не указано имя правила')
+    if rule['metric'] not in ALERT_METRICS:
+        raise ValueError(f'Метрика должна быть одной из: {", ".join(ALERT_METRICS)}')
+    if rule['aggregate'] not in ALERT_AGGREGATES:
+        raise ValueError(f'Агрегат должен быть одним из: {", ".join(ALERT_AGGREGATES)}')
+    if rule['operator'] not in ALERT_OPERATORS:
+        raise ValueError('Оператор должен быть > или <')
+    if rule['severity'] not in ALERT_SEVERITIES:
+        raise ValueError(f'Важность должна быть одной из: {", ".join(ALERT_SEVERITIES)}')
+    if rule['window'] < 1 or rule['for_windows'] < 1:
+        raise ValueError('Окно должно быть не меньше 1 секунды, for_windows - не меньше 1')
+    # Порог снятия должен лежать по "спокойную" сторону от порога срабатывания
+    if (rule['operator'] == '>' and rule['clear_threshold'] > rule['threshold']) or \
+            (rule['operator'] == '<' and rule['clear_threshold'] < rule['threshold']):
+        raise ValueError('Порог снятия должен быть по другую сторону от порога срабатывания')
+    return rule
+
+
+class _RuleState:
+    __slots__ = ('breach_since', 'firing', 'value')
+
+    def __init__(self):
+        self.breach_since = None
+        self.firing = False
+        self.value = None
+
+
+class AlertEngine:
+    """
+    Оценка правил по каждому новому замеру без чтения истории.
+    Правило срабатывает, когда агрегат за окно держится за порогом
+    for_windows окон подряд, и снимается только после возврата за
+    clear_threshold (гистерезис против дребезга).
+    """
+
+    def __init__(self, rules=()):
+        self._lock = threading.Lock()
+        self._windows = {}  # (server_id, metric, window) -> WindowAggregate
+        self._states = {}   # (server_id, rule_id) -> _RuleState
+        self._firing = {}   # server_id -> число сработавших правил
+        self.set_rules(rules)
+
+    def set_rules(self, rules):
+        """Замена набора правил; состояние сохраняется только для неизменившихся правил"""
+        global_rules = []
+        by_server = {}
+        for rule in rules:
+            if not rule.get('enabled', True):
+                continue
+            if rule.get('server_id') is None:
+                global_rules.append(rule)
+            else:
+                by_server.setdefault(rule['server_id'], []).append(rule)
+        with self._lock:
+            previous = getattr(self, '_rules', {})
+            self._global_rules = global_rules
+            self._server_rules = by_server
+            self._rules = {rule['id']: rule for rule in global_rules}
+            for server_rules in by_server.values():
+                self._rules.update((rule['id'], rule) for rule in server_rules)
+            self._states = {key: state for key, state in self._states.items()
+                            if key[1] in self._rules and previous.get(key[1]) == self._rules[key[1]]}
+            self._count_firing()
+            windows = {(rule['metric'], rule['window']) for rule in self._rules.values()}
+            self._windows = {key: agg for key, agg in self._windows.items() if key[1:] in windows}
+
+    def observe(self, server_id, ts, values):
+        """
+        Новый замер {'cpu': .., 'memory': .., 'disk': ..} сервера.
+        Возвращает переходы [{'rule_id', 'server_id', 'state': 'firing'|'resolved', 'value', 'ts'}].
+        """
+        events = []
+        with self._lock:
+            rules = self._global_rules + self._server_rules.get(server_id, [])
+            fed = set()
+            for rule in rules:
+                value = values.get(rule['metric'])
+                if value is None:
+                    continue
+                key = (server_id, rule['metric'], rule['window'])
+                aggregate = self._windows.get(key)
+                if aggregate is None:
+                    aggregate = self._windows[key] = WindowAggregate(rule['window'])
+                if key not in fed:
+                    # Окно общее для всех правил с той же метрикой и длительностью
+                    fed.add(key)
+                    aggregate.add(ts, float(value))
+                event = self._evaluate(server_id, rule, aggregate, ts)
+                if event:
+                    events.append(event)
+        return events
+
+    def _evaluate(self, server_id, rule, aggregate, ts):
+        value = aggregate.value(rule['aggregate'])
+        if value is None:
+            return None
+        state = self._states.get((server_id, rule['id']))
+        if state is None:
+            state = self._states[(server_id, rule['id'])] = _RuleState()
+        state.value = value
+        above = rule['operator'] == '>'
+        breached = value > rule['threshold'] if above else value < rule['threshold']
+        cleared = value <= rule['clear_threshold'] if above else value >= rule['clear_threshold']
+
+        if state.firing:
+            if cleared:
+                state.firing = False
+                state.breach_since = None
+                self._firing[server_id] -= 1
+                return {'rule_id': rule['id'], 'server_id': server_id, 'state': 'resolved', 'value': value, 'ts': ts}
+            return None
+        if not breached:
+            state.breach_since = None
+            return None
+        if state.breach_since is None:
+            state.breach_since = ts
+        if ts - state.breach_since >= (rule['for_windows'] - 1) * rule['window']:
+            state.firing = True
+            self._firing[server_id] = self._firing.get(server_id, 0) + 1
+            return {'rule_id': rule['id'], 'server_id': server_id, 'state': 'firing', 'value': value, 'ts': ts}
+        return None
+
+    def active(self, server_id=None):
+        """Сработавшие правила: [{'rule_id', 'server_id', 'name', 'severity', 'value'}]"""
+        with self._lock:
+            return [{
+                'rule_id': rule_id,
+                'server_id': sid,
+                'name': self._rules[rule_id]['name'],
+                'severity': self._rules[rule_id]['severity'],
+                'value': round(state.value, 2)
+            } for (sid, rule_id), state in self._states.items()
+                if state.firing and (server_id is None or sid == server_id)]
+
+    def is_alerting(self, server_id):
+        return self._firing.get(server_id, 0) > 0
+
+    def headroom(self, server_id, values):
+        """
+        Запас замера до ближайшего порога правил сервера (в единицах метрики,
+        отрицательный - порог пройден); None, если правил нет.
+        Правила rate пропускаются: их порог не сравним со значением метрики.
+        """
+        with self._lock:
+            rules = self._global_rules + self._server_rules.get(server_id, [])
+        margins = []
+        for rule in rules:
+            value = values.get(rule['metric'])
+            if value is None or rule['aggregate'] == 'rate':
+                continue
+            margin = rule['threshold'] - value if rule['operator'] == '>' else value - rule['threshold']
+            margins.append(margin)
+        return min(margins, default=None)
+
+    def _count_firing(self):
+        firing = {}
+        for (server_id, _), state in self._states.items():
+            if state.firing:
+                firing[server_id] = firing.get(server_id, 0) + 1
+        self._firing = firing
+
+    def retain(self, server_ids):
+        """Сброс состояния серверов, которых больше нет в инвентаре"""
+        server_ids = set(server_ids)
+        with self._lock:
+            self._windows = {key: agg for key, agg in self._windows.items() if key[0] in server_ids}
+            self._states = {key: state for key, state in self._states.items() if key[0] in server_ids}
+            self._count_firing()
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'rules': len(self._rules),
+                'windows': len(self._windows),
+                'samples': sum(len(agg.samples) for agg in self._windows.values()),
+                'firing': sum(self._firing.values())
+            }
@@ -0,0 +1,164 @@
+"""
+Поиск аномалий по всему парку: матрица серверы x время в NumPy,
+собственная база сервера (z-оценка, EWMA) и отклонение от группы.
+"""
+import importlib.util
+import re
+
+# NumPy нужен только для пакетного анализа и импортируется при первом запуске
+NUMPY_AVAILABLE = importlib.util.find_spec('numpy') is not None
+np = None
+
+ANOMALY_METRICS = ('cpu', 'memory', 'disk')
+
+
+def _import_numpy():
+    global np
+    if np is None:
+        import numpy as module
+        np = module
+    return np
+
+
+def peer_group(name):
+    """Группа сравнения по имени: буквенный префикс (web-01, web-02 -> web)"""
+    match = re.match(r'[A-Za-z]+', name or '')
+    return match.group(0).lower() if match else ''
+
+
+class FleetAnomalyDetector:
+    """
+    Пакетный анализ последних history корзин по step секунд.
+    Сервер помечается, если текущее значение отклоняется от своей истории
+    (z-оценка и EWMA одновременно) или от серверов своей группы (медиана/MAD).
+    """
+
+    def __init__(self, step=60, history=60, z_threshold=3.0, peer_threshold=3.5,
+                 ewma_alpha=0.1, min_std=1.0, min_history=10, min_group=5, max_fill=0):
+        self.available = NUMPY_AVAILABLE
+        self.step = step
+        self.history = history
+        self.z_threshold = z_threshold
+        self.peer_threshold = peer_threshold
+        self.ewma_alpha = ewma_alpha
+        self.min_std = min_std          # минимальный разброс, п.п.: ровные ряды не дают ложных срабатываний
+        self.min_history = min_history  # замеров истории для собственной базы
+        self.min_group = min_group      # меньшие группы сравниваются со всем парком
+        # Последний замер переносится вперед не дальше max_fill секунд (пропуски deadband-фильтра)
+        self.max_fill = max_fill
+
+    def window_start(self, now):
+        return now - now % self.step - (self.history - 1) * self.step
+
+    def query_start(self, now):
+        """Начало выборки замеров: окно и запас для переноса значений вперед"""
+        return self.window_start(now) - self.max_fill
+
+    def build_matrix(self, rows, server_ids, now):
+        """
+        Замеры (server_id, ts, cpu, memory, disk) в тензор (метрика, сервер, корзина)
+        с NaN в пропусках; в корзину попадает последний замер. Пустые корзины
+        получают последнее значение не старше max_fill секунд - ряды, которые
+        deadband-фильтр не писал, остаются в анализе.
+        """
+        _import_numpy()
+        # Перед окном - запас корзин, из которых значения переносятся вперед
+        pad = -(-self.max_fill // self.step)
+        start = self.window_start(now) - pad * self.step
+        width = pad + self.history
+        ids = np.asarray(sorted(server_ids), dtype=np.int64)
+        matrix = np.full((len(ANOMALY_METRICS), len(ids), width), np.nan)
+        data = np.array([tuple(row) for row in rows], dtype=float).reshape(-1, 5)
+        if len(data) and len(ids):
+            rows_sid = data[:, 0].astype(np.int64)
+            position = np.searchsorted(ids, rows_sid).clip(0, len(ids) - 1)
+            bucket = ((data[:, 1] - start) // self.step).astype(np.int64)
+            keep = (ids[position] == rows_sid) & (bucket >= 0) & (bucket < width)
+            for m in range(len(ANOMALY_METRICS)):
+                matrix[m, position[keep], bucket[keep]] = data[keep, 2 + m]
+        if pad:
+            # Индекс последней заполненной корзины на каждую позицию
+            filled = np.maximum.accumulate(np.where(~np.isnan(matrix), np.arange(width), -1), axis=-1)
+            within = (filled >= 0) & ((np.arange(width) - filled) * self.step <= self.max_fill)
+            matrix = np.where(within, np.take_along_axis(matrix, filled.clip(0), axis=-1), np.nan)
+        return ids, matrix[..., pad:]
+
+    def detect(self, ids, matrix, groups):
+        """
+        Оценки для тензора из build_matrix: один векторный проход по всем
+        серверам и метрикам. groups - группа сравнения для каждого id.
+        Возвращает список словарей по (сервер, метрика) со свежим значением.
+        """
+        _import_numpy()
+        if not len(ids):
+            return []
+        valid = ~np.isnan(matrix)
+        # Текущее значение - последняя заполненная корзина, не старше двух шагов
+        last_index = np.where(valid, np.arange(self.history), -1).max(axis=-1)
+        fresh = last_index >= self.history - 2
+        current = np.take_along_axis(matrix, last_index.clip(0)[..., None], axis=-1)[..., 0]
+
+        # История - все корзины до текущей
+        before = np.arange(self.history) < last_index[..., None]
+        history = np.where(before & valid, matrix, np.nan)
+        count = (before & valid).sum(axis=-1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.nansum(history, axis=-1) / count
+            variance = np.nansum((history - mean[..., None]) ** 2, axis=-1) / count
+        std = np.maximum(np.sqrt(variance), self.min_std)
+        self_z = (current - mean) / std
+
+        # EWMA истории: веса (1 - a)^возраст, нормированные по заполненным корзинам
+        age = (last_index[..., None] - 1 - np.arange(self.history)).clip(0)
+        weights = np.where(before & valid, (1 - self.ewma_alpha) ** age, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ewma = np.nansum(np.nan_to_num(history) * weights, axis=-1) / weights.sum(axis=-1)
+        ewma_z = (current - ewma) / std
+
+        # Отклонение от группы: медиана и MAD текущих значений
+        peer_z = np.full(current.shape, np.nan)
+        groups = np.asarray(groups)
+        names, sizes = np.unique(groups, return_counts=True)
+        fleet = np.ones(len(ids), dtype=bool)
+        for name, size in zip(names, sizes):
+            members = groups == name
+            # Малая группа оценивается относительно всего парка, но пишутся только ее серверы
+            self._peer_scores(current, fresh, members, members if size >= self.min_group else fleet, peer_z)
+
+        own = (count >= self.min_history) & (np.abs(self_z) > self.z_threshold) & (np.abs(ewma_z) > self.z_threshold)
+        peers = np.nan_to_num(np.abs(peer_z)) > self.peer_threshold
+        flagged = fresh & (own | peers)
+        score = np.fmax(np.where(count >= self.min_history, np.minimum(np.abs(self_z), np.abs(ewma_z)), np.nan),
+                        np.abs(peer_z))
+
+        results = []
+        for m, metric in enumerate(ANOMALY_METRICS):
+            for s in np.flatnonzero(fresh[m]):
+                results.append({
+                    'server_id': int(ids[s]),
+                    'metric': metric,
+                    'value': round(float(current[m, s]), 2),
+                    'baseline': _rounded(ewma[m, s]),
+                    'self_z': _rounded(self_z[m, s]) if count[m, s] >= self.min_history else None,
+                    'ewma_z': _rounded(ewma_z[m, s]) if count[m, s] >= self.min_history else None,
+                    'peer_z': _rounded(peer_z[m, s]),
+                    'score': _rounded(score[m, s]),
+                    'flagged': bool(flagged[m, s])
+                })
+        return results
+
+    def _peer_scores(self, current, fresh, targets, reference, out):
+        """Робастная z-оценка серверов targets относительно серверов reference"""
+        for m in range(current.shape[0]):
+            pool = current[m, reference & fresh[m]]
+            if len(pool) < self.min_group:
+                continue
+            median = np.median(pool)
+            mad = np.median(np.abs(pool - median)) * 1.4826
+            scale = max(mad, self.min_std)
+            out[m, targets] = (current[m, targets] - median) / scale
+
+
+def _rounded(value):
+    value = float(value)
+    return None if value != value else round(value, 2)
@@ -0,0 +1,138 @@
+"""
+Онлайн-резервное копирование monitoring.db через backup API SQLite.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+BACKUP_EXTENSION = '.db'
+INTEGRITY_CHECKS = ('quick', 'full', 'none')
+
+
+class BackupManager:
+    """
+    Копия базы небольшими порциями страниц с паузами между ними.
+    Копирование идет внутри одной читающей транзакции: в режиме WAL она
+    не мешает записи планировщика и фиксирует согласованный снимок, поэтому
+    запись в базу во время копирования не перезапускает его.
+    """
+
+    def __init__(self, db_path, directory=None, keep=7, interval=86400, pages=256, pause=0.02,
+                 integrity='quick'):
+        if integrity not in INTEGRITY_CHECKS:
+            raise ValueError(f'Проверка целостности должна быть одной из: {", ".join(INTEGRITY_CHECKS)}')
+        self.db_path = db_path
+        self.directory = directory or os.path.join(os.path.dirname(db_path), 'backups')
+        self.keep = keep            # сколько копий хранить
+        self.interval = interval    # секунд между плановыми копиями (0 - только вручную)
+        self.pages = pages          # страниц за шаг
+        self.pause = pause          # пауза между шагами, с
+        self.integrity = integrity
+        self._lock = threading.Lock()
+        self._thread = None
+        self.last_result = None
+        self.last_started = self._newest_backup_time()
+
+    def _newest_backup_time(self):
+        backups = self.list_backups()
+        return backups[0]['created'] if backups else 0
+
+    def is_due(self, now=None):
+        now = time.time() if now is None else now
+        return bool(self.interval) and not self.is_running() and now - self.last_started >= self.interval
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def run_async(self):
+        """Копия в фоновом потоке; False, если копирование уже идет"""
+        with self._lock:
+            if self.is_running():
+                return False
+            self.last_started = time.time()
+            self._thread = threading.Thread(target=self.run, name='backup', daemon=True)
+            self._thread.start()
+            return True
+
+    def run(self):
+        """Копия с проверкой целостности и ротацией; возвращает описание результата"""
+        self.last_started = time.time()
+        started = time.perf_counter()
+        os.makedirs(self.directory, exist_ok=True)
+        name = time.strftime('monitoring-%Y%m%d-%H%M%S', time.gmtime()) + BACKUP_EXTENSION
+        path = os.path.join(self.directory, name)
+        partial = path + '.partial'
+        steps = 0
+        try:
+            source = sqlite3.connect(self.db_path, isolation_level=None)
+            target = sqlite3.connect(partial)
+            try:
+                # Снимок базы на момент начала: одна читающая транзакция на все шаги
+                source.execute('BEGIN')
+                source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+
+                def progress(status, remaining, total):
+                    nonlocal steps
+                    steps += 1
+                    if remaining and self.pause:
+                        time.sleep(self.pause)
+
+                source.backup(target, pages=self.pages, progress=progress)
+                source.execute('COMMIT')
+                integrity = self._check(target)
+            finally:
+                target.close()
+                source.close()
+            if integrity not in ('ok', 'skipped'):
+                raise sqlite3.DatabaseError(f'Проверка целостности копии: {integrity}')
+            os.replace(partial, path)
+            self.last_result = {
+                'success': True,
+                'name': name,
+                'size': os.path.getsize(path),
+                'steps': steps,
+                'integrity': integrity,
+                'duration': round(time.perf_counter() - started, 2),
+                'finished': int(time.time())
+            }
+            self._rotate()
+        except Exception as e:
+            if os.path.exists(partial):
+                os.remove(partial)
+            self.last_result = {'success': False, 'error': str(e), 'finished': int(time.time())}
+        return self.last_result
+
+    def _check(self, conn):
+        if self.integrity == 'none':
+            return 'skipped'
+        pragma = 'quick_check' if self.integrity == 'quick' else 'integrity_check'
+        rows = conn.execute(f'PRAGMA {pragma}').fetchall()
+        return '; '.join(row[0] for row in rows)
+
+    def _rotate(self):
+        for backup in self.list_backups()[self.keep:]:
+            os.remove(os.path.join(self.directory, backup['name']))
+
+    def list_backups(self):
+        """Готовые копии, новые первыми"""
+        if not os.path.isdir(self.directory):
+            return []
+        names = sorted((n for n in os.listdir(self.directory) if n.endswith(BACKUP_EXTENSION)), reverse=True)
+        backups = []
+        for n in names:
+            stat = os.stat(os.path.join(self.directory, n))
+            backups.append({'name': n, 'size': stat.st_size, 'created': int(stat.st_mtime)})
+        return backups
+
+    def get_status(self):
+        return {
+            'running': self.is_running(),
+            'interval': self.interval,
+            'keep': self.keep,
+            'pages': self.pages,
+            'pause': self.pause,
+            'integrity': self.integrity,
+            'last_result': self.last_result,
+            'backups': self.list_backups()
+        }
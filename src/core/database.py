@@ -3,78 +3,316 @@
 """
 import sqlite3
 import os
+import json
+import time
+import threading
 from datetime import datetime
 
+from .metrics_buffer import RecentMetricsStore, format_timestamp, parse_timestamp
+from .series_store import BlockSeriesStore
+from .labelled_series import LabelledSeriesStore
+from .series_codec import decode_block
+from .deadband import fill_gaps
+from .inventory import InventoryCache, ServerSummary, SchedulerTarget, PUBLIC_FIELDS, TARGET_FIELDS, replace_record
+from .instrumentation import telemetry
+from .rollups import FleetRollups, ROLLUP_METRICS, decode_row
+from .query_cache import QueryCache
+
+SERIES_FORMATS = ('rows', 'blocks')
+ALERT_RULE_FIELDS = ('name', 'metric', 'aggregate', 'window', 'operator', 'threshold',
+                     'clear_threshold', 'for_windows', 'severity', 'server_id', 'enabled')
+
+
+def _statement_name(sql):
+    """Имя гистограммы по первому слову запроса: db.select, db.insert, ..."""
+    words = sql.split(None, 1)
+    return 'db.' + (words[0].lower() if words else 'empty')
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Соединение SQLite с замером времени запросов и фиксаций"""
+
+    def execute(self, sql, *args):
+        with telemetry.timer(_statement_name(sql)):
+            return super().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        with telemetry.timer(_statement_name(sql)):
+            return super().executemany(sql, *args)
+
+    def commit(self):
+        with telemetry.timer('db.commit'):
+            return super().commit()
+
+
+def metrics_cursor(row):
+    """Курсор страницы истории по последней строке: '<unix-время>:<id>' (id - только для строк)"""
+    ts = parse_timestamp(row['timestamp'])
+    return f"{ts}:{row['id']}" if row.get('id') is not None else str(ts)
+
+
+def parse_metrics_cursor(cursor):
+    """Курсор в (unix-время, id или None); ValueError для некорректного значения"""
+    ts, _, row_id = str(cursor).partition(':')
+    return int(ts), int(row_id) if row_id else None
+
+
+def _add_missing_columns(conn, table, columns):
+    existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+    for name, declaration in columns:
+        if name not in existing:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {declaration}')
+
+
+def _migration_base_schema(conn):
+    """1: серверы, метрики, блоки рядов; дополняет базы, созданные до учета версий"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS servers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            ip TEXT NOT NULL,
+            port INTEGER DEFAULT 22,
+            username TEXT DEFAULT 'root',
+            password TEXT,
+            ssh_key_path TEXT,
+            ssh_key_content TEXT,
+            jump_host TEXT,
+            description TEXT,
+            status TEXT DEFAULT 'unknown',
+            last_check TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Колонки, которых нет в старых базах
+    _add_missing_columns(conn, 'servers', [
+        ('password', 'TEXT'),
+        ('ssh_key_path', 'TEXT'),
+        ('ssh_key_content', 'TEXT'),
+        ('jump_host', 'TEXT'),
+    ])
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            server_id INTEGER,
+            cpu_percent REAL,
+            memory_percent REAL,
+            disk_percent REAL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (server_id) REFERENCES servers (id)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_metrics_server_time ON metrics (server_id, timestamp)')
+    BlockSeriesStore.create_schema(conn)
+
+
+def _migration_alerts(conn):
+    """2: правила оповещений и журнал срабатываний; правила вместо порогов в коде"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS alert_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            aggregate TEXT NOT NULL DEFAULT 'avg',
+            window INTEGER NOT NULL DEFAULT 300,
+            operator TEXT NOT NULL DEFAULT '>',
+            threshold REAL NOT NULL,
+            clear_threshold REAL NOT NULL,
+            for_windows INTEGER NOT NULL DEFAULT 1,
+            severity TEXT NOT NULL DEFAULT 'warning',
+            server_id INTEGER,
+            enabled INTEGER NOT NULL DEFAULT 1
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS alert_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            rule_id INTEGER NOT NULL,
+            server_id INTEGER NOT NULL,
+            state TEXT NOT NULL,
+            value REAL,
+            timestamp INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_alert_events_time ON alert_events (timestamp)')
+    # Прежние пороги (CPU > 90, память > 95) - за окно 5 минут и с гистерезисом
+    conn.executemany('''
+        INSERT INTO alert_rules (name, metric, aggregate, window, operator, threshold, clear_threshold, for_windows, severity)
+        VALUES (?, ?, 'avg', 300, '>', ?, ?, 1, 'warning')
+    ''', [('Высокая загрузка CPU', 'cpu', 90, 80), ('Мало свободной памяти', 'memory', 95, 90)])
+
+
+def _migration_anomalies(conn):
+    """3: последние результаты поиска аномалий, по строке на сервер и метрику"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS server_anomalies (
+            server_id INTEGER NOT NULL,
+            metric TEXT NOT NULL,
+            value REAL,
+            baseline REAL,
+            self_z REAL,
+            ewma_z REAL,
+            peer_z REAL,
+            score REAL,
+            flagged INTEGER NOT NULL DEFAULT 0,
+            detected_at INTEGER NOT NULL,
+            PRIMARY KEY (server_id, metric)
+        )
+    ''')
+
+
+def _migration_fleet_rollups(conn):
+    """4: агрегаты парка по 5-минутным корзинам для тепловой карты"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS fleet_rollups (
+            bucket_start INTEGER PRIMARY KEY,
+            servers BLOB NOT NULL,
+            counts BLOB NOT NULL,
+            cpu BLOB NOT NULL,
+            memory BLOB NOT NULL,
+            disk BLOB NOT NULL,
+            summary TEXT NOT NULL
+        )
+    ''')
+
+
+def _migration_scheduler_state(conn):
+    """5: состояние планировщика для теплого перезапуска"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS scheduler_settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS scheduler_hosts (
+            server_id INTEGER PRIMARY KEY,
+            next_due REAL NOT NULL,
+            failures INTEGER NOT NULL DEFAULT 0,
+            last_check INTEGER,
+            sample_ts INTEGER,
+            cpu REAL,
+            memory REAL,
+            disk REAL
+        )
+    ''')
+
+
+def _migration_adaptive_intervals(conn):
+    """6: собственный интервал опроса хоста (адаптивный опрос)"""
+    _add_missing_columns(conn, 'scheduler_hosts', [('interval', 'REAL')])
+
+
+def _migration_server_versions(conn):
+    """7: версия строки сервера - растет при каждом изменении (ключ кэша карточек)"""
+    _add_missing_columns(conn, 'servers', [('version', 'INTEGER NOT NULL DEFAULT 0')])
+
+
+def _migration_labelled_series(conn):
+    """8: диски по точкам монтирования и сетевые интерфейсы - словарь меток и высокая таблица"""
+    LabelledSeriesStore.create_schema(conn)
+
+
+# Миграции схемы по порядку; номер миграции = PRAGMA user_version после ее применения.
+# Новые изменения схемы только добавляются в конец списка.
+MIGRATIONS = [
+    _migration_base_schema,
+    _migration_alerts,
+    _migration_anomalies,
+    _migration_fleet_rollups,
+    _migration_scheduler_state,
+    _migration_adaptive_intervals,
+    _migration_server_versions,
+    _migration_labelled_series,
+]
+
+
 class DatabaseManager:
-    def __init__(self):
-        self.db_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'monitoring.db')
+    def __init__(self, recent_capacity=256, series_format='rows', block_seconds=7200,
+                 deadband=None, status_heartbeat=300, db_path=None, query_cache=None):
+        self.db_path = db_path or os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'monitoring.db')
+        # Последние замеры каждого сервера в памяти: свежие окна читаются без SQLite
+        self.recent = RecentMetricsStore(recent_capacity)
+        # 'rows' - строка на замер в metrics, 'blocks' - сжатые блоки в metric_blocks
+        if series_format not in SERIES_FORMATS:
+            raise ValueError(f'Неизвестный формат хранения метрик: {series_format}')
+        self.series_format = series_format
+        self.series = BlockSeriesStore(block_seconds)
+        # Разделы и интерфейсы: словарь меток + высокая таблица labelled_samples
+        self.labelled = LabelledSeriesStore(max_gap=deadband.max_gap if deadband else None)
+        # DeadbandFilter: неизменившиеся замеры не пишутся (None - писать все)
+        self.deadband = deadband
+        # Неизменный статус перезаписывается не чаще раза в status_heartbeat секунд
+        self.status_heartbeat = status_heartbeat
+        self._status_cache = {}  # server_id -> (status, ts записи)
+        self._status_lock = threading.Lock()
+        # Кэш проекций списка серверов; сбрасывается при изменении инвентаря
+        self.inventory = InventoryCache()
+        # Версия принятых данных (растет с каждой проверкой) и время последней проверки
+        self.ingest_version = 0
+        self._last_seen = {}
+        self._persisted_latest = {}  # последний замер из базы для серверов без буфера
+        # Кэш запросов истории; запись сервера устаревает с его следующим замером
+        self.query_cache = query_cache if query_cache is not None else QueryCache()
+        self._watermarks = {}  # server_id -> число принятых замеров
+        # Агрегаты парка по корзинам, пишутся в fleet_rollups вызовом flush_rollups()
+        self.rollups = FleetRollups()
         self._init_db()
     
+    def _connect(self):
+        return sqlite3.connect(self.db_path, factory=InstrumentedConnection)
+    
     def _init_db(self):
-        """Инициализация базы данных"""
+        """Инициализация базы данных: миграции по PRAGMA user_version"""
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         
-        with sqlite3.connect(self.db_path) as conn:
-            # Создаем таблицу серверов
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS servers (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    ip TEXT NOT NULL,
-                    port INTEGER DEFAULT 22,
-                    username TEXT DEFAULT 'root',
-                    password TEXT,
-                    ssh_key_path TEXT,
-                    ssh_key_content TEXT,
-                    description TEXT,
-                    status TEXT DEFAULT 'unknown',
-                    last_check TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Добавляем новые колонки если их нет
-            try:
-                conn.execute('ALTER TABLE servers ADD COLUMN password TEXT')
-            except sqlite3.OperationalError:
-                pass  # Колонка уже существует
-                
-            try:
-                conn.execute('ALTER TABLE servers ADD COLUMN ssh_key_path TEXT')
-            except sqlite3.OperationalError:
-                pass
-                
-            try:
-                conn.execute('ALTER TABLE servers ADD COLUMN ssh_key_content TEXT')
-            except sqlite3.OperationalError:
-                pass
-
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS metrics (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    server_id INTEGER,
-                    cpu_percent REAL,
-                    memory_percent REAL,
-                    disk_percent REAL,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (server_id) REFERENCES servers (id)
-                )
-            ''')
+        with self._connect() as conn:
+            # WAL: чтение (API, резервная копия) не блокирует запись планировщика
+            conn.execute('PRAGMA journal_mode = WAL')
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version >= len(MIGRATIONS):
+                return  # Схема актуальна: при старте только одно чтение заголовка
+            for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                migration(conn)
+                conn.execute(f'PRAGMA user_version = {number}')
             conn.commit()
     
     def get_all_servers(self):
         """Получение всех серверов"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.execute('SELECT * FROM servers ORDER BY id')
             return [dict(row) for row in cursor.fetchall()]
     
+    def _select_records(self, record_type, fields):
+        with self._connect() as conn:
+            cursor = conn.execute(f'SELECT {", ".join(fields)} FROM servers ORDER BY id')
+            return tuple(record_type._make(row) for row in cursor)
+    
+    def get_public_servers(self):
+        """Список серверов без учетных данных (публичные страницы, API)"""
+        return self.inventory.get('public', lambda: self._select_records(ServerSummary, PUBLIC_FIELDS))
+    
+    def _server_ids(self):
+        """Множество id серверов инвентаря"""
+        return self.inventory.get('ids', lambda: frozenset(server.id for server in self.get_public_servers()))
+    
+    def get_scheduler_targets(self):
+        """Серверы с параметрами подключения для планировщика"""
+        return self.inventory.get('targets', lambda: self._select_records(SchedulerTarget, TARGET_FIELDS))
+    
+    def count_servers(self):
+        """Количество серверов"""
+        def load():
+            with self._connect() as conn:
+                return conn.execute('SELECT COUNT(*) FROM servers').fetchone()[0]
+        return self.inventory.get('count', load)
+    
     def add_server(self, server_data):
         """Добавление сервера"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.execute('''
-                INSERT INTO servers (name, ip, port, username, password, ssh_key_path, ssh_key_content, description)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                INSERT INTO servers (name, ip, port, username, password, ssh_key_path, ssh_key_content, jump_host, description)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 server_data['name'],
                 server_data['ip'],
@@ -83,14 +321,38 @@ class DatabaseManager:
                 server_data.get('password'),
                 server_data.get('ssh_key_path'),
                 server_data.get('ssh_key_content'),
+                server_data.get('jump_host'),
                 server_data['description']
             ))
             conn.commit()
-            return cursor.lastrowid
+        self.inventory.invalidate()
+        return cursor.lastrowid
+    
+    def add_servers(self, servers):
+        """Добавление списка серверов одной транзакцией"""
+        with self._connect() as conn:
+            conn.executemany('''
+                INSERT INTO servers (name, ip, port, username, password, ssh_key_path, ssh_key_content, jump_host, description, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(
+                server['name'],
+                server['ip'],
+                server['port'],
+                server['username'],
+                server.get('password'),
+                server.get('ssh_key_path'),
+                server.get('ssh_key_content'),
+                server.get('jump_host'),
+                server.get('description', ''),
+                server.get('status', 'unknown')
+            ) for server in servers])
+            conn.commit()
+        self.inventory.invalidate()
+        return len(servers)
     
     def get_server(self, server_id):
         """Получение сервера по ID"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.execute('SELECT * FROM servers WHERE id = ?', (server_id,))
             row = cursor.fetchone()
@@ -98,60 +360,541 @@ class DatabaseManager:
     
     def update_server(self, server_id, data):
         """Обновление сервера"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             conn.execute('''
                 UPDATE servers 
-                SET name=?, ip=?, port=?, username=?, description=?
+                SET name=?, ip=?, port=?, username=?, jump_host=?, description=?, version=version+1
                 WHERE id=?
-            ''', (data['name'], data['ip'], data['port'], data['username'], data['description'], server_id))
+            ''', (data['name'], data['ip'], data['port'], data['username'], data.get('jump_host'), data['description'], server_id))
             conn.commit()
+        self.inventory.invalidate()
     
     def delete_server(self, server_id):
         """Удаление сервера"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             conn.execute('DELETE FROM servers WHERE id = ?', (server_id,))
+            conn.execute('DELETE FROM alert_events WHERE server_id = ?', (server_id,))
+            conn.execute('DELETE FROM alert_rules WHERE server_id = ?', (server_id,))
+            conn.execute('DELETE FROM server_anomalies WHERE server_id = ?', (server_id,))
+            conn.execute('DELETE FROM scheduler_hosts WHERE server_id = ?', (server_id,))
+            self.series.delete_server(conn, server_id)
+            self.labelled.delete_server(conn, server_id)
             conn.commit()
+        self.recent.drop(server_id)
+        self.query_cache.clear()
+        self._forget_server_state(server_id)
+        self.inventory.invalidate()
+    
+    def _forget_server_state(self, server_id):
+        """Сброс закэшированного статуса и состояния deadband"""
+        with self._status_lock:
+            self._status_cache.pop(server_id, None)
+            self._last_seen.pop(server_id, None)
+        self._persisted_latest.pop(server_id, None)
+        if self.deadband:
+            self.deadband.forget(server_id)
+    
+    def _status_needs_write(self, server_id, status, now):
+        """(нужна ли запись, изменился ли статус): запись - при изменении или по истечении heartbeat"""
+        with self._status_lock:
+            cached = self._status_cache.get(server_id)
+        changed = cached is None or cached[0] != status
+        return changed or now - cached[1] >= self.status_heartbeat, changed
     
     def update_server_status(self, server_id, status, metrics=None):
-        """Обновление статуса и метрик сервера"""
-        with sqlite3.connect(self.db_path) as conn:
-            if metrics:
-                conn.execute('''
-                    UPDATE servers 
-                    SET status=?, last_check=CURRENT_TIMESTAMP
-                    WHERE id=?
-                ''', (status, server_id))
+        """Обновление статуса и метрик сервера (без холостых записей)"""
+        now = int(time.time())
+        with self._status_lock:
+            self.ingest_version += 1
+            self._last_seen[server_id] = now
+        write_status, status_changed = self._status_needs_write(server_id, status, now)
+        values = None
+        write_metrics = False
+        labelled = None
+        labelled_state = None
+        if metrics:
+            values = (metrics.get('cpu', 0), metrics.get('memory', 0), metrics.get('disk', 0))
+            write_metrics = self.deadband is None or self.deadband.should_write(server_id, now, values)
+            if metrics.get('mounts') or metrics.get('interfaces'):
+                # Разделы и интерфейсы проходят свой deadband с тем же max_gap
+                labelled, labelled_state = self.labelled.samples(server_id, now, metrics.get('mounts') or {},
+                                                                 metrics.get('interfaces') or {})
+        
+        row_id = None
+        created_keys = None
+        checked = format_timestamp(now)
+        if write_status or write_metrics or labelled:
+            with self._connect() as conn:
+                if write_status:
+                    # Версия строки растет только со сменой статуса: heartbeat не перерисовывает карточки
+                    conn.execute('''
+                        UPDATE servers 
+                        SET status=?, last_check=?, version=version+?
+                        WHERE id=?
+                    ''', (status, checked, int(status_changed), server_id))
                 
-                # Сохраняем метрики
-                conn.execute('''
-                    INSERT INTO metrics (server_id, cpu_percent, memory_percent, disk_percent)
-                    VALUES (?, ?, ?, ?)
-                ''', (server_id, metrics.get('cpu', 0), metrics.get('memory', 0), metrics.get('disk', 0)))
-            else:
-                conn.execute('''
-                    UPDATE servers 
-                    SET status=?, last_check=CURRENT_TIMESTAMP
-                    WHERE id=?
-                ''', (status, server_id))
+                # Сохраняем метрики (время задаем явно, чтобы совпадало с буфером в памяти)
+                if write_metrics:
+                    if self.series_format == 'blocks':
+                        self.series.append(conn, server_id, now, values)
+                    else:
+                        row_id = conn.execute('''
+                            INSERT INTO metrics (server_id, cpu_percent, memory_percent, disk_percent, timestamp)
+                            VALUES (?, ?, ?, ?, ?)
+                        ''', (server_id, *values, format_timestamp(now))).lastrowid
+                if labelled:
+                    created_keys = self.labelled.write(conn, server_id, now, labelled)
+                conn.commit()
+            if created_keys:
+                self.labelled.remember_keys(created_keys)
+            if write_metrics and self.deadband:
+                self.deadband.record(server_id, now, values)
+            
+            if write_status:
+                with self._status_lock:
+                    self._status_cache[server_id] = (status, now)
+                # Статус виден только в публичном списке; повтор того же статуса (heartbeat)
+                # список не сбрасывает, а обновляет в нем время проверки одной записи
+                if status_changed:
+                    self.inventory.invalidate('public')
+                else:
+                    self.inventory.patch('public', lambda servers: replace_record(servers, server_id, last_check=checked))
+        if labelled_state is not None:
+            self.labelled.remember_written(server_id, now, labelled_state)
+        
+        # В памяти храним каждый замер, даже не записанный на диск
+        if metrics:
+            self.recent.append(server_id, row_id, now, *values)
+            self.rollups.add(server_id, now, values)
+            # Водяной знак растет после записи: результат, прочитанный до нее, больше не выдается
+            with self._status_lock:
+                self._watermarks[server_id] = self._watermarks.get(server_id, 0) + 1
+    
+    def flush_rollups(self):
+        """Запись накопленных агрегатов парка (после каждого прохода планировщика)"""
+        with self._connect() as conn:
+            written = self.rollups.flush(conn)
             conn.commit()
+        return written
+    
+    def get_fleet_heatmap(self, metric='cpu', hours=24, include_matrix=True):
+        """
+        Тепловая карта парка: средние серверов по корзинам и перцентили парка
+        за последние hours часов, одним чтением fleet_rollups.
+        include_matrix=False - только перцентили парка, без матрицы серверов.
+        """
+        column = ROLLUP_METRICS.index(metric)
+        since = self.rollups.bucket_start(int(time.time()) - hours * 3600)
+        with self._connect() as conn:
+            rows = conn.execute('SELECT bucket_start, servers, counts, cpu, memory, disk, summary '
+                                'FROM fleet_rollups WHERE bucket_start >= ? ORDER BY bucket_start',
+                                (since,)).fetchall()
+        servers = self.get_public_servers() if include_matrix else []
+        position = {server.id: n for n, server in enumerate(servers)}
+        matrix = [[None] * len(rows) for _ in servers]
+        buckets = []
+        percentiles = {}
+        for b, row in enumerate(rows):
+            buckets.append(row[0])
+            if include_matrix:
+                ids, _, columns = decode_row(row[1:6])
+                values = columns[column]
+                for n, server_id in enumerate(ids):
+                    if server_id in position:
+                        matrix[position[server_id]][b] = round(values[n], 1)
+            summary = json.loads(row[6]).get(metric, {})
+            for key in summary:
+                percentiles.setdefault(key, [None] * len(rows))[b] = summary[key]
+        return {
+            'metric': metric,
+            'bucket_seconds': self.rollups.bucket_seconds,
+            'buckets': buckets,
+            'servers': [{'id': server.id, 'name': server.name} for server in servers],
+            'matrix': matrix if include_matrix else None,
+            'fleet': percentiles
+        }
+    
+    def get_latest_snapshot(self):
+        """
+        Последний замер каждого сервера {server_id: (ts, cpu, memory, disk)}:
+        из буферов в памяти, для остальных - однократно из базы.
+        """
+        latest = self.recent.latest_samples()
+        missing = [server.id for server in self.get_public_servers()
+                   if server.id not in latest and server.id not in self._persisted_latest]
+        if missing:
+            with self._connect() as conn:
+                # Последний замер, сохраненный планировщиком, - одним запросом на всех
+                saved = {row[0]: tuple(row[1:]) for row in conn.execute(
+                    'SELECT server_id, sample_ts, cpu, memory, disk FROM scheduler_hosts WHERE sample_ts IS NOT NULL')}
+                for server_id in missing:
+                    if server_id in saved:
+                        self._persisted_latest[server_id] = saved[server_id]
+                        continue
+                    if self.series_format == 'blocks':
+                        samples = self.series.read_latest(conn, server_id, 1)
+                        sample = samples[0] if samples else None
+                    else:
+                        row = conn.execute('''
+                            SELECT timestamp, cpu_percent, memory_percent, disk_percent FROM metrics
+                            WHERE server_id = ? ORDER BY timestamp DESC LIMIT 1
+                        ''', (server_id,)).fetchone()
+                        sample = (parse_timestamp(row[0]), row[1], row[2], row[3]) if row else None
+                    self._persisted_latest[server_id] = sample
+        for server_id, sample in self._persisted_latest.items():
+            if sample and server_id not in latest:
+                latest[server_id] = sample
+        return latest
+    
+    def get_last_checks(self):
+        """Время последней проверки серверов {server_id: Unix-время}"""
+        with self._status_lock:
+            checks = dict(self._last_seen)
+        for server in self.get_public_servers():
+            if server.id not in checks and server.last_check:
+                checks[server.id] = parse_timestamp(server.last_check)
+        return checks
     
-    def get_server_metrics(self, server_id, limit=100):
-        """Получение истории метрик сервера"""
-        with sqlite3.connect(self.db_path) as conn:
+    def get_labelled_series(self, server_id, start, end, metric=None):
+        """Ряды разделов и интерфейсов сервера за [start, end]: {metric: {label: [[ts, value], ...]}}"""
+        with self._connect() as conn:
+            return self.labelled.read_range(conn, server_id, start, end, metric)
+    
+    def get_latest_labelled(self, server_id):
+        """Последний замер разделов и интерфейсов: ({metric: {label: value}}, ts)"""
+        with self._connect() as conn:
+            return self.labelled.read_latest(conn, server_id)
+    
+    def get_server_metrics(self, server_id, limit=100, before=None):
+        """
+        Получение истории метрик сервера, от новых к старым (свежее окно - из памяти).
+        before - курсор metrics_cursor() последней строки предыдущей страницы;
+        страница читается по индексу (server_id, timestamp) без OFFSET,
+        поэтому глубокие страницы стоят столько же, сколько первая.
+        """
+        if before is not None:
+            cursor = parse_metrics_cursor(before)
+            return self._cached(server_id, ('page', limit, cursor),
+                                lambda: self._query_server_metrics(server_id, limit, cursor))
+        rows = self.recent.get_latest(server_id, limit, lambda n: self._query_server_metrics(server_id, n),
+                                      known=server_id in self._server_ids())
+        if rows is not None:
+            return rows
+        return self._cached(server_id, ('latest', limit), lambda: self._query_server_metrics(server_id, limit))
+    
+    @staticmethod
+    def _sample_to_row(server_id, sample):
+        """Замер из блока в формате строки таблицы metrics"""
+        ts, cpu, memory, disk = sample
+        return {
+            'id': None,
+            'server_id': server_id,
+            'cpu_percent': cpu,
+            'memory_percent': memory,
+            'disk_percent': disk,
+            'timestamp': format_timestamp(ts)
+        }
+    
+    def _query_server_metrics(self, server_id, limit, before=None):
+        """Чтение истории метрик из SQLite; before - (unix-время, id) из курсора"""
+        with self._connect() as conn:
+            if self.series_format == 'blocks':
+                samples = self.series.read_latest(conn, server_id, limit,
+                                                  before=before[0] if before else None)
+                return [self._sample_to_row(server_id, sample) for sample in samples]
+            
+            where = ''
+            params = [server_id]
+            if before is not None:
+                ts, row_id = before
+                if row_id is None:
+                    where = 'AND timestamp < ?'
+                    params.append(format_timestamp(ts))
+                else:
+                    # Диапазон по индексу, id разделяет замеры одной секунды
+                    where = 'AND timestamp <= ? AND (timestamp < ? OR id < ?)'
+                    params.extend([format_timestamp(ts), format_timestamp(ts), row_id])
+            params.append(limit)
             conn.row_factory = sqlite3.Row
-            cursor = conn.execute('''
+            cursor = conn.execute(f'''
                 SELECT * FROM metrics 
-                WHERE server_id = ? 
-                ORDER BY timestamp DESC 
+                WHERE server_id = ? {where}
+                ORDER BY timestamp DESC, id DESC 
                 LIMIT ?
-            ''', (server_id, limit))
+            ''', params)
             return [dict(row) for row in cursor.fetchall()]
     
+    def get_metrics_range(self, server_id, start, end, step=None):
+        """
+        Метрики сервера за период [start, end] (Unix-время), по возрастанию.
+        С шагом step пропуски, отброшенные deadband-фильтром, заполняются
+        последним записанным значением (такие точки помечены implied).
+        """
+        if not step:
+            # Конец позже последнего замера не меняет результат: такие запросы делят одну запись кэша
+            with self._status_lock:
+                open_end = end >= self._last_seen.get(server_id, end + 1)
+            return self._cached(server_id, ('range', start, None if open_end else end),
+                                lambda: self._query_metrics_range(server_id, start, end))
+        return self._cached(server_id, ('range', start, end, step),
+                            lambda: self._fill_metrics_range(server_id, start, end, step))
+    
+    def _fill_metrics_range(self, server_id, start, end, step):
+        max_gap = self.deadband.max_gap if self.deadband else step
+        rows = self._query_metrics_range(server_id, start - max_gap, end)
+        points = [(parse_timestamp(row['timestamp']), row) for row in rows]
+        filled = []
+        for ts, row in fill_gaps(points, start, end, step, max_gap):
+            filled.append(dict(row, timestamp=format_timestamp(ts),
+                               implied=format_timestamp(ts) != row['timestamp']))
+        return filled
+    
+    def _cached(self, server_id, shape, load):
+        """
+        Результат load() через кэш запросов. Выдается общий объект:
+        вызывающий код не должен изменять возвращенные строки.
+        """
+        with self._status_lock:
+            watermark = self._watermarks.get(server_id, 0)
+        hit, value = self.query_cache.get((server_id, shape), watermark)
+        if not hit:
+            value = load()
+            self.query_cache.put((server_id, shape), watermark, value)
+        return value
+    
+    def _query_metrics_range(self, server_id, start, end):
+        """Чтение метрик за период из SQLite"""
+        with self._connect() as conn:
+            if self.series_format == 'blocks':
+                samples = self.series.read_range(conn, server_id, start, end)
+                return [self._sample_to_row(server_id, sample) for sample in samples]
+            
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute('''
+                SELECT * FROM metrics 
+                WHERE server_id = ? AND timestamp BETWEEN ? AND ?
+                ORDER BY timestamp, id
+            ''', (server_id, format_timestamp(start), format_timestamp(end)))
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def iter_metrics(self, server_ids=None, start=None, end=None, batch_size=1000, unix_time=False):
+        """
+        Потоковое чтение истории: кортежи (server_id, timestamp, cpu, memory, disk)
+        по серверу и времени. Память не зависит от объема выгрузки.
+        unix_time=True - время целым Unix-временем вместо строки.
+        """
+        conditions = []
+        params = []
+        if server_ids:
+            conditions.append(f'server_id IN ({", ".join("?" * len(server_ids))})')
+            params.extend(server_ids)
+        
+        conn = self._connect()
+        try:
+            if self.series_format == 'blocks':
+                if start is not None:
+                    conditions.append('block_end >= ?')
+                    params.append(start)
+                if end is not None:
+                    conditions.append('block_start <= ?')
+                    params.append(end)
+                where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+                cursor = conn.execute(f'SELECT server_id, data FROM metric_blocks {where} ORDER BY server_id, block_start', params)
+                for server_id, data in cursor:
+                    for ts, cpu, memory, disk in decode_block(data):
+                        if (start is None or ts >= start) and (end is None or ts <= end):
+                            yield (server_id, ts if unix_time else format_timestamp(ts), cpu, memory, disk)
+                return
+            
+            if start is not None:
+                conditions.append('timestamp >= ?')
+                params.append(format_timestamp(start))
+            if end is not None:
+                conditions.append('timestamp <= ?')
+                params.append(format_timestamp(end))
+            where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+            # Перевод в Unix-время силами SQLite, без strptime на каждую строку
+            column = "CAST(strftime('%s', timestamp) AS INTEGER)" if unix_time else 'timestamp'
+            cursor = conn.execute(f'''
+                SELECT server_id, {column}, cpu_percent, memory_percent, disk_percent
+                FROM metrics {where}
+                ORDER BY server_id, timestamp
+            ''', params)
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                yield from batch
+        finally:
+            conn.close()
+    
+    def convert_metrics_to_blocks(self, delete_rows=False):
+        """
+        Перенос истории из таблицы metrics в сжатые блоки.
+        После delete_rows=True место в файле освобождает VACUUM.
+        """
+        converted = 0
+        with self._connect() as conn:
+            server_ids = [row[0] for row in conn.execute('SELECT DISTINCT server_id FROM metrics')]
+            for server_id in server_ids:
+                cursor = conn.execute('''
+                    SELECT timestamp, cpu_percent, memory_percent, disk_percent FROM metrics
+                    WHERE server_id = ? ORDER BY timestamp, id
+                ''', (server_id,))
+                samples = [(parse_timestamp(ts), cpu or 0, memory or 0, disk or 0)
+                           for ts, cpu, memory, disk in cursor]
+                self.series.write_blocks(conn, server_id, samples)
+                converted += len(samples)
+            if delete_rows:
+                conn.execute('DELETE FROM metrics')
+            conn.commit()
+        self.recent.clear()
+        self.query_cache.clear()
+        return converted
+    
+    def get_scheduler_setting(self, key, default=None):
+        with self._connect() as conn:
+            row = conn.execute('SELECT value FROM scheduler_settings WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+    
+    def set_scheduler_setting(self, key, value):
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO scheduler_settings (key, value) VALUES (?, ?)', (key, str(value)))
+            conn.commit()
+    
+    def load_scheduler_hosts(self):
+        """Сохраненное расписание {server_id: (next_due, failures, last_check, interval)}"""
+        with self._connect() as conn:
+            return {row[0]: tuple(row[1:]) for row in conn.execute(
+                'SELECT server_id, next_due, failures, last_check, interval FROM scheduler_hosts')}
+    
+    def save_scheduler_hosts(self, hosts):
+        """
+        Состояние проверенных хостов одной транзакцией:
+        (server_id, next_due, failures, last_check, interval, sample) -
+        interval - собственный интервал хоста, sample (ts, cpu, memory, disk) или None.
+        Без нового замера сохраненный последний замер не затирается.
+        """
+        if not hosts:
+            return
+        with self._connect() as conn:
+            conn.executemany('''
+                INSERT INTO scheduler_hosts (server_id, next_due, failures, last_check, interval,
+                                             sample_ts, cpu, memory, disk)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (server_id) DO UPDATE SET
+                    next_due = excluded.next_due,
+                    failures = excluded.failures,
+                    last_check = excluded.last_check,
+                    interval = excluded.interval,
+                    sample_ts = COALESCE(excluded.sample_ts, sample_ts),
+                    cpu = COALESCE(excluded.cpu, cpu),
+                    memory = COALESCE(excluded.memory, memory),
+                    disk = COALESCE(excluded.disk, disk)
+            ''', [(server_id, next_due, failures, last_check, interval, *(sample or (None,) * 4))
+                  for server_id, next_due, failures, last_check, interval, sample in hosts])
+            conn.commit()
+    
+    def get_alert_rules(self):
+        """Все правила оповещений"""
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rules = [dict(row) for row in conn.execute('SELECT * FROM alert_rules ORDER BY id')]
+        for rule in rules:
+            rule['enabled'] = bool(rule['enabled'])
+        return rules
+    
+    def add_alert_rule(self, rule):
+        """Добавление проверенного правила (alerts.validate_rule)"""
+        with self._connect() as conn:
+            cursor = conn.execute(f'''
+                INSERT INTO alert_rules ({", ".join(ALERT_RULE_FIELDS)})
+                VALUES ({", ".join("?" * len(ALERT_RULE_FIELDS))})
+            ''', [rule[field] for field in ALERT_RULE_FIELDS])
+            conn.commit()
+            return cursor.lastrowid
+    
+    def update_alert_rule(self, rule_id, rule):
+        with self._connect() as conn:
+            cursor = conn.execute(f'''
+                UPDATE alert_rules SET {", ".join(f"{field} = ?" for field in ALERT_RULE_FIELDS)}
+                WHERE id = ?
+            ''', [rule[field] for field in ALERT_RULE_FIELDS] + [rule_id])
+            conn.commit()
+            return cursor.rowcount > 0
+    
+    def delete_alert_rule(self, rule_id):
+        with self._connect() as conn:
+            cursor = conn.execute('DELETE FROM alert_rules WHERE id = ?', (rule_id,))
+            conn.commit()
+            return cursor.rowcount > 0
+    
+    def add_alert_events(self, events):
+        """Журнал переходов правил (срабатывание/снятие)"""
+        if not events:
+            return
+        with self._connect() as conn:
+            conn.executemany('''
+                INSERT INTO alert_events (rule_id, server_id, state, value, timestamp)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(e['rule_id'], e['server_id'], e['state'], e['value'], e['ts']) for e in events])
+            conn.commit()
+    
+    def get_alert_events(self, limit=100, server_id=None):
+        """Последние переходы правил, от новых к старым"""
+        where = 'WHERE e.server_id = ?' if server_id is not None else ''
+        params = ([server_id] if server_id is not None else []) + [limit]
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(f'''
+                SELECT e.*, r.name AS rule_name, r.severity, s.name AS server_name
+                FROM alert_events e
+                LEFT JOIN alert_rules r ON r.id = e.rule_id
+                LEFT JOIN servers s ON s.id = e.server_id
+                {where}
+                ORDER BY e.timestamp DESC, e.id DESC
+                LIMIT ?
+            ''', params)
+            return [dict(row) for row in cursor]
+    
+    def replace_anomalies(self, results, detected_at):
+        """Результаты прохода поиска аномалий целиком заменяют предыдущие"""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM server_anomalies')
+            conn.executemany('''
+                INSERT INTO server_anomalies (server_id, metric, value, baseline, self_z, ewma_z, peer_z, score, flagged, detected_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(r['server_id'], r['metric'], r['value'], r['baseline'], r['self_z'], r['ewma_z'],
+                   r['peer_z'], r['score'], int(r['flagged']), detected_at) for r in results])
+            conn.commit()
+    
+    def get_anomalies(self, flagged_only=True):
+        """Аномалии по серверам: {server_id: [строки по метрикам]}"""
+        where = 'WHERE a.flagged = 1' if flagged_only else ''
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(f'''
+                SELECT a.*, s.name AS server_name FROM server_anomalies a
+                JOIN servers s ON s.id = a.server_id
+                {where}
+                ORDER BY a.score DESC
+            ''')
+            anomalies = {}
+            for row in cursor:
+                anomalies.setdefault(row['server_id'], []).append(dict(row, flagged=bool(row['flagged'])))
+            return anomalies
+    
     def cleanup_old_metrics(self, days=30):
         """Очистка старых метрик"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             conn.execute('''
                 DELETE FROM metrics 
                 WHERE timestamp < datetime('now', '-{} days')
             '''.format(days))
+            self.series.cleanup(conn, int(time.time()) - days * 86400)
+            self.labelled.cleanup(conn, int(time.time()) - days * 86400)
+            conn.execute('DELETE FROM alert_events WHERE timestamp < ?', (int(time.time()) - days * 86400,))
+            conn.execute('DELETE FROM fleet_rollups WHERE bucket_start < ?', (int(time.time()) - days * 86400,))
             conn.commit()
+        self.recent.clear()
+        self.query_cache.clear()
@@ -0,0 +1,87 @@
+"""
+Фильтр записи метрик по зоне нечувствительности (deadband).
+"""
+import threading
+
+DEFAULT_THRESHOLDS = {'cpu': 2.0, 'memory': 1.0, 'disk': 0.5}
+METRIC_KEYS = ('cpu', 'memory', 'disk')
+# Предел точек в одном ответе с восстановлением пропусков
+MAX_FILL_POINTS = 10000
+
+
+class DeadbandFilter:
+    """
+    Замер пишется, если хотя бы одна метрика ушла от последнего записанного
+    значения дальше порога или с последней записи прошло max_gap секунд.
+    """
+
+    def __init__(self, thresholds=None, max_gap=300):
+        self.thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+        self.max_gap = max_gap
+        self._last = {}  # server_id -> (ts, values)
+        self._lock = threading.Lock()
+        self.written = 0
+        self.skipped = 0
+
+    def should_write(self, server_id, ts, values):
+        """
+        Решение о записи. Записанным замер становится только после record():
+        его вызывают после commit, иначе при откате последующие замеры в пределах
+        порога отбрасывались бы, а fill_gaps восстанавливал бы несохраненное значение.
+        """
+        with self._lock:
+            last = self._last.get(server_id)
+            if last is not None and ts - last[0] < self.max_gap:
+                changed = any(abs(value - prev) > self.thresholds[key]
+                              for key, value, prev in zip(METRIC_KEYS, values, last[1]))
+                if not changed:
+                    self.skipped += 1
+                    return False
+            return True
+
+    def record(self, server_id, ts, values):
+        """Замер зафиксирован в базе"""
+        with self._lock:
+            self._last[server_id] = (ts, tuple(values))
+            self.written += 1
+
+    def forget(self, server_id=None):
+        with self._lock:
+            if server_id is None:
+                self._last.clear()
+            else:
+                self._last.pop(server_id, None)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'thresholds': self.thresholds,
+                'max_gap': self.max_gap,
+                'written': self.written,
+                'skipped': self.skipped
+            }
+
+
+def fill_gaps(rows, start, end, step, max_gap):
+    """
+    Восстановление подразумеваемых значений: шаг step, последнее записанное
+    значение переносится вперед не дальше max_gap секунд.
+    rows - пары (ts, row) по возрастанию ts.
+    ValueError, если шаг меньше секунды или точек больше MAX_FILL_POINTS.
+    """
+    if step < 1:
+        raise ValueError('Шаг step должен быть не меньше 1 секунды')
+    if (end - start) // step + 1 > MAX_FILL_POINTS:
+        raise ValueError(f'Слишком много точек: не больше {MAX_FILL_POINTS} на запрос, увеличьте step')
+    filled = []
+    i = 0
+    current = None
+    t = start
+    while t <= end:
+        while i < len(rows) and rows[i][0] <= t:
+            current = rows[i]
+            i += 1
+        if current is not None and t - current[0] <= max_gap:
+            filled.append((t, current[1]))
+        t += step
+    return filled
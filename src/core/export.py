@@ -0,0 +1,55 @@
+"""
+Потоковая выгрузка истории метрик (NDJSON/CSV, gzip).
+"""
+import csv
+import io
+import json
+import zlib
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+EXPORT_COLUMNS = ('server_id', 'timestamp', 'cpu_percent', 'memory_percent', 'disk_percent')
+CHUNK_SIZE = 64 * 1024
+
+
+def _ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + '\n'
+
+
+def _csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_chunks(rows, fmt):
+    """Строки (server_id, timestamp, cpu, memory, disk) в байтовые куски ~CHUNK_SIZE"""
+    lines = _csv_lines(rows) if fmt == 'csv' else _ndjson_lines(rows)
+    parts = []
+    size = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        parts.append(data)
+        size += len(data)
+        if size >= CHUNK_SIZE:
+            yield b''.join(parts)
+            parts = []
+            size = 0
+    if parts:
+        yield b''.join(parts)
+
+
+def gzip_chunks(chunks, level=6):
+    """Сжатие потока в формат gzip без накопления в памяти"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,61 @@
+"""
+Кэш отрисованных фрагментов страниц (карточек серверов).
+"""
+import threading
+from collections import OrderedDict
+
+
+class FragmentCache:
+    """
+    Фрагмент по ключу (шаблон, server_id) вместе с версией, из которой
+    он отрисован: версией строки сервера и всем, что еще попадает в карточку.
+    Фрагмент другой версии не выдается и заменяется при следующей отрисовке,
+    поэтому на сервер приходится не больше одной записи на шаблон.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (template, server_id) -> (version, markup)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, template, server_id, version, render):
+        """Фрагмент из кэша или результат render() с сохранением"""
+        key = (template, server_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        markup = render()
+        if self.max_entries > 0:
+            with self._lock:
+                self._entries[key] = (version, markup)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return markup
+
+    def discard(self, server_id):
+        """Фрагменты удаленного сервера"""
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == server_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else None
+            }
@@ -0,0 +1,105 @@
+"""
+Самоинструментирование: потоковые гистограммы и счетчики с фиксированной памятью.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Границы корзин: от 0.5 мс с шагом x2 (последняя ~262 с) плюс переполнение
+BUCKET_BOUNDS = tuple(0.0005 * 2 ** k for k in range(20))
+
+
+class StreamingHistogram:
+    """Гистограмма длительностей: счетчики по корзинам, сумма, минимум, максимум"""
+
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q):
+        """Оценка перцентиля линейной интерполяцией внутри корзины"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                low = BUCKET_BOUNDS[i - 1] if i > 0 else 0.0
+                high = BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else self.max
+                estimate = low + (high - low) * (rank - seen) / bucket_count
+                return min(max(estimate, self.min), self.max)
+            seen += bucket_count
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'avg': round(self.total / self.count, 6),
+            'min': round(self.min, 6),
+            'p50': round(self.percentile(0.5), 6),
+            'p90': round(self.percentile(0.9), 6),
+            'p99': round(self.percentile(0.99), 6),
+            'max': round(self.max, 6)
+        }
+
+
+class Telemetry:
+    """Реестр гистограмм и счетчиков процесса"""
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = StreamingHistogram()
+            histogram.observe(seconds)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    @contextmanager
+    def timer(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'uptime': round(time.time() - self.started, 1),
+                'timings': {name: h.summary() for name, h in sorted(self._histograms.items())},
+                'counters': dict(sorted(self._counters.items()))
+            }
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self.started = time.time()
+
+
+# Общий реестр процесса
+telemetry = Telemetry()
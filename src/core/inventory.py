@@ -0,0 +1,106 @@
+"""
+Компактные записи серверов и кэш инвентаря.
+"""
+import threading
+from collections import namedtuple
+
+PUBLIC_FIELDS = ('id', 'name', 'ip', 'port', 'username', 'description', 'status', 'last_check', 'created_at',
+                 'version')
+TARGET_FIELDS = ('id', 'name', 'ip', 'port', 'username', 'password', 'ssh_key_path', 'ssh_key_content', 'jump_host')
+
+
+class _RecordMixin:
+    """Доступ к полям и как к атрибутам, и как к ключам словаря"""
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key not in self._fields:
+                raise KeyError(key)
+            return getattr(self, key)
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        # Только поля записи: getattr вернул бы и методы кортежа (count, index)
+        return getattr(self, key) if key in self._fields else default
+
+    def to_dict(self):
+        return dict(zip(self._fields, self))
+
+
+class ServerSummary(_RecordMixin, namedtuple('ServerSummary', PUBLIC_FIELDS)):
+    """Сервер для публичных страниц и API (без учетных данных)"""
+    __slots__ = ()
+
+
+class SchedulerTarget(_RecordMixin, namedtuple('SchedulerTarget', TARGET_FIELDS)):
+    """Сервер с параметрами подключения для планировщика"""
+    __slots__ = ()
+
+
+def replace_record(records, record_id, **fields):
+    """
+    Кортеж записей (упорядочен по id, как ORDER BY id) с замененными полями
+    одной записи; записи с таким id нет - исходный кортеж.
+    """
+    low, high = 0, len(records)
+    while low < high:
+        middle = (low + high) // 2
+        if records[middle].id < record_id:
+            low = middle + 1
+        else:
+            high = middle
+    if low == len(records) or records[low].id != record_id:
+        return records
+    return records[:low] + (records[low]._replace(**fields),) + records[low + 1:]
+
+
+class InventoryCache:
+    """
+    Кэш списков серверов в памяти процесса. Изменения инвентаря
+    увеличивают version; результат, загруженный до изменения, не сохраняется.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, loader):
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            version = self.version
+        value = loader()
+        with self._lock:
+            if self.version == version:
+                self._entries[key] = value
+        return value
+
+    def patch(self, key, update):
+        """
+        Точечное обновление: значение ключа заменяется на update(value), если
+        оно закэшировано. version растет, поэтому загрузка, начатая до
+        изменения, устаревший результат не сохранит.
+        """
+        with self._lock:
+            self.version += 1
+            if key in self._entries:
+                self._entries[key] = update(self._entries[key])
+
+    def invalidate(self, key=None):
+        """Сброс одного ключа или всего кэша"""
+        with self._lock:
+            self.version += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def get_stats(self):
+        with self._lock:
+            return {'version': self.version, 'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
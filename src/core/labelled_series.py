@@ -0,0 +1,256 @@
+"""
+Ряды с метками: диски по точкам монтирования и сетевые интерфейсы.
+Все ряды лежат в одной "высокой" таблице; пара (метрика, метка)
+кодируется целым id словаря series_keys, поэтому строки и индекс
+не растут от длинных имен точек монтирования и интерфейсов.
+"""
+import threading
+
+from .system_monitor import DEFAULT_EXCLUDED_FSTYPES
+
+# disk_percent - %, disk_used - байты, net_rx / net_tx - байт в секунду
+LABELLED_METRICS = ('disk_percent', 'disk_used', 'net_rx', 'net_tx')
+# Один вызов на хосте: все разделы и счетчики интерфейсов, разделенные маркером
+COLLECT_COMMAND = 'df -P -T -k 2>/dev/null; echo @@; cat /proc/net/dev'
+# Интерфейсы, трафик которых не интересен
+EXCLUDED_INTERFACES = frozenset({'lo'})
+# Виртуальные интерфейсы контейнеров и мостов: появляются и исчезают с каждым
+# контейнером и раздували бы словарь меток
+EXCLUDED_INTERFACE_PREFIXES = ('veth', 'docker', 'br-', 'virbr', 'vnet', 'cni', 'flannel', 'cali', 'tap')
+# Deadband: раздел пишется при изменении занятости больше чем на DISK_THRESHOLD п.п.,
+# интерфейс - при изменении скорости больше чем на NET_THRESHOLD (доля) и NET_FLOOR байт/с
+DISK_THRESHOLD = 0.5
+NET_THRESHOLD = 0.1
+NET_FLOOR = 1024
+
+
+def parse_mounts(output, exclude_fstypes=DEFAULT_EXCLUDED_FSTYPES):
+    """Вывод df -P -T -k -> {точка монтирования: (процент, занято байт, всего байт)}"""
+    mounts = {}
+    for line in output.splitlines()[1:]:
+        fields = line.split()
+        if len(fields) < 7 or fields[1] in exclude_fstypes:
+            continue
+        try:
+            total, used = int(fields[2]) * 1024, int(fields[3]) * 1024
+            percent = float(fields[5].rstrip('%'))
+        except ValueError:
+            continue
+        # Пробелы в пути точки монтирования df не экранирует
+        mounts[' '.join(fields[6:])] = (percent, used, total)
+    return mounts
+
+
+def parse_net_dev(output):
+    """Вывод /proc/net/dev -> {интерфейс: (принято байт, отправлено байт)} - счетчики с загрузки"""
+    interfaces = {}
+    for line in output.splitlines():
+        name, sep, counters = line.partition(':')
+        fields = counters.split()
+        name = name.strip()
+        if not sep or len(fields) < 9 or name in EXCLUDED_INTERFACES \
+                or name.startswith(EXCLUDED_INTERFACE_PREFIXES):
+            continue
+        try:
+            interfaces[name] = (int(fields[0]), int(fields[8]))
+        except ValueError:
+            continue
+    return interfaces
+
+
+def parse_collect_output(output):
+    """Вывод COLLECT_COMMAND -> (разделы, интерфейсы)"""
+    disks, _, network = output.partition('@@')
+    return parse_mounts(disks), parse_net_dev(network)
+
+
+class LabelledSeriesStore:
+    """
+    Замеры (server_id, timestamp, key_id, value); ключ таблицы - сервер и
+    время, поэтому диапазон и последний замер сервера читаются по индексу.
+    Скорости сети считаются по разности счетчиков соседних замеров;
+    сброс счетчика (перезагрузка хоста) пропускает одну точку.
+    С max_gap работает deadband, как для основных метрик: раздел или
+    интерфейс пишется при заметном изменении или раз в max_gap секунд.
+    """
+
+    def __init__(self, max_gap=None):
+        self.max_gap = max_gap   # None - писать каждый замер
+        self._keys = {}          # (metric, label) -> key_id, только зафиксированные в базе
+        self._names = {}         # key_id -> (metric, label)
+        self._counters = {}      # server_id -> (ts, {interface: (rx, tx)})
+        self._written = {}       # server_id -> {(kind, label): (ts, значение для deadband)}
+        self._lock = threading.Lock()
+        self.written = 0
+        self.skipped = 0
+
+    @staticmethod
+    def create_schema(conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS series_keys (
+                id INTEGER PRIMARY KEY,
+                metric TEXT NOT NULL,
+                label TEXT NOT NULL,
+                UNIQUE (metric, label)
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS labelled_samples (
+                server_id INTEGER NOT NULL,
+                timestamp INTEGER NOT NULL,
+                key_id INTEGER NOT NULL,
+                value REAL NOT NULL,
+                PRIMARY KEY (server_id, timestamp, key_id)
+            ) WITHOUT ROWID
+        ''')
+
+    def _load_keys(self, conn):
+        """Словарь из базы; запрос - без self._lock, в памяти обновляется под ним"""
+        rows = conn.execute('SELECT id, metric, label FROM series_keys').fetchall()
+        with self._lock:
+            for key_id, metric, label in rows:
+                self._keys[(metric, label)] = key_id
+                self._names[key_id] = (metric, label)
+
+    def _key_id(self, conn, metric, label, created):
+        """
+        id пары из словаря. Новые пары попадают в created и кэшируются только
+        после commit (remember_keys): при откате транзакции их id не существует.
+        Запросы к базе идут без self._lock: соединение может держать блокировку
+        записи SQLite, и ожидание ее под self._lock остановило бы другие потоки.
+        """
+        key = (metric, label)
+        with self._lock:
+            key_id = self._keys.get(key)
+        if key_id is None:
+            conn.execute('INSERT OR IGNORE INTO series_keys (metric, label) VALUES (?, ?)', key)
+            key_id = conn.execute('SELECT id FROM series_keys WHERE metric = ? AND label = ?', key).fetchone()[0]
+            created.append((key_id, key))
+        return key_id
+
+    def remember_keys(self, created):
+        """Кэширование пар, добавленных в словарь зафиксированной транзакцией"""
+        with self._lock:
+            for key_id, key in created:
+                self._keys[key] = key_id
+                self._names[key_id] = key
+
+    def _changed(self, written, ts, kind, label, value, threshold):
+        """Deadband по одной метке; при положительном ответе значение запоминается как записанное"""
+        last = written.get((kind, label))
+        if self.max_gap is not None and last is not None and ts - last[0] < self.max_gap \
+                and all(abs(v - prev) <= threshold(prev) for v, prev in zip(value, last[1])):
+            self.skipped += 1
+            return False
+        written[(kind, label)] = (ts, value)
+        return True
+
+    def samples(self, server_id, ts, mounts, interfaces):
+        """
+        Значения замера для записи [(metric, label, value)] после deadband и новое
+        состояние deadband сервера; скорости - только при предыдущем замере.
+        Состояние передается в remember_written после commit: при откате
+        значения не должны считаться записанными.
+        """
+        values = []
+        with self._lock:
+            # Метки, которых нет в замере (отмонтированные разделы, удаленные интерфейсы), забываются
+            written = {
+                (kind, label): last for (kind, label), last in self._written.get(server_id, {}).items()
+                if label in (mounts if kind == 'disk' else interfaces)}
+            for mountpoint, (percent, used, _) in mounts.items():
+                if self._changed(written, ts, 'disk', mountpoint, (percent,), lambda prev: DISK_THRESHOLD):
+                    values.append(('disk_percent', mountpoint, percent))
+                    values.append(('disk_used', mountpoint, used))
+            previous = self._counters.get(server_id)
+            self._counters[server_id] = (ts, interfaces)
+            if previous and ts > previous[0]:
+                elapsed = ts - previous[0]
+                for name, (rx, tx) in interfaces.items():
+                    before = previous[1].get(name)
+                    if before is None or rx < before[0] or tx < before[1]:
+                        continue
+                    rates = ((rx - before[0]) / elapsed, (tx - before[1]) / elapsed)
+                    if self._changed(written, ts, 'net', name, rates,
+                                     lambda prev: max(abs(prev) * NET_THRESHOLD, NET_FLOOR)):
+                        values.append(('net_rx', name, rates[0]))
+                        values.append(('net_tx', name, rates[1]))
+        return values, written
+
+    def remember_written(self, server_id, ts, written):
+        """Состояние deadband из samples() замера ts после commit"""
+        with self._lock:
+            self._written[server_id] = written
+            self.written += sum(1 for last in written.values() if last[0] == ts)
+
+    def write(self, conn, server_id, ts, values):
+        """
+        Запись значений из samples() в открытую транзакцию. Возвращает новые
+        пары словаря: после commit их нужно передать в remember_keys.
+        """
+        with self._lock:
+            loaded = bool(self._keys)
+        if not loaded:
+            self._load_keys(conn)
+        created = []
+        rows = [(server_id, ts, self._key_id(conn, metric, label, created), value)
+                for metric, label, value in values]
+        conn.executemany('INSERT OR REPLACE INTO labelled_samples (server_id, timestamp, key_id, value) '
+                         'VALUES (?, ?, ?, ?)', rows)
+        return created
+
+    def _decode(self, conn, rows):
+        """Строки (key_id, timestamp, value) -> {metric: {label: [[ts, value], ...]}}"""
+        with self._lock:
+            missing = any(key_id not in self._names for key_id, _, _ in rows)
+        if missing:
+            self._load_keys(conn)
+        result = {}
+        with self._lock:
+            names = self._names
+            for key_id, ts, value in rows:
+                metric, label = names[key_id]
+                result.setdefault(metric, {}).setdefault(label, []).append([ts, value])
+        return result
+
+    def read_range(self, conn, server_id, start, end, metric=None):
+        """Ряды сервера за [start, end]; metric - только одна метрика"""
+        rows = conn.execute('''
+            SELECT key_id, timestamp, value FROM labelled_samples
+            WHERE server_id = ? AND timestamp BETWEEN ? AND ?
+            ORDER BY timestamp
+        ''', (server_id, start, end)).fetchall()
+        series = self._decode(conn, rows)
+        return {metric: series.get(metric, {})} if metric else series
+
+    def read_latest(self, conn, server_id):
+        """
+        Последнее значение каждой метки сервера: {metric: {label: value}} и время
+        самого свежего замера (None - замеров нет). С deadband метки пишутся в
+        разное время, но каждая присутствующая - не реже раза в max_gap, поэтому
+        хватает окна max_gap перед последним замером; исчезнувшие метки в него не попадут.
+        """
+        # SQLite берет value из строки с MAX(timestamp) в группе
+        rows = conn.execute('''
+            SELECT key_id, MAX(timestamp), value FROM labelled_samples
+            WHERE server_id = ? AND timestamp >= (
+                SELECT MAX(timestamp) FROM labelled_samples WHERE server_id = ?
+            ) - ?
+            GROUP BY key_id
+        ''', (server_id, server_id, self.max_gap or 0)).fetchall()
+        latest = {metric: {label: points[-1][1] for label, points in labels.items()}
+                  for metric, labels in self._decode(conn, rows).items()}
+        return latest, max((ts for _, ts, _ in rows), default=None)
+
+    def delete_server(self, conn, server_id):
+        conn.execute('DELETE FROM labelled_samples WHERE server_id = ?', (server_id,))
+        with self._lock:
+            self._counters.pop(server_id, None)
+            self._written.pop(server_id, None)
+
+    def get_stats(self):
+        with self._lock:
+            return {'keys': len(self._keys), 'max_gap': self.max_gap, 'written': self.written, 'skipped': self.skipped}
+
+    def cleanup(self, conn, cutoff):
+        conn.execute('DELETE FROM labelled_samples WHERE timestamp < ?', (cutoff,))
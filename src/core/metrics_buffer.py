@@ -0,0 +1,167 @@
+"""
+Кольцевые буферы последних метрик серверов в памяти.
+"""
+import threading
+from array import array
+from datetime import datetime, timezone
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def format_timestamp(ts):
+    """Unix-время в формате CURRENT_TIMESTAMP SQLite (UTC)"""
+    return datetime.fromtimestamp(ts, timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+def parse_timestamp(value):
+    """Строка CURRENT_TIMESTAMP SQLite (UTC) в Unix-время"""
+    return int(datetime.strptime(value[:19], TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc).timestamp())
+
+
+class MetricsRingBuffer:
+    """Фиксированный буфер последних capacity замеров одного сервера"""
+
+    __slots__ = ('capacity', 'ids', 'timestamps', 'cpu', 'memory', 'disk', 'head', 'size', 'complete')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.ids = array('q', bytes(8 * capacity))
+        self.timestamps = array('q', bytes(8 * capacity))
+        self.cpu = array('d', bytes(8 * capacity))
+        self.memory = array('d', bytes(8 * capacity))
+        self.disk = array('d', bytes(8 * capacity))
+        self.head = 0       # индекс следующей записи
+        self.size = 0
+        self.complete = False  # буфер содержит всю историю сервера
+
+    def append(self, row_id, ts, cpu, memory, disk):
+        i = self.head
+        self.ids[i] = row_id or 0
+        self.timestamps[i] = ts
+        self.cpu[i] = cpu
+        self.memory[i] = memory
+        self.disk[i] = disk
+        self.head = (i + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.complete = False
+
+    def samples(self):
+        """Все замеры буфера по возрастанию времени: (id, ts, cpu, memory, disk)"""
+        start = (self.head - self.size) % self.capacity
+        indexes = [(start + k) % self.capacity for k in range(self.size)]
+        return [(self.ids[i], self.timestamps[i], self.cpu[i], self.memory[i], self.disk[i]) for i in indexes]
+
+    def can_serve(self, limit):
+        return self.complete or limit <= self.size
+
+    def latest(self, server_id, limit):
+        """Последние limit замеров, от новых к старым, в формате строк таблицы metrics"""
+        rows = []
+        i = self.head
+        for _ in range(min(limit, self.size)):
+            i = (i - 1) % self.capacity
+            rows.append({
+                'id': self.ids[i] or None,
+                'server_id': server_id,
+                'cpu_percent': self.cpu[i],
+                'memory_percent': self.memory[i],
+                'disk_percent': self.disk[i],
+                'timestamp': format_timestamp(self.timestamps[i])
+            })
+        return rows
+
+
+class RecentMetricsStore:
+    """Набор кольцевых буферов по серверам; память ограничена capacity на сервер"""
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self._buffers = {}
+        self._warmed = set()
+        self._lock = threading.Lock()
+
+    def append(self, server_id, row_id, ts, cpu, memory, disk):
+        with self._lock:
+            buffer = self._buffers.get(server_id)
+            if buffer is None:
+                buffer = self._buffers[server_id] = MetricsRingBuffer(self.capacity)
+            buffer.append(row_id, ts, cpu, memory, disk)
+
+    def get_latest(self, server_id, limit, loader, known=True):
+        """
+        Последние limit замеров из памяти. При первом обращении буфер
+        прогревается из базы через loader(capacity); None - запрос больше буфера.
+        known=False - сервера нет в инвентаре: без принятых замеров буфер не
+        заводится, строки loader(limit) отдаются без кэширования.
+        """
+        if limit > self.capacity:
+            return None
+        with self._lock:
+            warmed = server_id in self._warmed
+            if not warmed and not known and server_id not in self._buffers:
+                warmed = None
+        if warmed is None:
+            return loader(limit)
+        if not warmed:
+            # Запрос к базе - без блокировки: прием замеров в это время не ждет
+            self._warm(server_id, loader(self.capacity))
+        with self._lock:
+            buffer = self._buffers.get(server_id)
+            if buffer is None or not buffer.can_serve(limit):
+                return None
+            return buffer.latest(server_id, limit)
+
+    def _warm(self, server_id, rows):
+        """Буфер из строк базы и замеров, принятых в памяти до и во время чтения"""
+        with self._lock:
+            if server_id in self._warmed:
+                return
+            # Замеры, накопленные в памяти до прогрева, полнее базы (deadband) - сохраняем их
+            pending = self._buffers[server_id].samples() if server_id in self._buffers else []
+            cutoff = pending[0][1] if pending else None
+            pending_ids = {sample[0] for sample in pending if sample[0]}
+            buffer = MetricsRingBuffer(self.capacity)
+            for row in reversed(rows):
+                ts = parse_timestamp(row['timestamp'])
+                if row['id']:
+                    duplicate = row['id'] in pending_ids or (cutoff is not None and ts > cutoff)
+                else:
+                    duplicate = cutoff is not None and ts >= cutoff
+                if not duplicate:
+                    buffer.append(row['id'], ts, row['cpu_percent'] or 0,
+                                  row['memory_percent'] or 0, row['disk_percent'] or 0)
+            buffer.complete = len(rows) < self.capacity
+            for sample in pending:
+                buffer.append(*sample)
+            self._buffers[server_id] = buffer
+            self._warmed.add(server_id)
+
+    def latest_samples(self):
+        """Последний замер каждого сервера: {server_id: (ts, cpu, memory, disk)}"""
+        with self._lock:
+            latest = {}
+            for server_id, buffer in self._buffers.items():
+                if buffer.size:
+                    i = (buffer.head - 1) % buffer.capacity
+                    latest[server_id] = (buffer.timestamps[i], buffer.cpu[i], buffer.memory[i], buffer.disk[i])
+            return latest
+
+    def drop(self, server_id):
+        with self._lock:
+            self._buffers.pop(server_id, None)
+            self._warmed.discard(server_id)
+
+    def clear(self):
+        with self._lock:
+            self._buffers.clear()
+            self._warmed.clear()
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'servers': len(self._buffers),
+                'capacity': self.capacity,
+                'bytes': len(self._buffers) * self.capacity * 8 * 5
+            }
@@ -4,16 +4,60 @@
 import threading
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from .adaptive import AdaptiveSampler
+from .alerts import AlertEngine
+from .anomaly import FleetAnomalyDetector, peer_group
+from .instrumentation import telemetry
+from .profiling import profiler
+
+# Доля интервала для первой проверки хоста без сохраненного расписания (золотое сечение)
+SPREAD_FACTOR = 0.6180339887
+
+
+class _HostState:
+    __slots__ = ('next_due', 'failures', 'last_check', 'interval', 'desired', 'volatility', 'last_values')
+
+    def __init__(self, next_due, failures=0, last_check=None, interval=None):
+        self.next_due = next_due
+        self.failures = failures
+        self.last_check = last_check
+        # Собственный интервал хоста (адаптивный опрос); None - общий интервал
+        self.interval = interval
+        self.desired = interval
+        self.volatility = 0.0
+        self.last_values = None
+
+
 class MonitorScheduler:
-    def __init__(self, db_manager, ssh_monitor):
+    def __init__(self, db_manager, ssh_monitor, max_workers=16, backups=None, interval=60, adaptive=None):
         self.db_manager = db_manager
         self.ssh_monitor = ssh_monitor
+        # BackupManager: плановые копии базы в отдельном потоке (None - без копий)
+        self.backups = backups
         self.logger = logging.getLogger('scheduler')
         self.running = False
         self.thread = None
-        self.interval = 60  # Интервал по умолчанию 60 секунд (1 минута)
+        # Интервал, измененный через админку, переживает перезапуск
+        self.interval = int(db_manager.get_scheduler_setting('interval', interval))
+        # Недоступные хосты проверяются все реже: interval * 2^(ошибок-1), но не реже max_backoff
+        self.max_backoff = 3600
+        # AdaptiveSampler: интервал каждого хоста в границах от общего (None - без адаптации)
+        self.adaptive = adaptive or AdaptiveSampler(enabled=False)
+        # Расписание по хостам; восстанавливается из базы со сдвигом в ту же фазу
+        self._hosts = {}
+        self._restore_schedule(time.time())
+        # Параллельные проверки; темп новых подключений ограничивает ssh_monitor.limiter
+        self.max_workers = max_workers
+        # Правила оповещений оцениваются по каждому новому замеру
+        self.alerts = AlertEngine(db_manager.get_alert_rules())
+        # Поиск аномалий по всему парку - не чаще раза в anomaly_interval секунд
+        self.anomalies = FleetAnomalyDetector(max_fill=db_manager.deadband.max_gap if db_manager.deadband else 0)
+        self.anomaly_interval = 300
+        self._last_anomaly_run = 0
+        self.anomaly_stats = {}
         
     def start(self, interval=None):  # None означает использовать текущий интервал
         """Запуск планировщика"""
@@ -24,7 +68,7 @@ class MonitorScheduler:
                 
             # Обновляем интервал только если передан новый
             if interval is not None:
-                self.interval = interval
+                self.set_interval(interval)
                 
             self.running = True
             self.thread = threading.Thread(target=self._monitor_loop, daemon=True)
@@ -45,73 +89,271 @@ class MonitorScheduler:
             self.running = False
             if self.thread and self.thread.is_alive():
                 self.thread.join(timeout=5)  # Ждем максимум 5 секунд
+            self.ssh_monitor.close_jump_hosts()
             self.logger.info("Планировщик остановлен")
         except Exception as e:
             self.logger.error(f"Ошибка остановки планировщика: {e}")
             raise
     
     def _monitor_loop(self):
-        """Основной цикл мониторинга"""
+        """Основной цикл мониторинга: проверки хостов по их собственному расписанию"""
         while self.running:
             try:
-                self._check_all_servers()
-                time.sleep(self.interval)
+                self._check_due_servers()
+                if time.time() - self._last_anomaly_run >= self.anomaly_interval:
+                    self.run_anomaly_detection()
+                if self.backups and self.backups.is_due():
+                    self.backups.run_async()
+                # Спим до ближайшей проверки, но не дольше 5 секунд (быстрая реакция на stop)
+                time.sleep(min(max(self._next_wakeup() - time.time(), 1), 5))
             except Exception as e:
                 self.logger.error(f"Ошибка в цикле мониторинга: {e}")
                 time.sleep(60)  # Пауза при ошибке
     
+    def _restore_schedule(self, now):
+        """
+        Расписание из базы. Просроченные за время простоя проверки переносятся
+        на ближайший момент в той же фазе интервала, а не выполняются разом.
+        """
+        for server_id, (next_due, failures, last_check, interval) in self.db_manager.load_scheduler_hosts().items():
+            if not self.adaptive.enabled:
+                interval = None
+            state = _HostState(next_due, failures, last_check, interval)
+            if next_due < now:
+                period = self._period(state)
+                state.next_due += ((now - next_due) // period + 1) * period
+            self._hosts[server_id] = state
+    
+    def _period(self, state):
+        """Пауза до следующей проверки хоста: свой интервал или отсрочка после ошибок"""
+        if state.failures == 0 and state.interval:
+            return state.interval
+        return self._delay(state.failures)
+    
+    def _delay(self, failures):
+        """Пауза до следующей проверки с учетом отсрочки после ошибок"""
+        if failures <= 1:
+            return self.interval
+        return min(self.interval * 2 ** (failures - 1), max(self.max_backoff, self.interval))
+    
+    def _host_state(self, server_id, now):
+        state = self._hosts.get(server_id)
+        if state is None:
+            # Новый хост: первая проверка в своей доле интервала, без общего залпа
+            state = self._hosts[server_id] = _HostState(now + (server_id * SPREAD_FACTOR) % 1 * self.interval)
+        return state
+    
+    def _next_wakeup(self):
+        return min((state.next_due for state in self._hosts.values()), default=time.time() + self.interval)
+    
+    def _check_due_servers(self):
+        """Проверка хостов, чье время подошло"""
+        now = time.time()
+        servers = self._current_targets()
+        if servers is None:
+            return
+        due = [server for server in servers if self._host_state(server['id'], now).next_due <= now]
+        if due:
+            self._run_checks(due)
+    
     def _check_all_servers(self):
-        """Проверка всех серверов"""
+        """Внеочередная проверка всех серверов (расписание сдвигается от текущего момента)"""
+        servers = self._current_targets()
+        if servers:
+            self._run_checks(servers)
+    
+    def _current_targets(self):
         try:
-            servers = self.db_manager.get_all_servers()
-            self.logger.info(f"Проверка {len(servers)} серверов")
-            
-            for server in servers:
-                self._check_server(server)
-                
+            servers = self.db_manager.get_scheduler_targets()
         except Exception as e:
             self.logger.error(f"Ошибка получения списка серверов: {e}")
+            return None
+        ids = {server['id'] for server in servers}
+        self.alerts.retain(ids)
+        self._hosts = {server_id: state for server_id, state in self._hosts.items() if server_id in ids}
+        return servers
+    
+    def _run_checks(self, servers):
+        """Параллельная проверка списка серверов и сохранение их расписания"""
+        self.logger.info(f"Проверка {len(servers)} серверов")
+        workers = max(1, min(self.max_workers, len(servers)))
+        with telemetry.timer('scheduler.sweep'), profiler.unit('sweep'):
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='monitor') as pool:
+                submitted = time.perf_counter()
+                outcomes = list(pool.map(lambda server: self._timed_check(server, submitted), servers))
+            # Агрегаты парка за проход - одной записью на корзину
+            self.db_manager.flush_rollups()
+            self._reschedule(servers, outcomes)
+    
+    def _reschedule(self, servers, outcomes):
+        """Следующая проверка каждого хоста; состояние пишется в базу одной транзакцией"""
+        now = time.time()
+        if self.adaptive.enabled:
+            self._adapt_intervals(servers, outcomes)
+        saved = []
+        for server, (outcome, sample) in zip(servers, outcomes):
+            state = self._host_state(server['id'], now)
+            if outcome == 'throttled':
+                # Очередь подключений переполнена - повтор вскоре, отсрочку не наращиваем
+                state.next_due = now + min(self.interval, 10)
+            else:
+                state.failures = 0 if outcome == 'online' else state.failures + 1
+                state.last_check = int(now)
+                delay = self._period(state)
+                # Успешные проверки держат фазу: от прежнего срока, а не от окончания проверки
+                base = state.next_due if state.failures == 0 and state.next_due + delay > now else now
+                state.next_due = base + delay
+            saved.append((server['id'], state.next_due, state.failures, state.last_check, state.interval, sample))
+        try:
+            self.db_manager.save_scheduler_hosts(saved)
+        except Exception as e:
+            self.logger.error(f"Ошибка сохранения расписания: {e}")
+    
+    def _adapt_intervals(self, servers, outcomes):
+        """
+        Новые интервалы хостов по свежим замерам: быстрее при изменчивых
+        метриках и у порогов правил, медленнее на ровных рядах. Затем все
+        интервалы растягиваются общим множителем, если темп превышает бюджет.
+        """
+        now = time.time()
+        for server, (outcome, sample) in zip(servers, outcomes):
+            if outcome != 'online':
+                continue
+            state = self._host_state(server['id'], now)
+            values = dict(zip(('cpu', 'memory', 'disk'), sample[1:]))
+            state.volatility = self.adaptive.volatility(state.last_values, values, state.volatility)
+            state.last_values = values
+            headroom = self.alerts.headroom(server['id'], values)
+            if self.alerts.is_alerting(server['id']):
+                headroom = -1.0
+            state.desired = self.adaptive.desired(self.interval, state.volatility, headroom,
+                                                  state.desired or self.interval)
+        hosts = self._hosts.values()
+        self.adaptive.apply_budget(self.interval, [state.desired or self.interval for state in hosts])
+        for state in hosts:
+            if state.desired:
+                state.interval = self.adaptive.effective(self.interval, state.desired)
+    
+    def _timed_check(self, server, submitted):
+        """Проверка в пуле с учетом ожидания свободного потока"""
+        telemetry.observe('scheduler.queue_wait', time.perf_counter() - submitted)
+        with telemetry.timer('scheduler.check'), profiler.worker('sweep'):
+            return self._check_server(server)
     
     def _check_server(self, server):
-        """Проверка одного сервера"""
+        """
+        Проверка одного сервера. Возвращает (исход, замер): исход 'online',
+        'offline' или 'throttled', замер - (ts, cpu, memory, disk) или None.
+        """
         try:
-            # Тестируем подключение
-            test_result = self.ssh_monitor.test_connection(
+            # Одна SSH сессия на проверку: ошибки подключения вернутся в metrics
+            metrics = self.ssh_monitor.get_metrics(
                 host=server['ip'],
                 port=server['port'],
-                username=server['username']
+                username=server['username'],
+                password=server.get('password'),
+                ssh_key_path=server.get('ssh_key_path'),
+                ssh_key_content=server.get('ssh_key_content'),
+                jump_host=server.get('jump_host')
             )
             
-            if test_result['success']:
-                # Получаем метрики
-                metrics = self.ssh_monitor.get_metrics(
-                    host=server['ip'],
-                    port=server['port'], 
-                    username=server['username']
-                )
-                
-                if 'error' not in metrics:
-                    status = 'online'
-                    # Проверяем пороги
-                    if metrics.get('cpu', 0) > 90 or metrics.get('memory', 0) > 95:
-                        status = 'warning'
-                    
-                    self.db_manager.update_server_status(server['id'], status, metrics)
-                    self.logger.info(f"Сервер {server['name']}: {status}")
-                else:
-                    self.db_manager.update_server_status(server['id'], 'offline')
-                    self.logger.warning(f"Сервер {server['name']}: offline (ошибка метрик)")
-            else:
+            if metrics.get('throttled'):
+                telemetry.increment('scheduler.result.throttled')
+                # Очередь подключений переполнена - статус не трогаем
+                self.logger.warning(f"Сервер {server['name']}: проверка отложена ({metrics['error']})")
+                return 'throttled', None
+            if 'error' in metrics:
                 self.db_manager.update_server_status(server['id'], 'offline')
-                self.logger.warning(f"Сервер {server['name']}: offline (нет подключения)")
-                
+                telemetry.increment('scheduler.result.offline')
+                self.logger.warning(f"Сервер {server['name']}: offline ({metrics['error']})")
+                return 'offline', None
         except Exception as e:
+            telemetry.increment(f'scheduler.error.{type(e).__name__}')
             self.logger.error(f"Ошибка проверки сервера {server['name']}: {e}")
             self.db_manager.update_server_status(server['id'], 'offline')
+            return 'offline', None
+        
+        # Хост ответил: ошибки правил оповещений и записи не делают его offline
+        now = int(time.time())
+        status = self._evaluate_alerts(server, now, metrics)
+        try:
+            self.db_manager.update_server_status(server['id'], status, metrics)
+        except Exception as e:
+            telemetry.increment(f'scheduler.error.{type(e).__name__}')
+            self.logger.error(f"Ошибка записи замера сервера {server['name']}: {e}")
+        telemetry.increment(f'scheduler.result.{status}')
+        self.logger.info(f"Сервер {server['name']}: {status}")
+        return 'online', (now, metrics.get('cpu', 0), metrics.get('memory', 0), metrics.get('disk', 0))
+    
+    def _evaluate_alerts(self, server, now, metrics):
+        """Правила оповещений по новому замеру; возвращает статус 'warning' или 'online'"""
+        try:
+            events = self.alerts.observe(server['id'], now, metrics)
+            if events:
+                self.db_manager.add_alert_events(events)
+                for event in events:
+                    self.logger.warning(f"Сервер {server['name']}: правило {event['rule_id']} {event['state']} "
+                                        f"(значение {event['value']:.1f})")
+        except Exception as e:
+            telemetry.increment('scheduler.error.alerts')
+            self.logger.error(f"Ошибка оценки правил для сервера {server['name']}: {e}")
+        return 'warning' if self.alerts.is_alerting(server['id']) else 'online'
+    
+    def run_anomaly_detection(self):
+        """
+        Проход поиска аномалий: окно истории всех серверов одной матрицей,
+        результат заменяет таблицу server_anomalies. Возвращает статистику прохода.
+        """
+        self._last_anomaly_run = time.time()
+        if not self.anomalies.available:
+            return {'error': 'NumPy не установлен'}
+        try:
+            started = time.perf_counter()
+            with telemetry.timer('scheduler.anomalies'):
+                servers = self.db_manager.get_public_servers()
+                ids = [server.id for server in servers]
+                groups = {server.id: peer_group(server.name) for server in servers}
+                now = int(time.time())
+                self.anomalies.step = self.interval
+                start = self.anomalies.query_start(now)
+                rows = []
+                # Порциями по 500 id: выборка идет по индексу (server_id, timestamp)
+                for offset in range(0, len(ids), 500):
+                    rows.extend(self.db_manager.iter_metrics(ids[offset:offset + 500], start, now,
+                                                             batch_size=10000, unix_time=True))
+                matrix_ids, matrix = self.anomalies.build_matrix(rows, ids, now)
+                results = self.anomalies.detect(matrix_ids, matrix, [groups[int(i)] for i in matrix_ids])
+                self.db_manager.replace_anomalies(results, now)
+            flagged = sum(result['flagged'] for result in results)
+            self.anomaly_stats = {
+                'servers': len(ids),
+                'samples': len(rows),
+                'flagged': flagged,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+                'detected_at': now
+            }
+            if flagged:
+                self.logger.warning(f"Аномалий: {flagged} по {len(ids)} серверам")
+            return self.anomaly_stats
+        except Exception as e:
+            self.logger.error(f"Ошибка поиска аномалий: {e}")
+            return {'error': str(e)}
+    
+    def reload_alert_rules(self):
+        """Перечитать правила после изменения в базе"""
+        self.alerts.set_rules(self.db_manager.get_alert_rules())
     
     def set_interval(self, interval):
-        """Изменение интервала мониторинга"""
+        """Изменение интервала мониторинга (сохраняется в базе)"""
         self.interval = interval
+        self.db_manager.set_scheduler_setting('interval', interval)
+        # При уменьшении интервала дальние сроки подтягиваются, сохраняя разброс хостов
+        now = time.time()
+        for state in list(self._hosts.values()):
+            # Собственные интервалы считались от прежнего общего - адаптация начинается заново
+            state.interval = state.desired = None
+            if state.failures == 0 and state.next_due > now + interval:
+                state.next_due = now + (state.next_due - now) % interval
         self.logger.info(f"Интервал мониторинга изменен на {interval} секунд")
     
     def get_status(self):
@@ -119,5 +361,32 @@ class MonitorScheduler:
         return {
             'running': self.running,
             'interval': self.interval,
-            'thread_alive': self.thread.is_alive() if self.thread else False
+            'max_workers': self.max_workers,
+            'thread_alive': self.thread.is_alive() if self.thread else False,
+            'ssh_admission': self.ssh_monitor.limiter.get_stats(),
+            'anomalies': self.anomaly_stats,
+            'schedule': self.get_schedule_stats()
+        }
+    
+    def get_schedule_stats(self):
+        """Сводка расписания: хостов, в отсрочке после ошибок, ближайшая проверка, адаптивный опрос"""
+        hosts = list(self._hosts.values())
+        now = time.time()
+        low, high = self.adaptive.bounds(self.interval)
+        intervals = [self._period(state) for state in hosts]
+        return {
+            'hosts': len(hosts),
+            'backing_off': sum(1 for state in hosts if state.failures > 1),
+            'due_now': sum(1 for state in hosts if state.next_due <= now),
+            'next_due_in': round(max(self._next_wakeup() - now, 0), 1) if hosts else None,
+            'adaptive': {
+                'enabled': self.adaptive.enabled,
+                'min_interval': round(low, 1),
+                'max_interval': round(high, 1),
+                'budget_scale': round(self.adaptive.scale, 2),
+                'probes_per_min': round(sum(60.0 / interval for interval in intervals), 1),
+                'budget_per_min': round(len(hosts) * self.adaptive.budget * 60.0 / self.interval, 1),
+                'fast': sum(1 for interval in intervals if interval < self.interval),
+                'slow': sum(1 for interval in intervals if interval > self.interval)
+            }
         }
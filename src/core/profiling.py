@@ -0,0 +1,241 @@
+"""
+Профилирование по запросу: cProfile или сэмплирование стеков
+для следующих N HTTP-запросов либо одного прохода планировщика.
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_TARGETS = ('requests', 'sweep')
+PROFILE_MODES = ('cprofile', 'sampling')
+PROFILE_EXTENSIONS = {'cprofile': '.prof', 'sampling': '.folded'}
+
+
+def _default_directory():
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'profiles')
+
+
+def _frame_stack(frame):
+    """Стек кадра от корня к листу в виде 'функция (файл:строка)'"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class _ProfileSession:
+    """Одна запись профиля: набор единиц (запросов или проход) и накопленные данные"""
+
+    def __init__(self, target, mode, count, interval):
+        self.target = target
+        self.mode = mode
+        self.remaining = count
+        self.interval = interval
+        self.running_units = 0
+        self.started = time.time()
+        self.stats = None           # pstats.Stats для cprofile
+        self.stacks = Counter()     # свернутые стеки для сэмплирования
+        self.threads = Counter()    # thread id -> число вложенных участий
+        self.sampler = None
+
+    def sample_loop(self, stop):
+        own = threading.get_ident()
+        while not stop.is_set():
+            frames = sys._current_frames()
+            for thread_id in list(self.threads):
+                frame = frames.get(thread_id)
+                if frame is not None and thread_id != own:
+                    self.stacks[_frame_stack(frame)] += 1
+            stop.wait(self.interval)
+
+
+class Profiler:
+    """
+    Выключенный профайлер стоит одной проверки атрибута на запрос/проход.
+    Включается arm(); результат сохраняется в каталог профилей файлом
+    .prof (pstats) или .folded (вход для flamegraph.pl / speedscope).
+    """
+
+    def __init__(self, directory=None, keep=20):
+        self.directory = directory or _default_directory()
+        self.keep = keep
+        self._session = None
+        self._lock = threading.Lock()
+        self._stop = None
+        self.last_profile = None
+
+    def arm(self, target='requests', count=1, mode='cprofile', interval=0.005):
+        """Запись профиля для следующих count запросов или одного прохода планировщика"""
+        if target not in PROFILE_TARGETS:
+            raise ValueError(f'Неизвестная цель профилирования: {target}')
+        if mode not in PROFILE_MODES:
+            raise ValueError(f'Неизвестный режим профилирования: {mode}')
+        count = 1 if target == 'sweep' else max(1, int(count))
+        with self._lock:
+            if self._session is not None:
+                raise RuntimeError('Профилирование уже включено')
+            self._session = _ProfileSession(target, mode, count, max(0.001, float(interval)))
+
+    def cancel(self):
+        with self._lock:
+            session = self._session
+            self._session = None
+        if session is not None:
+            self._stop_sampler(session)
+
+    def is_armed(self, target):
+        session = self._session
+        return session is not None and session.target == target
+
+    def begin(self, target):
+        """Начало единицы профилирования; None, если профилирование не нужно"""
+        if not self.is_armed(target):
+            return None
+        with self._lock:
+            session = self._session
+            if session is None or session.target != target or session.remaining <= 0:
+                return None
+            session.remaining -= 1
+            session.running_units += 1
+            if session.mode == 'sampling' and session.sampler is None:
+                self._stop = threading.Event()
+                session.sampler = threading.Thread(target=session.sample_loop, args=(self._stop,),
+                                                   name='profiler', daemon=True)
+                session.sampler.start()
+        return self._join(session)
+
+    def end(self, token):
+        if token is None:
+            return
+        session = token[0]
+        self._leave(token)
+        with self._lock:
+            session.running_units -= 1
+            finished = session.remaining <= 0 and session.running_units == 0 and self._session is session
+            if finished:
+                self._session = None
+        if finished:
+            self._stop_sampler(session)
+            self._save(session)
+
+    @contextmanager
+    def unit(self, target):
+        """Единица профилирования (запрос или проход) вокруг блока кода"""
+        token = self.begin(target)
+        try:
+            yield
+        finally:
+            self.end(token)
+
+    @contextmanager
+    def worker(self, target):
+        """Участие рабочего потока в уже идущей единице (потоки пула планировщика)"""
+        session = self._session
+        if session is None or session.target != target or not session.running_units:
+            yield
+            return
+        token = self._join(session)
+        try:
+            yield
+        finally:
+            self._leave(token)
+
+    def _join(self, session):
+        thread_id = threading.get_ident()
+        if session.mode == 'cprofile':
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Python 3.12+: профайлер один на интерпретатор и уже видит все потоки
+                return session, None
+            return session, profile
+        with self._lock:
+            session.threads[thread_id] += 1
+        return session, thread_id
+
+    def _leave(self, token):
+        session, handle = token
+        if session.mode == 'cprofile':
+            if handle is None:
+                return
+            handle.disable()
+            with self._lock:
+                if session.stats is None:
+                    session.stats = pstats.Stats(handle)
+                else:
+                    session.stats.add(handle)
+            return
+        with self._lock:
+            session.threads[handle] -= 1
+            if session.threads[handle] <= 0:
+                del session.threads[handle]
+
+    def _stop_sampler(self, session):
+        if session.sampler is not None:
+            self._stop.set()
+            session.sampler.join(timeout=5)
+
+    def _save(self, session):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.gmtime(session.started))
+        name = f'{stamp}-{session.target}-{session.mode}{PROFILE_EXTENSIONS[session.mode]}'
+        path = os.path.join(self.directory, name)
+        if session.mode == 'cprofile':
+            if session.stats is None:
+                return
+            session.stats.dump_stats(path)
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, count in session.stacks.most_common():
+                    f.write(f'{stack} {count}\n')
+        self.last_profile = name
+        self._rotate()
+
+    def _rotate(self):
+        for name in self.list_profiles()[self.keep:]:
+            os.remove(os.path.join(self.directory, name['name']))
+
+    def list_profiles(self):
+        """Сохраненные профили, новые первыми"""
+        if not os.path.isdir(self.directory):
+            return []
+        names = sorted((n for n in os.listdir(self.directory)
+                        if n.endswith(tuple(PROFILE_EXTENSIONS.values()))), reverse=True)
+        return [{'name': n, 'size': os.path.getsize(os.path.join(self.directory, n))} for n in names]
+
+    def profile_path(self, name):
+        """Путь к сохраненному профилю или None (защита от выхода из каталога)"""
+        if os.path.basename(name) != name or not name.endswith(tuple(PROFILE_EXTENSIONS.values())):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+    def summary(self, name, limit=30):
+        """Текстовая сводка cProfile-профиля по суммарному времени"""
+        path = self.profile_path(name)
+        if path is None or not name.endswith('.prof'):
+            return None
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+    def get_status(self):
+        session = self._session
+        status = {'armed': session is not None, 'last_profile': self.last_profile}
+        if session is not None:
+            status.update({'target': session.target, 'mode': session.mode,
+                           'remaining': session.remaining, 'running': session.running_units})
+        return status
+
+
+# Общий профайлер процесса
+profiler = Profiler()
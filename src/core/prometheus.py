@@ -0,0 +1,91 @@
+"""
+Экспорт состояния серверов в текстовом формате Prometheus.
+"""
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_GAUGES = (
+    ('monitoring_server_up', 'Сервер доступен по SSH (1) или нет (0)'),
+    ('monitoring_server_status', 'Текущий статус сервера (метка status)'),
+    ('monitoring_server_cpu_percent', 'Загрузка CPU по последнему замеру, %'),
+    ('monitoring_server_memory_percent', 'Использование памяти по последнему замеру, %'),
+    ('monitoring_server_disk_percent', 'Заполненность диска по последнему замеру, %'),
+    ('monitoring_server_last_check_timestamp_seconds', 'Время последней проверки (Unix)'),
+)
+_AGE = ('monitoring_server_last_check_age_seconds', 'Секунд с последней проверки')
+UP_STATUSES = ('online', 'warning')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(server):
+    return f'server_id="{server.id}",name="{_escape(server.name)}",ip="{_escape(server.ip)}"'
+
+
+def _header(name, help_text):
+    return f'# HELP {name} {help_text}\n# TYPE {name} gauge\n'
+
+
+def render_static(servers, latest, last_checks):
+    """
+    Неизменная между проверками часть выдачи и список (метки, время проверки)
+    для возраста, который считается при каждом запросе.
+    servers - ServerSummary, latest - {server_id: (ts, cpu, memory, disk)},
+    last_checks - {server_id: Unix-время проверки}.
+    """
+    series = {name: [] for name, _ in _GAUGES}
+    ages = []
+    for server in servers:
+        labels = _labels(server)
+        series['monitoring_server_up'].append(f'monitoring_server_up{{{labels}}} {int(server.status in UP_STATUSES)}\n')
+        series['monitoring_server_status'].append(
+            f'monitoring_server_status{{{labels},status="{_escape(server.status)}"}} 1\n')
+        sample = latest.get(server.id)
+        if sample:
+            _, cpu, memory, disk = sample
+            series['monitoring_server_cpu_percent'].append(f'monitoring_server_cpu_percent{{{labels}}} {cpu}\n')
+            series['monitoring_server_memory_percent'].append(f'monitoring_server_memory_percent{{{labels}}} {memory}\n')
+            series['monitoring_server_disk_percent'].append(f'monitoring_server_disk_percent{{{labels}}} {disk}\n')
+        checked = last_checks.get(server.id)
+        if checked:
+            series['monitoring_server_last_check_timestamp_seconds'].append(
+                f'monitoring_server_last_check_timestamp_seconds{{{labels}}} {checked}\n')
+            ages.append((labels, checked))
+
+    parts = [_header('monitoring_servers_total', 'Количество серверов в инвентаре'),
+             f'monitoring_servers_total {len(servers)}\n']
+    for name, help_text in _GAUGES:
+        parts.append(_header(name, help_text))
+        parts.extend(series[name])
+    return ''.join(parts), ages
+
+
+def render_ages(ages, now):
+    name, help_text = _AGE
+    return _header(name, help_text) + ''.join(
+        f'{name}{{{labels}}} {max(0, now - checked)}\n' for labels, checked in ages)
+
+
+class ExpositionCache:
+    """Готовая выдача, пересобираемая только при смене ключа (версии данных)"""
+
+    def __init__(self):
+        self._key = None
+        self._static = ''
+        self._ages = []
+        self._lock = threading.Lock()
+        self.renders = 0
+
+    def render(self, key, build):
+        """build() -> (servers, latest, last_checks); вызывается только при новом key"""
+        with self._lock:
+            if key != self._key:
+                self._static, self._ages = render_static(*build())
+                self._key = key
+                self.renders += 1
+            static, ages = self._static, self._ages
+        return static + render_ages(ages, int(time.time()))
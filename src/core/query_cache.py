@@ -0,0 +1,76 @@
+"""
+LRU-кэш результатов запросов истории, привязанный к водяному знаку приема данных.
+"""
+import threading
+from collections import OrderedDict
+
+
+class QueryCache:
+    """
+    Результаты запросов по ключу (server_id, форма запроса).
+    Каждая запись помнит водяной знак сервера (счетчик принятых замеров)
+    на момент чтения; при новом замере сервера запись больше не выдается.
+    Размер ограничен числом записей и суммарным числом строк.
+    """
+
+    def __init__(self, max_entries=1024, max_rows=200000):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._entries = OrderedDict()  # key -> (watermark, value, rows)
+        self._rows = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.max_rows > 0
+
+    def get(self, key, watermark):
+        """(True, значение) для актуальной записи, иначе (False, None)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == watermark:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, entry[1]
+                self._remove(key)
+                self.stale += 1
+            self.misses += 1
+            return False, None
+
+    def put(self, key, watermark, value):
+        rows = max(len(value), 1)
+        if not self.enabled or rows > self.max_rows:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (watermark, value, rows)
+            self._rows += rows
+            while len(self._entries) > self.max_entries or self._rows > self.max_rows:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        self._rows -= self._entries.pop(key)[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._rows = 0
+
+    def get_stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'rows': self._rows,
+                'max_entries': self.max_entries,
+                'max_rows': self.max_rows,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'hit_rate': round(self.hits / total, 3) if total else None
+            }
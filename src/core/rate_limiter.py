@@ -0,0 +1,162 @@
+"""
+Ограничение частоты SSH подключений и контроль допуска.
+"""
+import ipaddress
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from .instrumentation import telemetry
+
+
+class AdmissionTimeout(Exception):
+    """Превышено время ожидания в очереди на подключение"""
+
+
+class TokenBucket:
+    """Токен-бакет: rate токенов в секунду, не более burst в запасе"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def wait_time(self, now):
+        """Сколько секунд ждать до появления целого токена"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class ConnectionLimiter:
+    """
+    Допуск новых SSH сессий: общий токен-бакет на рукопожатия,
+    необязательный бакет на подсеть и ограничение одновременных сессий.
+    """
+
+    def __init__(self, connect_rate=20.0, connect_burst=None, subnet_rate=None,
+                 subnet_burst=None, subnet_prefix=24, max_sessions=32, max_queue_wait=30.0):
+        self.connect_bucket = TokenBucket(connect_rate, connect_burst) if connect_rate else None
+        self.subnet_rate = subnet_rate
+        self.subnet_burst = subnet_burst
+        self.subnet_prefix = subnet_prefix
+        self.subnet_buckets = {}
+        self.max_sessions = max_sessions
+        self.max_queue_wait = max_queue_wait
+
+        self._lock = threading.Lock()
+        self._sessions = threading.BoundedSemaphore(max_sessions) if max_sessions else None
+        self._active = 0
+        self._peak = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._handshakes = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._recent_waits = deque(maxlen=512)
+
+    def _subnet_key(self, host):
+        """Ключ подсети; для имен хостов ключом служит само имя"""
+        try:
+            prefix = self.subnet_prefix if ipaddress.ip_address(host).version == 4 else 64
+            return str(ipaddress.ip_network(f'{host}/{prefix}', strict=False))
+        except ValueError:
+            return host
+
+    def _subnet_bucket(self, host):
+        if not self.subnet_rate:
+            return None
+        key = self._subnet_key(host)
+        bucket = self.subnet_buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.subnet_rate, self.subnet_burst)
+            self.subnet_buckets[key] = bucket
+        return bucket
+
+    def _record_wait(self, waited):
+        telemetry.observe('ssh.queue_wait', waited)
+        with self._lock:
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            self._recent_waits.append(waited)
+
+    def _reject(self):
+        with self._lock:
+            self._rejected += 1
+
+    def acquire_handshake(self, host, deadline=None):
+        """Ожидание токена на новое рукопожатие (общего и подсети)"""
+        if deadline is None:
+            deadline = time.monotonic() + self.max_queue_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                buckets = [b for b in (self.connect_bucket, self._subnet_bucket(host)) if b]
+                wait = max([b.wait_time(now) for b in buckets] or [0.0])
+                if wait == 0:
+                    for bucket in buckets:
+                        bucket.take()
+                    self._handshakes += 1
+                    return
+            if now + wait > deadline:
+                self._reject()
+                raise AdmissionTimeout(f'Нет свободного слота на подключение к {host}')
+            time.sleep(wait)
+
+    @contextmanager
+    def session(self, host):
+        """Слот одновременной сессии и токен на рукопожатие"""
+        started = time.monotonic()
+        deadline = started + self.max_queue_wait
+        if self._sessions and not self._sessions.acquire(timeout=self.max_queue_wait):
+            self._reject()
+            raise AdmissionTimeout(f'Превышен лимит одновременных SSH сессий ({self.max_sessions})')
+        try:
+            self.acquire_handshake(host, deadline)
+        except AdmissionTimeout:
+            if self._sessions:
+                self._sessions.release()
+            raise
+
+        self._record_wait(time.monotonic() - started)
+        with self._lock:
+            self._admitted += 1
+            self._active += 1
+            self._peak = max(self._peak, self._active)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+            if self._sessions:
+                self._sessions.release()
+
+    def get_stats(self):
+        """Статистика допуска и времени ожидания в очереди"""
+        with self._lock:
+            waits = sorted(self._recent_waits)
+            admitted = self._admitted
+            return {
+                'active_sessions': self._active,
+                'peak_sessions': self._peak,
+                'max_sessions': self.max_sessions,
+                'admitted': admitted,
+                'rejected': self._rejected,
+                'handshakes': self._handshakes,
+                'queue_wait_avg': round(self._wait_total / admitted, 4) if admitted else 0.0,
+                'queue_wait_p95': round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 4) if waits else 0.0,
+                'queue_wait_max': round(self._wait_max, 4),
+                'subnets': len(self.subnet_buckets)
+            }
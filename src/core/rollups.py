@@ -0,0 +1,140 @@
+"""
+Агрегаты парка по корзинам времени, материализуемые при приеме замеров.
+Одна строка fleet_rollups на корзину хранит средние всех серверов,
+поэтому тепловая карта парка за сутки - чтение 288 строк при любом числе серверов.
+"""
+import json
+import threading
+from array import array
+
+ROLLUP_METRICS = ('cpu', 'memory', 'disk')
+ROLLUP_PERCENTILES = (50, 90, 99)
+
+
+def percentile(ordered, q):
+    """Перцентиль q (0-100) отсортированного списка, ближайший ранг"""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+def summarize(values):
+    """Сводка по парку за корзину: перцентили, максимум и среднее средних серверов"""
+    ordered = sorted(values)
+    if not ordered:
+        return {}
+    summary = {f'p{q}': round(percentile(ordered, q), 2) for q in ROLLUP_PERCENTILES}
+    summary['max'] = round(ordered[-1], 2)
+    summary['avg'] = round(sum(ordered) / len(ordered), 2)
+    return summary
+
+
+class _Bucket:
+    __slots__ = ('sums', 'loaded', 'dirty')
+
+    def __init__(self):
+        self.sums = {}       # server_id -> [count, cpu, memory, disk]
+        self.loaded = False  # строка из базы уже объединена с накопленным
+        self.dirty = False
+
+
+class FleetRollups:
+    """
+    Накопитель текущих корзин в памяти. Сбрасывается в базу целиком
+    (INSERT OR REPLACE строки корзины) после каждого прохода планировщика.
+    """
+
+    def __init__(self, bucket_seconds=300, open_buckets=2):
+        self.bucket_seconds = bucket_seconds
+        self.open_buckets = open_buckets  # сколько последних корзин принимает опоздавшие замеры
+        self._buckets = {}  # bucket_start -> _Bucket
+        self._lock = threading.Lock()
+        self.late = 0
+
+    def bucket_start(self, ts):
+        return ts - ts % self.bucket_seconds
+
+    def add(self, server_id, ts, values):
+        """Замер (cpu, memory, disk) сервера в корзину по его времени"""
+        start = self.bucket_start(ts)
+        with self._lock:
+            bucket = self._buckets.get(start)
+            if bucket is None:
+                if self._buckets and start < max(self._buckets) - (self.open_buckets - 1) * self.bucket_seconds:
+                    self.late += 1
+                    return
+                bucket = self._buckets[start] = _Bucket()
+            sums = bucket.sums.get(server_id)
+            if sums is None:
+                sums = bucket.sums[server_id] = [0, 0.0, 0.0, 0.0]
+            sums[0] += 1
+            for i, value in enumerate(values, start=1):
+                sums[i] += value or 0.0
+            bucket.dirty = True
+
+    def flush(self, conn):
+        """Запись измененных корзин; закрытые корзины после записи забываются"""
+        with self._lock:
+            if not self._buckets:
+                return 0
+            newest = max(self._buckets)
+            pending = [(start, bucket) for start, bucket in self._buckets.items() if bucket.dirty]
+            for _, bucket in pending:
+                bucket.dirty = False
+            self._buckets = {start: bucket for start, bucket in self._buckets.items()
+                             if start > newest - self.open_buckets * self.bucket_seconds}
+        for start, bucket in pending:
+            with self._lock:
+                if not bucket.loaded:
+                    # Корзина могла быть начата до перезапуска: дополняем сохраненное
+                    row = conn.execute('SELECT servers, counts, cpu, memory, disk FROM fleet_rollups '
+                                       'WHERE bucket_start = ?', (start,)).fetchone()
+                    if row:
+                        self._merge(bucket, *decode_row(row))
+                    bucket.loaded = True
+                row = self._encode(start, bucket)
+            conn.execute('INSERT OR REPLACE INTO fleet_rollups '
+                         '(bucket_start, servers, counts, cpu, memory, disk, summary) '
+                         'VALUES (?, ?, ?, ?, ?, ?, ?)', row)
+        return len(pending)
+
+    @staticmethod
+    def _merge(bucket, ids, counts, averages):
+        for n, server_id in enumerate(ids):
+            sums = bucket.sums.setdefault(server_id, [0, 0.0, 0.0, 0.0])
+            sums[0] += counts[n]
+            for m, column in enumerate(averages, start=1):
+                sums[m] += column[n] * counts[n]
+
+    @staticmethod
+    def _encode(start, bucket):
+        ids = sorted(bucket.sums)
+        counts = array('I', (bucket.sums[i][0] for i in ids))
+        columns = [array('f', (bucket.sums[i][m] / bucket.sums[i][0] for i in ids))
+                   for m in range(1, len(ROLLUP_METRICS) + 1)]
+        summary = {metric: summarize(column) for metric, column in zip(ROLLUP_METRICS, columns)}
+        summary['servers'] = len(ids)
+        return (start, array('i', ids).tobytes(), counts.tobytes(),
+                *(column.tobytes() for column in columns), json.dumps(summary))
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'open_buckets': len(self._buckets),
+                'servers': sum(len(bucket.sums) for bucket in self._buckets.values()),
+                'late': self.late
+            }
+
+
+def decode_row(row):
+    """(servers, counts, cpu, memory, disk) из базы в (ids, counts, [средние по метрикам])"""
+    ids = array('i')
+    ids.frombytes(row[0])
+    counts = array('I')
+    counts.frombytes(row[1])
+    columns = []
+    for blob in row[2:5]:
+        column = array('f')
+        column.frombytes(blob)
+        columns.append(column)
+    return ids, counts, columns
@@ -0,0 +1,194 @@
+"""
+Сжатие временных рядов метрик (в стиле Gorilla).
+
+Время кодируется разностью разностей, значения - XOR с предыдущим
+значением того же ряда. Блок хранит замеры (ts, cpu, memory, disk).
+"""
+import struct
+
+VALUES_PER_SAMPLE = 3
+
+
+def _float_to_bits(value):
+    return struct.unpack('>Q', struct.pack('>d', float(value)))[0]
+
+
+def _bits_to_float(bits):
+    return struct.unpack('>d', struct.pack('>Q', bits))[0]
+
+
+class BitWriter:
+    def __init__(self):
+        self.buf = bytearray()
+        self.acc = 0
+        self.nacc = 0
+
+    def write(self, value, nbits):
+        self.acc = (self.acc << nbits) | (value & ((1 << nbits) - 1))
+        self.nacc += nbits
+        while self.nacc >= 8:
+            self.nacc -= 8
+            self.buf.append((self.acc >> self.nacc) & 0xFF)
+        self.acc &= (1 << self.nacc) - 1
+
+    def getvalue(self):
+        if self.nacc:
+            return bytes(self.buf) + bytes([(self.acc << (8 - self.nacc)) & 0xFF])
+        return bytes(self.buf)
+
+
+class BitReader:
+    def __init__(self, data):
+        # Строка из '0'/'1': срез + int(..., 2) быстрее сдвигов большого числа
+        self.bits = format(int.from_bytes(data, 'big'), f'0{len(data) * 8}b') if data else ''
+        self.pos = 0
+
+    def read(self, nbits):
+        pos = self.pos
+        self.pos = pos + nbits
+        if self.pos > len(self.bits):
+            raise ValueError('Неожиданный конец блока')
+        return int(self.bits[pos:self.pos], 2)
+
+    def read_bit(self):
+        pos = self.pos
+        self.pos = pos + 1
+        return self.bits[pos] == '1'
+
+
+# (префикс, длина префикса, разрядность) для разности разностей времени
+_DOD_BUCKETS = ((0b10, 2, 7), (0b110, 3, 9), (0b1110, 4, 12))
+
+
+def _write_dod(writer, dod):
+    if dod == 0:
+        writer.write(0, 1)
+        return
+    for prefix, prefix_bits, bits in _DOD_BUCKETS:
+        limit = 1 << (bits - 1)
+        if -limit < dod <= limit:
+            writer.write(prefix, prefix_bits)
+            writer.write(dod + limit - 1, bits)
+            return
+    writer.write(0b1111, 4)
+    writer.write(dod, 64)
+
+
+def _read_dod(reader):
+    if not reader.read_bit():
+        return 0
+    for _, _, bits in _DOD_BUCKETS:
+        if not reader.read_bit():
+            return reader.read(bits) - (1 << (bits - 1)) + 1
+    dod = reader.read(64)
+    return dod - (1 << 64) if dod >= 1 << 63 else dod
+
+
+class _XorState:
+    __slots__ = ('prev', 'leading', 'trailing')
+
+    def __init__(self):
+        self.prev = None
+        self.leading = -1
+        self.trailing = 0
+
+
+def _write_value(writer, state, value):
+    bits = _float_to_bits(value)
+    if state.prev is None:
+        writer.write(bits, 64)
+        state.prev = bits
+        return
+    xor = bits ^ state.prev
+    state.prev = bits
+    if xor == 0:
+        writer.write(0, 1)
+        return
+    writer.write(1, 1)
+    leading = min(64 - xor.bit_length(), 31)
+    trailing = (xor & -xor).bit_length() - 1
+    if state.leading >= 0 and leading >= state.leading and trailing >= state.trailing:
+        # Значащие биты помещаются в предыдущее окно
+        writer.write(0, 1)
+        writer.write(xor >> state.trailing, 64 - state.leading - state.trailing)
+        return
+    meaningful = 64 - leading - trailing
+    writer.write(1, 1)
+    writer.write(leading, 5)
+    writer.write(meaningful & 0x3F, 6)  # 64 кодируется как 0
+    writer.write(xor >> trailing, meaningful)
+    state.leading = leading
+    state.trailing = trailing
+
+
+def _read_value(reader, state):
+    if state.prev is None:
+        state.prev = reader.read(64)
+        return _bits_to_float(state.prev)
+    if not reader.read_bit():
+        return _bits_to_float(state.prev)
+    if reader.read_bit():
+        state.leading = reader.read(5)
+        meaningful = reader.read(6) or 64
+        state.trailing = 64 - state.leading - meaningful
+    meaningful = 64 - state.leading - state.trailing
+    state.prev ^= reader.read(meaningful) << state.trailing
+    return _bits_to_float(state.prev)
+
+
+class BlockEncoder:
+    """
+    Кодировщик блока с состоянием: замер дописывается за O(1), без
+    перекодирования предыдущих. Счетчик замеров хранится отдельно и
+    ставится в заголовок (32 бита, ровно 4 байта) только в getvalue().
+    """
+
+    __slots__ = ('writer', 'states', 'count', 'last_ts', 'delta')
+
+    def __init__(self, samples=()):
+        self.writer = BitWriter()
+        self.states = [_XorState() for _ in range(VALUES_PER_SAMPLE)]
+        self.count = 0
+        self.last_ts = None
+        self.delta = 0
+        for sample in samples:
+            self.append(sample)
+
+    def append(self, sample):
+        """Замер (ts, cpu, memory, disk); время не меньше предыдущего"""
+        ts = int(sample[0])
+        if self.last_ts is None:
+            self.writer.write(ts, 64)
+        else:
+            delta = ts - self.last_ts
+            _write_dod(self.writer, delta - self.delta)
+            self.delta = delta
+        self.last_ts = ts
+        self.count += 1
+        for state, value in zip(self.states, sample[1:]):
+            _write_value(self.writer, state, value)
+
+    def getvalue(self):
+        return struct.pack('>I', self.count) + self.writer.getvalue()
+
+
+def encode_block(samples):
+    """Кодирование списка (ts, cpu, memory, disk) в байты"""
+    return BlockEncoder(samples).getvalue()
+
+
+def decode_block(data):
+    """Декодирование блока в список (ts, cpu, memory, disk)"""
+    reader = BitReader(data)
+    count = reader.read(32)
+    states = [_XorState() for _ in range(VALUES_PER_SAMPLE)]
+    samples = []
+    ts = delta = 0
+    for i in range(count):
+        if i == 0:
+            ts = reader.read(64)
+        else:
+            delta += _read_dod(reader)
+            ts += delta
+        samples.append((ts, *[_read_value(reader, state) for state in states]))
+    return samples
@@ -0,0 +1,121 @@
+"""
+Блочное хранение рядов метрик в SQLite (сжатые BLOB).
+"""
+import threading
+
+from .series_codec import BlockEncoder, encode_block, decode_block
+
+
+class BlockSeriesStore:
+    """
+    Ряды метрик серверов блоками фиксированной длительности.
+    Открытый (текущий) блок держится в памяти состоянием кодировщика: замер
+    дописывается к нему без перекодирования блока, строка блока перезаписывается
+    готовыми байтами.
+    """
+
+    def __init__(self, block_seconds=7200):
+        self.block_seconds = block_seconds
+        self._open = {}  # server_id -> (block_start, BlockEncoder)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def create_schema(conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS metric_blocks (
+                server_id INTEGER NOT NULL,
+                block_start INTEGER NOT NULL,
+                block_end INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (server_id, block_start)
+            ) WITHOUT ROWID
+        ''')
+
+    def _load_block(self, conn, server_id, block_start):
+        row = conn.execute(
+            'SELECT data FROM metric_blocks WHERE server_id = ? AND block_start = ?',
+            (server_id, block_start)).fetchone()
+        return decode_block(row[0]) if row else []
+
+    def append(self, conn, server_id, ts, values):
+        """Добавление замера (ts, cpu, memory, disk) в открытый блок сервера"""
+        block_start = ts - ts % self.block_seconds
+        with self._lock:
+            block = self._open.get(server_id)
+            if block is None or block[0] != block_start:
+                # Новый блок или продолжение блока после перезапуска
+                block = (block_start, BlockEncoder(self._load_block(conn, server_id, block_start)))
+                self._open[server_id] = block
+            encoder = block[1]
+            if encoder.count and ts < encoder.last_ts:
+                # Замер из прошлого (редкость): блок перекодируется по порядку
+                samples = decode_block(encoder.getvalue()) + [(ts, *values)]
+                samples.sort(key=lambda sample: sample[0])
+                encoder = BlockEncoder(samples)
+                self._open[server_id] = (block_start, encoder)
+            else:
+                encoder.append((ts, *values))
+            conn.execute('''
+                INSERT OR REPLACE INTO metric_blocks (server_id, block_start, block_end, count, data)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (server_id, block_start, encoder.last_ts, encoder.count, encoder.getvalue()))
+
+    def write_blocks(self, conn, server_id, samples):
+        """Запись готовой отсортированной серии целыми блоками (импорт/конвертация)"""
+        blocks = {}
+        for sample in samples:
+            blocks.setdefault(sample[0] - sample[0] % self.block_seconds, []).append(sample)
+        conn.executemany('''
+            INSERT OR REPLACE INTO metric_blocks (server_id, block_start, block_end, count, data)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(server_id, start, block[-1][0], len(block), encode_block(block))
+              for start, block in blocks.items()])
+        with self._lock:
+            self._open.pop(server_id, None)
+
+    def read_range(self, conn, server_id, start, end):
+        """Замеры в [start, end] по возрастанию; декодируются только нужные блоки"""
+        cursor = conn.execute('''
+            SELECT data FROM metric_blocks
+            WHERE server_id = ? AND block_start BETWEEN ? AND ? AND block_end >= ?
+            ORDER BY block_start
+        ''', (server_id, start - self.block_seconds + 1, end, start))
+        samples = []
+        for (data,) in cursor:
+            samples.extend(s for s in decode_block(data) if start <= s[0] <= end)
+        return samples
+
+    def read_latest(self, conn, server_id, limit, before=None):
+        """Последние limit замеров (строго раньше before), от новых к старым"""
+        params = [server_id]
+        where = ''
+        if before is not None:
+            where = 'AND block_start <= ?'
+            params.append(before)
+        cursor = conn.execute(f'''
+            SELECT data FROM metric_blocks
+            WHERE server_id = ? {where}
+            ORDER BY block_start DESC
+        ''', params)
+        samples = []
+        for (data,) in cursor:
+            block = decode_block(data)
+            if before is not None:
+                block = [s for s in block if s[0] < before]
+            samples.extend(reversed(block))
+            if len(samples) >= limit:
+                break
+        return samples[:limit]
+
+    def delete_server(self, conn, server_id):
+        conn.execute('DELETE FROM metric_blocks WHERE server_id = ?', (server_id,))
+        with self._lock:
+            self._open.pop(server_id, None)
+
+    def cleanup(self, conn, cutoff):
+        """Удаление блоков, целиком старше cutoff"""
+        conn.execute('DELETE FROM metric_blocks WHERE block_end < ?', (cutoff,))
+        with self._lock:
+            self._open = {sid: block for sid, block in self._open.items()
+                          if block[0] + self.block_seconds > cutoff}
@@ -0,0 +1,106 @@
+"""
+Массовый импорт серверов из CSV/JSON.
+"""
+import csv
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+IMPORT_FIELDS = ('name', 'ip', 'port', 'username', 'password', 'ssh_key_path',
+                 'ssh_key_content', 'jump_host', 'description')
+
+
+class ImportFormatError(ValueError):
+    """Файл импорта не удалось разобрать"""
+
+
+def parse_servers_csv(text):
+    """Строки CSV с заголовком (поля IMPORT_FIELDS) в список словарей"""
+    reader = csv.DictReader(io.StringIO(text.lstrip('\ufeff')))
+    if not reader.fieldnames or 'name' not in reader.fieldnames or 'ip' not in reader.fieldnames:
+        raise ImportFormatError('CSV должен содержать заголовок с колонками name и ip')
+    return [dict(row) for row in reader]
+
+
+def parse_servers_json(text):
+    """JSON: список серверов или объект {"servers": [...]}"""
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise ImportFormatError(f'Некорректный JSON: {e}')
+    if isinstance(data, dict):
+        data = data.get('servers')
+    if not isinstance(data, list) or not all(isinstance(row, dict) for row in data):
+        raise ImportFormatError('JSON должен быть списком объектов серверов')
+    return data
+
+
+def parse_servers(text, fmt):
+    if fmt == 'csv':
+        return parse_servers_csv(text)
+    if fmt == 'json':
+        return parse_servers_json(text)
+    raise ImportFormatError(f'Неизвестный формат: {fmt}')
+
+
+def _clean(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def validate_server_rows(rows, existing=()):
+    """
+    Проверка и нормализация строк импорта.
+    existing - серверы инвентаря (name, ip, port): совпадение имени или
+    адреса с ними тоже считается дубликатом, иначе повторный импорт того
+    же файла молча удвоит серверы.
+    Возвращает (servers, errors); номера строк в ошибках начинаются с 1.
+    """
+    servers = []
+    errors = []
+    seen = {(server['ip'], server['port']) for server in existing}
+    names = {server['name'] for server in existing}
+    for number, row in enumerate(rows, 1):
+        server = {field: _clean(row.get(field)) for field in IMPORT_FIELDS}
+        problems = []
+        if not server['name']:
+            problems.append('не указано имя')
+        if not server['ip']:
+            problems.append('не указан IP/хост')
+        try:
+            server['port'] = int(server['port'] or 22)
+            if not 1 <= server['port'] <= 65535:
+                raise ValueError
+        except ValueError:
+            problems.append(f"некорректный порт: {row.get('port')}")
+        server['username'] = server['username'] or 'root'
+        server['description'] = server['description'] or ''
+
+        key = (server['ip'], server['port'])
+        if not problems and key in seen:
+            problems.append(f'дубликат {server["ip"]}:{server["port"]}')
+        if not problems and server['name'] in names:
+            problems.append(f'дубликат имени {server["name"]}')
+        seen.add(key)
+        names.add(server['name'])
+
+        if problems:
+            errors.append({'row': number, 'name': server['name'], 'error': ', '.join(problems)})
+        else:
+            servers.append(server)
+    return servers, errors
+
+
+def verify_servers(ssh_monitor, servers, max_workers=16):
+    """Параллельная проверка SSH подключения; частоту рукопожатий ограничивает ssh_monitor.limiter"""
+    def check(server):
+        return ssh_monitor.test_connection(
+            server['ip'], server['port'], server['username'], server.get('password'),
+            server.get('ssh_key_path'), server.get('ssh_key_content'), server.get('jump_host'))
+
+    if not servers:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(servers)))) as pool:
+        return list(pool.map(check, servers))
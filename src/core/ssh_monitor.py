@@ -1,22 +1,108 @@
 """
 SSH мониторинг удаленных серверов.
 """
+import importlib.util
 import socket
 import os
 import tempfile
+import threading
+from contextlib import contextmanager
 from io import StringIO
 
-try:
-    import paramiko
-    SSH_AVAILABLE = True
-except ImportError:
-    SSH_AVAILABLE = False
+from .rate_limiter import ConnectionLimiter, AdmissionTimeout
+from .instrumentation import telemetry
+from .labelled_series import COLLECT_COMMAND, parse_collect_output
+
+# paramiko (вместе с cryptography) импортируется при первом подключении, а не при старте
+SSH_AVAILABLE = importlib.util.find_spec('paramiko') is not None
+paramiko = None
+
+
+def _import_paramiko():
+    global paramiko
+    if paramiko is None:
+        import paramiko as module
+        paramiko = module
+    return paramiko
 
 class SSHMonitor:
-    def __init__(self):
+    def __init__(self, limiter=None):
         self.available = SSH_AVAILABLE
+        # Общий ограничитель рукопожатий и одновременных сессий
+        self.limiter = limiter or ConnectionLimiter()
+        # Постоянные подключения к бастионам: (host, port, username) -> SSHClient
+        self._jump_clients = {}
+        self._jump_lock = threading.Lock()
+    
+    @staticmethod
+    def parse_jump_host(jump_host, default_username='root'):
+        """Разбор строки вида [user@]host[:port] в (host, port, username)"""
+        spec = jump_host.strip()
+        username = default_username
+        if '@' in spec:
+            username, spec = spec.rsplit('@', 1)
+        port = 22
+        if spec.startswith('['):
+            # IPv6: [::1]:2222
+            host, _, rest = spec[1:].partition(']')
+            if rest.startswith(':'):
+                port = int(rest[1:])
+        elif spec.count(':') == 1:
+            host, port = spec.split(':')
+            port = int(port)
+        else:
+            host = spec
+        return host, port, username
+    
+    def _get_jump_transport(self, jump_host, default_username, pkey=None):
+        """Общий транспорт до бастиона; переподключается только если он разорван"""
+        key = self.parse_jump_host(jump_host, default_username)
+        with self._jump_lock:
+            client = self._jump_clients.get(key)
+            transport = client.get_transport() if client else None
+            if transport is not None and transport.is_active():
+                return transport
+            if client:
+                client.close()
+            
+            host, port, username = key
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            client.connect(hostname=host, port=port, username=username, pkey=pkey,
+                           timeout=10, allow_agent=True, look_for_keys=True)
+            transport = client.get_transport()
+            transport.set_keepalive(30)
+            self._jump_clients[key] = client
+            return transport
+    
+    def _open_jump_channel(self, jump_host, host, port, username, pkey=None):
+        """Канал direct-tcpip до целевого хоста через бастион"""
+        transport = self._get_jump_transport(jump_host, username, pkey)
+        try:
+            return transport.open_channel('direct-tcpip', (host, port), ('127.0.0.1', 0), timeout=10)
+        except paramiko.ChannelException:
+            # Бастион отказал в канале (цель недоступна) - ошибка этого хоста, общий транспорт цел
+            raise
+        except (paramiko.SSHException, EOFError, OSError):
+            if transport.is_active():
+                raise
+            # Транспорт разорван бастионом между проверками - переподключение и одна повторная попытка
+            transport = self._get_jump_transport(jump_host, username, pkey)
+            return transport.open_channel('direct-tcpip', (host, port), ('127.0.0.1', 0), timeout=10)
+    
+    def close_jump_hosts(self, jump_host=None, default_username='root'):
+        """Закрытие подключений к бастионам (всех или одного)"""
+        with self._jump_lock:
+            if jump_host:
+                keys = [self.parse_jump_host(jump_host, default_username)]
+            else:
+                keys = list(self._jump_clients)
+            for key in keys:
+                client = self._jump_clients.pop(key, None)
+                if client:
+                    client.close()
     
-    def _create_ssh_client(self, host, port=22, username='root', password=None, ssh_key_path=None, ssh_key_content=None):
+    def _create_ssh_client(self, host, port=22, username='root', password=None, ssh_key_path=None, ssh_key_content=None, jump_host=None):
         """Создание SSH клиента с различными методами аутентификации"""
         if not self.available:
             raise Exception('Paramiko не установлен')
@@ -84,30 +170,70 @@ class SSHMonitor:
         elif password:
             connect_kwargs['password'] = password
         
-        # Подключаемся
-        ssh.connect(**connect_kwargs)
+        # TCP подключение отдельно от рукопожатия, чтобы мерить их раздельно;
+        # через бастион сокетом служит канал в общем транспорте
+        with telemetry.timer('ssh.connect'):
+            if jump_host:
+                sock = self._open_jump_channel(jump_host, host, port, username, connect_kwargs.get('pkey'))
+            else:
+                sock = socket.create_connection((host, port), timeout=10)
+                # Без Nagle: короткие пакеты SSH иначе ждут отложенного ACK (~40 мс на команду)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connect_kwargs['sock'] = sock
+        
+        # Подключаемся: рукопожатие и аутентификация
+        try:
+            with telemetry.timer('ssh.auth'):
+                ssh.connect(**connect_kwargs)
+        except Exception:
+            ssh.close()
+            sock.close()
+            raise
         return ssh
     
-    def test_connection(self, host, port=22, username='root', password=None, ssh_key_path=None, ssh_key_content=None):
+    @contextmanager
+    def _session(self, host):
+        """Допуск через ограничитель и учет исходов по классам ошибок"""
+        try:
+            with self.limiter.session(host):
+                yield
+        except Exception as e:
+            telemetry.increment(f'ssh.failure.{type(e).__name__}')
+            raise
+        telemetry.increment('ssh.success')
+    
+    @staticmethod
+    def _run(ssh, command):
+        """Выполнение команды с замером времени; возвращает stdout"""
+        with telemetry.timer('ssh.command'):
+            stdin, stdout, stderr = ssh.exec_command(command)
+            return stdout.read().decode().strip()
+    
+    def test_connection(self, host, port=22, username='root', password=None, ssh_key_path=None, ssh_key_content=None, jump_host=None):
         """Тестирование SSH подключения"""
         if not self.available:
             return {'success': False, 'error': 'Paramiko не установлен'}
+        _import_paramiko()
         
         try:
-            ssh = self._create_ssh_client(host, port, username, password, ssh_key_path, ssh_key_content)
-            
-            # Тестовая команда
-            stdin, stdout, stderr = ssh.exec_command('echo "SSH connection test successful"')
-            result = stdout.read().decode().strip()
-            error = stderr.read().decode().strip()
-            
-            ssh.close()
+            with self._session(host):
+                ssh = self._create_ssh_client(host, port, username, password, ssh_key_path, ssh_key_content, jump_host)
+                try:
+                    # Тестовая команда
+                    with telemetry.timer('ssh.command'):
+                        stdin, stdout, stderr = ssh.exec_command('echo "SSH connection test successful"')
+                        result = stdout.read().decode().strip()
+                        error = stderr.read().decode().strip()
+                finally:
+                    ssh.close()
             
             if result:
                 return {'success': True, 'message': 'SSH подключение успешно', 'test_output': result}
             else:
                 return {'success': False, 'error': f'Ошибка выполнения команды: {error}'}
                 
+        except AdmissionTimeout as e:
+            return {'success': False, 'error': str(e), 'throttled': True}
         except paramiko.AuthenticationException:
             return {'success': False, 'error': 'Ошибка аутентификации - неверные учетные данные'}
         except paramiko.SSHException as e:
@@ -121,66 +247,25 @@ class SSHMonitor:
         except Exception as e:
             return {'success': False, 'error': f'Неожиданная ошибка: {str(e)}'}
     
-    def get_metrics(self, host, port=22, username='root', password=None, ssh_key_path=None, ssh_key_content=None):
+    def get_metrics(self, host, port=22, username='root', password=None, ssh_key_path=None, ssh_key_content=None, jump_host=None):
         """Получение метрик через SSH"""
         if not self.available:
             return {'error': 'Paramiko не установлен'}
+        _import_paramiko()
         
         try:
-            ssh = self._create_ssh_client(host, port, username, password, ssh_key_path, ssh_key_content)
-            
-            metrics = {}
-            
-            # CPU использование
-            try:
-                stdin, stdout, stderr = ssh.exec_command("top -bn1 | grep 'Cpu(s)' | awk '{print $2}' | cut -d'%' -f1")
-                cpu_output = stdout.read().decode().strip()
-                if not cpu_output:
-                    # Альтернативная команда для CPU
-                    stdin, stdout, stderr = ssh.exec_command("grep 'cpu ' /proc/stat | awk '{usage=($2+$4)*100/($2+$3+$4+$5)} END {print usage}'")
-                    cpu_output = stdout.read().decode().strip()
-                
-                metrics['cpu'] = float(cpu_output) if cpu_output else 0
-            except:
-                metrics['cpu'] = 0
-            
-            # Использование памяти
-            try:
-                stdin, stdout, stderr = ssh.exec_command("free | grep Mem | awk '{printf \"%.1f\", $3/$2 * 100.0}'")
-                memory_output = stdout.read().decode().strip()
-                metrics['memory'] = float(memory_output) if memory_output else 0
-            except:
-                metrics['memory'] = 0
-            
-            # Использование диска
-            try:
-                stdin, stdout, stderr = ssh.exec_command("df -h / | awk 'NR==2{print $5}' | cut -d'%' -f1")
-                disk_output = stdout.read().decode().strip()
-                metrics['disk'] = float(disk_output) if disk_output else 0
-            except:
-                metrics['disk'] = 0
-            
-            # Дополнительная информация о системе
-            try:
-                stdin, stdout, stderr = ssh.exec_command("uname -a")
-                system_info = stdout.read().decode().strip()
-                metrics['system_info'] = system_info
-            except:
-                pass
-            
-            # Время работы системы
-            try:
-                stdin, stdout, stderr = ssh.exec_command("uptime")
-                uptime = stdout.read().decode().strip()
-                metrics['uptime'] = uptime
-            except:
-                pass
-            
-            ssh.close()
+            with self._session(host):
+                ssh = self._create_ssh_client(host, port, username, password, ssh_key_path, ssh_key_content, jump_host)
+                try:
+                    metrics = self._collect_metrics(ssh)
+                finally:
+                    ssh.close()
             
             metrics['status'] = 'online'
             return metrics
             
+        except AdmissionTimeout as e:
+            return {'error': str(e), 'status': 'unknown', 'throttled': True}
         except paramiko.AuthenticationException:
             return {'error': 'Ошибка аутентификации', 'status': 'offline'}
         except paramiko.SSHException as e:
@@ -193,3 +278,55 @@ class SSHMonitor:
             return {'error': 'Подключение отклонено', 'status': 'offline'}
         except Exception as e:
             return {'error': f'Ошибка: {str(e)}', 'status': 'offline'}
+
+    def _collect_metrics(self, ssh):
+        """Сбор метрик в открытой SSH сессии"""
+        metrics = {}
+
+        # CPU использование
+        try:
+            cpu_output = self._run(ssh, "top -bn1 | grep 'Cpu(s)' | awk '{print $2}' | cut -d'%' -f1")
+            if not cpu_output:
+                # Альтернативная команда для CPU
+                cpu_output = self._run(ssh, "grep 'cpu ' /proc/stat | awk '{usage=($2+$4)*100/($2+$3+$4+$5)} END {print usage}'")
+
+            metrics['cpu'] = float(cpu_output) if cpu_output else 0
+        except:
+            metrics['cpu'] = 0
+
+        # Использование памяти
+        try:
+            memory_output = self._run(ssh, "free | grep Mem | awk '{printf \"%.1f\", $3/$2 * 100.0}'")
+            metrics['memory'] = float(memory_output) if memory_output else 0
+        except:
+            metrics['memory'] = 0
+
+        # Все разделы и счетчики сетевых интерфейсов одной командой
+        try:
+            metrics['mounts'], metrics['interfaces'] = parse_collect_output(self._run(ssh, COLLECT_COMMAND))
+        except:
+            metrics['mounts'], metrics['interfaces'] = {}, {}
+
+        # Использование диска (корневой раздел)
+        try:
+            if '/' in metrics['mounts']:
+                metrics['disk'] = metrics['mounts']['/'][0]
+            else:
+                disk_output = self._run(ssh, "df -h / | awk 'NR==2{print $5}' | cut -d'%' -f1")
+                metrics['disk'] = float(disk_output) if disk_output else 0
+        except:
+            metrics['disk'] = 0
+
+        # Дополнительная информация о системе
+        try:
+            metrics['system_info'] = self._run(ssh, "uname -a")
+        except:
+            pass
+
+        # Время работы системы
+        try:
+            metrics['uptime'] = self._run(ssh, "uptime")
+        except:
+            pass
+
+        return metrics
@@ -1,25 +1,53 @@
 """
 Мониторинг локальной системы.
 """
+import importlib.util
 import platform
 import socket
 import random
+import threading
+import time
+from concurrent.futures import Future, wait
 from datetime import datetime
 
-try:
-    import psutil
-    PSUTIL_AVAILABLE = True
-except ImportError:
-    PSUTIL_AVAILABLE = False
+# psutil импортируется при первом запросе локальных метрик
+PSUTIL_AVAILABLE = importlib.util.find_spec('psutil') is not None
+psutil = None
+
+
+def _import_psutil():
+    global psutil
+    if psutil is None:
+        import psutil as module
+        psutil = module
+    return psutil
+
+# Псевдо- и служебные файловые системы, не интересные как диски
+DEFAULT_EXCLUDED_FSTYPES = frozenset({
+    'autofs', 'binfmt_misc', 'bpf', 'cgroup', 'cgroup2', 'configfs', 'debugfs', 'devpts',
+    'devtmpfs', 'efivarfs', 'fusectl', 'hugetlbfs', 'mqueue', 'nsfs', 'proc', 'pstore',
+    'ramfs', 'securityfs', 'squashfs', 'sysfs', 'tmpfs', 'tracefs'
+})
+
 
 class SystemMonitor:
-    def __init__(self):
+    def __init__(self, partitions_ttl=300, disk_timeout=1.0, exclude_fstypes=None):
         self.available = PSUTIL_AVAILABLE
+        # Список разделов кэшируется на partitions_ttl секунд
+        self.partitions_ttl = partitions_ttl
+        # Ожидание statvfs всех разделов (идут параллельно); зависший раздел - статус unknown
+        self.disk_timeout = disk_timeout
+        self.exclude_fstypes = frozenset(DEFAULT_EXCLUDED_FSTYPES if exclude_fstypes is None else exclude_fstypes)
+        self._partitions = None
+        self._partitions_loaded = 0
+        self._pending = {}  # mountpoint -> незавершенный вызов disk_usage
+        self._lock = threading.Lock()
     
     def get_all_metrics(self):
         """Получение всех метрик"""
         if not self.available:
             return self._get_mock_metrics()
+        _import_psutil()
         
         return {
             'system': self._get_system_info(),
@@ -67,20 +95,76 @@ class SystemMonitor:
             'percent': round(mem.percent, 1)
         }
     
+    def _get_partitions(self):
+        """Разделы без исключенных типов ФС; перечитываются раз в partitions_ttl секунд"""
+        now = time.monotonic()
+        with self._lock:
+            if self._partitions is not None and now - self._partitions_loaded < self.partitions_ttl:
+                return self._partitions
+        partitions = [partition for partition in psutil.disk_partitions()
+                      if partition.fstype not in self.exclude_fstypes]
+        with self._lock:
+            self._partitions = partitions
+            self._partitions_loaded = now
+        return partitions
+    
+    @staticmethod
+    def _disk_usage_async(mountpoint):
+        """
+        disk_usage (statvfs) в отдельном daemon-потоке: вызов на зависшем NFS/FUSE
+        нельзя прервать, но он не блокирует ни запрос, ни завершение процесса.
+        """
+        future = Future()
+        
+        def run():
+            try:
+                future.set_result(psutil.disk_usage(mountpoint))
+            except BaseException as e:
+                future.set_exception(e)
+        
+        threading.Thread(target=run, name='statvfs', daemon=True).start()
+        return future
+    
     def _get_disk_metrics(self):
+        partitions = self._get_partitions()
+        with self._lock:
+            futures = {}
+            started = []
+            for partition in partitions:
+                # Вызов по разделу, еще висящий с прошлого запроса, не повторяем и не ждем снова
+                future = self._pending.get(partition.mountpoint)
+                if future is None:
+                    future = self._pending[partition.mountpoint] = self._disk_usage_async(partition.mountpoint)
+                    started.append(future)
+                futures[partition.mountpoint] = future
+        wait(started, timeout=self.disk_timeout)
+        
         disks = []
-        for partition in psutil.disk_partitions():
+        for partition in partitions:
+            future = futures[partition.mountpoint]
+            disk = {'device': partition.device, 'mountpoint': partition.mountpoint, 'fstype': partition.fstype}
+            if not future.done():
+                disk.update({'status': 'unknown', 'percent': None, 'total': None, 'used': None})
+                disks.append(disk)
+                continue
+            with self._lock:
+                if self._pending.get(partition.mountpoint) is future:
+                    del self._pending[partition.mountpoint]
             try:
-                usage = psutil.disk_usage(partition.mountpoint)
-                disks.append({
-                    'device': partition.device,
-                    'mountpoint': partition.mountpoint,
-                    'total': round(usage.total / 1024**3, 2),
-                    'used': round(usage.used / 1024**3, 2),
-                    'percent': round((usage.used / usage.total) * 100, 1)
-                })
+                usage = future.result()
             except PermissionError:
                 continue
+            except OSError as e:
+                disk.update({'status': 'unknown', 'percent': None, 'total': None, 'used': None, 'error': str(e)})
+                disks.append(disk)
+                continue
+            disk.update({
+                'status': 'ok',
+                'total': round(usage.total / 1024**3, 2),
+                'used': round(usage.used / 1024**3, 2),
+                'percent': round((usage.used / usage.total) * 100, 1) if usage.total else 0.0
+            })
+            disks.append(disk)
         return disks
     
     def _get_network_metrics(self):
@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+from app import create_app
+
+
+@pytest.fixture
+def app(tmp_path):
+    return create_app({'TESTING': True, 'DATABASE_PATH': str(tmp_path / 'monitoring.db')})
+
+
+def _add_server(db_manager):
+    return db_manager.add_server({'name': 'web1', 'ip': '10.0.0.1', 'port': 22, 'username': 'root',
+                                  'description': ''})
+
+
+def test_heartbeat_updates_last_check(app, monkeypatch):
+    db_manager = app.extensions['monitoring'].db_manager
+    client = app.test_client()
+    server_id = _add_server(db_manager)
+    start = int(time.time())
+    monkeypatch.setattr('core.database.time.time', lambda: start)
+    db_manager.update_server_status(server_id, 'online')
+    first = client.get('/api/servers').get_json()['servers'][0]
+
+    # Тот же статус после status_heartbeat - запись heartbeat без смены версии
+    monkeypatch.setattr('core.database.time.time', lambda: start + db_manager.status_heartbeat)
+    db_manager.update_server_status(server_id, 'online')
+    second = client.get('/api/servers').get_json()['servers'][0]
+
+    assert second['last_check'] > first['last_check']
+    assert second['version'] == first['version']
+    assert second['last_check'] == db_manager.get_server(server_id)['last_check']
+
+
+def test_cached_card_shows_heartbeat_last_check(app, monkeypatch):
+    db_manager = app.extensions['monitoring'].db_manager
+    client = app.test_client()
+    server_id = _add_server(db_manager)
+    start = int(time.time())
+    monkeypatch.setattr('core.database.time.time', lambda: start)
+    db_manager.update_server_status(server_id, 'online')
+    client.get('/servers')
+
+    monkeypatch.setattr('core.database.time.time', lambda: start + db_manager.status_heartbeat)
+    db_manager.update_server_status(server_id, 'online')
+    last_check = db_manager.get_server(server_id)['last_check']
+    assert f'<div class="last-check">{last_check}</div>' in client.get('/servers').get_data(as_text=True)
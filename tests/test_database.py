@@ -0,0 +1,24 @@
+import sqlite3
+
+import pytest
+
+from core.database import DatabaseManager
+from core.deadband import DeadbandFilter
+
+
+def test_failed_write_does_not_advance_deadband(tmp_path):
+    db_manager = DatabaseManager(deadband=DeadbandFilter(), db_path=str(tmp_path / 'monitoring.db'))
+    server_id = db_manager.add_server({'name': 'web1', 'ip': '10.0.0.1', 'port': 22, 'username': 'root',
+                                       'description': ''})
+    metrics = {'cpu': 10.0, 'memory': 20.0, 'disk': 30.0}
+    with sqlite3.connect(db_manager.db_path) as conn:
+        conn.execute('ALTER TABLE metrics RENAME TO metrics_moved')
+    with pytest.raises(sqlite3.OperationalError):
+        db_manager.update_server_status(server_id, 'online', metrics)
+    with sqlite3.connect(db_manager.db_path) as conn:
+        conn.execute('ALTER TABLE metrics_moved RENAME TO metrics')
+
+    # Тот же замер в пределах порога: прошлая запись не состоялась, поэтому он пишется
+    db_manager.update_server_status(server_id, 'online', metrics)
+    with sqlite3.connect(db_manager.db_path) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM metrics').fetchone()[0] == 1
@@ -0,0 +1,72 @@
+import sqlite3
+
+from core.labelled_series import LabelledSeriesStore
+
+
+def _store(max_gap=300):
+    conn = sqlite3.connect(':memory:')
+    store = LabelledSeriesStore(max_gap=max_gap)
+    store.create_schema(conn)
+    return conn, store
+
+
+def _collect(conn, store, server_id, ts, mounts, interfaces):
+    values, written = store.samples(server_id, ts, mounts, interfaces)
+    created = store.write(conn, server_id, ts, values) if values else []
+    conn.commit()
+    store.remember_keys(created)
+    store.remember_written(server_id, ts, written)
+    return values
+
+
+def test_read_latest_keeps_labels_written_at_different_times():
+    conn, store = _store()
+    mounts = {'/': (40.0, 400, 1000), '/var': (10.0, 100, 1000)}
+    _collect(conn, store, 1, 1000, mounts, {'eth0': (0, 0)})
+    _collect(conn, store, 1, 1060, mounts, {'eth0': (60000, 6000)})
+    # Разделы не изменились - deadband пишет только скорость eth0
+    written = _collect(conn, store, 1, 1120, mounts, {'eth0': (600000, 60000)})
+    assert {metric for metric, _, _ in written} == {'net_rx', 'net_tx'}
+
+    latest, ts = store.read_latest(conn, 1)
+    assert ts == 1120
+    assert latest['disk_percent'] == {'/': 40.0, '/var': 10.0}
+    assert latest['disk_used'] == {'/': 400, '/var': 100}
+    assert latest['net_rx'] == {'eth0': 9000.0}
+    assert latest['net_tx'] == {'eth0': 900.0}
+
+
+def test_read_latest_without_samples():
+    conn, store = _store()
+    assert store.read_latest(conn, 1) == ({}, None)
+
+
+def test_container_interfaces_are_not_collected():
+    from core.labelled_series import parse_net_dev
+    output = '\n'.join([
+        'Inter-|   Receive                                                |  Transmit',
+        ' face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed',
+        '    lo: 100 1 0 0 0 0 0 0 100 1 0 0 0 0 0 0',
+        '  eth0: 200 2 0 0 0 0 0 0 300 3 0 0 0 0 0 0',
+        'veth1a2b: 10 1 0 0 0 0 0 0 10 1 0 0 0 0 0 0',
+        'docker0: 10 1 0 0 0 0 0 0 10 1 0 0 0 0 0 0',
+        'br-0f3c: 10 1 0 0 0 0 0 0 10 1 0 0 0 0 0 0',
+    ])
+    assert parse_net_dev(output) == {'eth0': (200, 300)}
+
+
+def test_deadband_state_forgets_missing_labels():
+    conn, store = _store()
+    _collect(conn, store, 1, 1000, {'/': (40.0, 400, 1000), '/mnt/usb': (5.0, 50, 1000)}, {'eth0': (0, 0)})
+    _collect(conn, store, 1, 1060, {'/': (40.0, 400, 1000)}, {'eth0': (0, 0)})
+    assert set(store._written[1]) == {('disk', '/'), ('net', 'eth0')}
+
+
+def test_rolled_back_values_are_written_again():
+    conn, store = _store()
+    mounts = {'/': (40.0, 400, 1000)}
+    values, _ = store.samples(1, 1000, mounts, {})
+    store.write(conn, 1, 1000, values)
+    conn.rollback()
+    # Без remember_written замер не считается записанным
+    assert _collect(conn, store, 1, 1060, mounts, {}) == [('disk_percent', '/', 40.0), ('disk_used', '/', 400)]
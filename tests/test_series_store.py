@@ -0,0 +1,24 @@
+import sqlite3
+
+from core.series_codec import BlockEncoder, decode_block, encode_block
+from core.series_store import BlockSeriesStore
+
+
+def test_incremental_encoder_matches_block_encoding():
+    samples = [(7200 + i * 60 + (i % 3), i * 1.5, 40.0, 55.5 - i * 0.01) for i in range(200)]
+    encoder = BlockEncoder()
+    for sample in samples:
+        encoder.append(sample)
+    assert encoder.getvalue() == encode_block(samples)
+    assert decode_block(encoder.getvalue()) == samples
+
+
+def test_append_keeps_block_sorted_and_resumes_after_restart():
+    conn = sqlite3.connect(':memory:')
+    BlockSeriesStore.create_schema(conn)
+    store = BlockSeriesStore(7200)
+    for ts in (7200, 7260, 7230, 7320):
+        store.append(conn, 1, ts, (1.0, 2.0, 3.0))
+    # Новый экземпляр продолжает блок, записанный до перезапуска
+    BlockSeriesStore(7200).append(conn, 1, 7380, (4.0, 5.0, 6.0))
+    assert [sample[0] for sample in store.read_range(conn, 1, 0, 10 ** 9)] == [7200, 7230, 7260, 7320, 7380]